@@ -0,0 +1,94 @@
+"""
+Checks that the public APIs of the repository packages stay cheap to import.
+
+Every check runs an import statement in a fresh interpreter and fails if the import takes longer than the budget,
+loads one of the heavy frameworks it should not need (e.g. importing the knn API must not import TensorFlow), or
+prints anything while importing. The script exits with status 1 if any check fails, so it can run in CI next to the
+benchmark comparison.
+
+Usage:
+    python benchmarks/check_import_budget.py
+    python benchmarks/check_import_budget.py --budget-ms 300
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["tensorflow", "keras", "pyspark", "xgboost", "sklearn", "nltk", "pandas", "pyarrow", "scipy"]
+
+# Import statement -> top-level modules it must not load
+CHECKS = {
+    "import mathematical_concepts": HEAVY_MODULES + ["numpy"],
+    "import model_concepts": HEAVY_MODULES + ["numpy"],
+    "import model_applications": HEAVY_MODULES + ["numpy"],
+    "import data_processing": HEAVY_MODULES + ["numpy"],
+    "from mathematical_concepts import Metrics": HEAVY_MODULES,
+    "from mathematical_concepts import get_statistics, StatisticsAccumulator": HEAVY_MODULES + ["numpy"],
+    "from mathematical_concepts import CSRMatrix, sparse_matmul": HEAVY_MODULES + ["numpy"],
+    "from model_concepts import KNNIndex, LSHIndex, predict_label": HEAVY_MODULES,
+    "from model_concepts import KMeans, RegressionTree, MultinomialNB, Neuron": HEAVY_MODULES,
+    "from model_applications import MicroBatchingPredictor": HEAVY_MODULES,
+    "from model_concepts import PredictionServer, ModelRegistry": HEAVY_MODULES,
+    "from model_concepts import HyperparameterSearch, RegressionTreeTask": HEAVY_MODULES,
+}
+
+# Runs in the fresh interpreter: times the import and reports what it loaded and printed
+_PROBE = """
+import contextlib, io, json, sys, time
+output = io.StringIO()
+start = time.perf_counter()
+with contextlib.redirect_stdout(output):
+    exec({statement!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "output": output.getvalue(),
+                  "modules": sorted({{name.split(".")[0] for name in sys.modules}})}}))
+"""
+
+
+def probe_import(statement):
+    completed = subprocess.run([sys.executable, "-c", _PROBE.format(statement=statement)], cwd=REPOSITORY_ROOT,
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError("'{}' failed:\n{}".format(statement, completed.stderr))
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def check_imports(budget_ms):
+    failures = []
+    for statement, forbidden in CHECKS.items():
+        result = probe_import(statement)
+        loaded = sorted(set(forbidden) & set(result["modules"]))
+        milliseconds = result["seconds"] * 1000
+        problems = []
+        if milliseconds > budget_ms:
+            problems.append("took {:.0f} ms".format(milliseconds))
+        if loaded:
+            problems.append("imported {}".format(", ".join(loaded)))
+        if result["output"]:
+            problems.append("printed {!r}".format(result["output"][:80]))
+        print("{:<75} {:>8.1f} ms  {}".format(statement, milliseconds, "; ".join(problems) or "ok"))
+        if problems:
+            failures.append(statement)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=500,
+                        help="slowest allowed import, in milliseconds")
+    args = parser.parse_args()
+
+    failures = check_imports(args.budget_ms)
+    if failures:
+        print("{} import check(s) failed".format(len(failures)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
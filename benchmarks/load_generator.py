@@ -0,0 +1,209 @@
+"""
+load_generator.py: Sends concurrent prediction requests to a model_concepts.serving endpoint and reports the
+throughput and the p50/p99 latency seen by the clients.
+
+Without `--port`, the script trains a demo model on the synthetic data of run_benchmarks.py, serves it from a separate
+process (so the clients and the server do not share an interpreter) and sends it requests. `--repeat-fraction` of the
+requests reuse an earlier input, to exercise the result cache. With `--unbatched`, the same model is also served with
+batches of one and no cache, as a baseline for one `predict` call per request.
+
+Usage:
+    python benchmarks/load_generator.py --model regression_tree --requests 20000 --concurrency 64
+    python benchmarks/load_generator.py --model multinomial_nb --max-latency-ms 2 --unbatched
+    python benchmarks/load_generator.py --port 8080 --model forest --inputs inputs.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+
+import numpy as np
+
+from run_benchmarks import (load_module, make_articles_per_tag, make_knn_examples, make_neuron_dataset,
+                            make_well_logs)
+
+
+DEMO_TRAINING_SIZE = 10000
+
+
+def make_demo_model(name, rng):
+    # Returns the model and a pool of inputs to send to it
+    if name == "regression_tree":
+        module = load_module("model_concepts/regression_tree/regression_tree.py")
+        model = module.RegressionTree(make_well_logs(DEMO_TRAINING_SIZE, rng), max_depth=8)
+        inputs = rng.normal(0, 1, (10000, len(model.features))).tolist()
+    elif name == "random_forest":
+        module = load_module("model_concepts/regression_tree/regression_tree.py")
+        model = module.RandomForest(make_well_logs(DEMO_TRAINING_SIZE, rng), n_trees=50, max_depth=8)
+        inputs = rng.normal(0, 1, (10000, len(model.features))).tolist()
+    elif name == "knn_index":
+        module = load_module("model_concepts/knn/knn_classification.py")
+        model = module.KNNIndex(make_knn_examples(DEMO_TRAINING_SIZE, 4, rng))
+        inputs = rng.normal(0, 1, (10000, 4)).tolist()
+    elif name == "multinomial_nb":
+        module = load_module("model_concepts/multinomial_naive_bayes/multinomial_naive_bayes.py")
+        articles_per_tag = make_articles_per_tag(DEMO_TRAINING_SIZE, rng)
+        model = module.MultinomialNB(articles_per_tag)
+        inputs = make_articles_per_tag(3000, rng)["sports"] + make_articles_per_tag(3000, rng)["technology"]
+    elif name == "neuron":
+        module = load_module("model_concepts/neuron/neuron_model.py")
+        model = module.Neuron(make_neuron_dataset(DEMO_TRAINING_SIZE, 3, rng))
+        inputs = rng.normal(0, 1, (10000, 3)).tolist()
+    else:
+        raise ValueError("Unknown demo model '{}', expected one of {}".format(name, ", ".join(DEMO_MODELS)))
+    return model, inputs
+
+
+DEMO_MODELS = ["regression_tree", "random_forest", "knn_index", "multinomial_nb", "neuron"]
+
+
+def run_demo_server(model_name, options, seed, ready):
+    # Runs in a child process: trains the demo model, serves it on a free port and sends the port and inputs back
+    serving = load_module("model_concepts/serving.py")
+    model, inputs = make_demo_model(model_name, np.random.default_rng(seed))
+    registry = serving.ModelRegistry()
+    registry.register_model(model_name, model, **options)
+    server = serving.PredictionServer(registry)
+
+    async def serve():
+        await server.start(port=0)
+        ready.put((server.port, inputs))
+        await server.server.serve_forever()
+
+    asyncio.run(serve())
+
+
+async def send_request(reader, writer, path, body):
+    writer.write("POST {} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n"
+                 .format(path, len(body)).encode("latin-1") + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    content_length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            content_length = int(value)
+    payload = json.loads(await reader.readexactly(content_length))
+    if b" 200 " not in status_line:
+        raise RuntimeError("Request failed: {} {}".format(status_line.decode().strip(), payload))
+    return payload
+
+
+async def generate_load(host, port, model_name, bodies, concurrency):
+    # Every client keeps one connection open and sends its next request as soon as the previous one is answered
+    path = "/models/{}/predict".format(model_name)
+    latencies = []
+    next_request = iter(bodies)
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for body in next_request:
+                started_at = time.perf_counter()
+                await send_request(reader, writer, path, body)
+                latencies.append(time.perf_counter() - started_at)
+        finally:
+            writer.close()
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b"GET /models HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+    response = await reader.read()
+    writer.close()
+    server_stats = json.loads(response.split(b"\r\n\r\n", 1)[1])["models"].get(model_name)
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "server": server_stats,
+    }
+
+
+def make_bodies(inputs, n_requests, repeat_fraction, rng):
+    # A repeat_fraction of the requests reuse one of the inputs sent before them
+    chosen = rng.integers(0, len(inputs), n_requests)
+    repeats = rng.random(n_requests) < repeat_fraction
+    repeats[0] = False
+    for position in np.flatnonzero(repeats):
+        chosen[position] = chosen[rng.integers(0, position)]
+    return [json.dumps({"input": inputs[index]}).encode() for index in chosen.tolist()]
+
+
+def run_against_demo(args, options, label):
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    server = context.Process(target=run_demo_server, args=(args.model, options, args.seed, ready), daemon=True)
+    server.start()
+    try:
+        port, inputs = ready.get(timeout=600)
+        bodies = make_bodies(inputs, args.requests, args.repeat_fraction, np.random.default_rng(args.seed))
+        result = asyncio.run(generate_load("127.0.0.1", port, args.model, bodies, args.concurrency))
+    finally:
+        server.terminate()
+        server.join()
+    report(label, result)
+    return result
+
+
+def report(label, result):
+    server = result["server"] or {}
+    print("{:<10} {:>10.0f} requests/s  p50 {:>7.2f} ms  p99 {:>7.2f} ms  mean batch {:>6}  cache hits {}".format(
+        label, result["requests_per_second"], result["p50_ms"], result["p99_ms"],
+        "-" if server.get("mean_batch_size") is None else "{:.1f}".format(server["mean_batch_size"]),
+        server.get("cache_hits", "-")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="regression_tree",
+                        help="demo model ({}), or the name of a model on the server at --port".format(
+                            ", ".join(DEMO_MODELS)))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None, help="port of a running server, instead of a demo one")
+    parser.add_argument("--inputs", default=None, help="JSON lines file with one input per line, for --port")
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=64, help="number of concurrent connections")
+    parser.add_argument("--repeat-fraction", type=float, default=0.2)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-latency-ms", type=float, default=5)
+    parser.add_argument("--cache-size", type=int, default=10000)
+    parser.add_argument("--unbatched", action="store_true",
+                        help="also measure the demo model with batches of one and no cache")
+    parser.add_argument("--output", default=None, help="JSON file the results are written to")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.port is not None:
+        if args.inputs is None:
+            parser.error("--inputs is required with --port")
+        with open(args.inputs) as inputs_file:
+            inputs = [json.loads(line) for line in inputs_file if line.strip()]
+        bodies = make_bodies(inputs, args.requests, args.repeat_fraction, np.random.default_rng(args.seed))
+        results = {"batched": asyncio.run(generate_load(args.host, args.port, args.model, bodies, args.concurrency))}
+        report("server", results["batched"])
+    else:
+        options = {"max_batch_size": args.max_batch_size, "max_latency_ms": args.max_latency_ms,
+                   "cache_size": args.cache_size}
+        results = {"batched": run_against_demo(args, options, "batched")}
+        if args.unbatched:
+            results["unbatched"] = run_against_demo(
+                args, {"max_batch_size": 1, "max_latency_ms": 0, "cache_size": 0}, "unbatched")
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+run_benchmarks.py: Times and memory-profiles the from-scratch models and math kernels of this repository.
+
+Every benchmark generates synthetic data at each requested scale (number of rows), then measures the best wall-clock
+time over a few repeats and the peak memory allocated during one run (with `tracemalloc`). Data generation is not
+part of the measurement. The results are written to a JSON file, and a previous results file can be passed with
+`--compare` to report the speedup or slowdown of every benchmark and fail on regressions.
+
+Usage:
+    python benchmarks/run_benchmarks.py --scales 1e3 1e4 1e5 --output results.json
+    python benchmarks/run_benchmarks.py --output new.json --compare results.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_module(relative_path):
+    # Import a module of the repository packages from its path, e.g. "model_concepts/knn/knn_classification.py"
+    if REPOSITORY_ROOT not in sys.path:
+        sys.path.insert(0, REPOSITORY_ROOT)
+    return importlib.import_module(os.path.splitext(relative_path)[0].replace("/", "."))
+
+
+# Synthetic data generators
+
+def make_sparse_matrix(module, rows, columns, density, rng):
+    # Evenly spaced columns with a random offset per row, so every row has distinct column indices
+    nnz_per_row = max(1, int(columns * density))
+    offsets = rng.integers(0, columns, rows)[:, None] + np.arange(nnz_per_row) * (columns // nnz_per_row)
+    indices = np.sort(offsets % columns, axis=1)
+    data = rng.integers(1, 10, rows * nnz_per_row)
+    indptr = list(range(0, rows * nnz_per_row + 1, nnz_per_row))
+    return module.CSRMatrix(data.tolist(), indices.ravel().tolist(), indptr, (rows, columns))
+
+
+def make_numbers(size, rng):
+    return rng.normal(100, 15, size).round(2).tolist()
+
+
+def make_user_feature_map(size, num_features, rng):
+    centers = rng.normal(0, 10, (8, num_features))
+    points = centers[rng.integers(0, 8, size)] + rng.normal(0, 1, (size, num_features))
+    return {"uid_{}".format(i): point for i, point in enumerate(points.tolist())}
+
+
+def make_knn_examples(size, num_features, rng):
+    features = rng.normal(0, 1, (size, num_features))
+    labels = (features.sum(axis=1) > 0).astype(int)
+    return {i: {"features": point, "is_intrusive": label}
+            for i, (point, label) in enumerate(zip(features.tolist(), labels.tolist()))}
+
+
+def make_well_logs(size, rng):
+    features = ["porosity", "gamma", "sonic", "density"]
+    values = rng.normal(0, 1, (size, len(features)))
+    bpd = 3 * values[:, 0] - 2 * np.abs(values[:, 1]) + values[:, 2] * values[:, 3] + rng.normal(0, 0.1, size)
+    return [dict(zip(features, row), bpd=label) for row, label in zip(values.tolist(), bpd.tolist())]
+
+
+def make_articles_per_tag(size, rng, vocabulary_size=5000, words_per_article=50):
+    tags = ["sports", "politics", "technology"]
+    words = np.array(["word_{}".format(i) for i in range(vocabulary_size)])
+    articles_per_tag = {tag: [] for tag in tags}
+    for i in range(size):
+        tag_index = i % len(tags)
+        # Every tag favours a different slice of the vocabulary
+        word_ids = (rng.zipf(1.3, words_per_article) + tag_index * vocabulary_size // len(tags)) % vocabulary_size
+        articles_per_tag[tags[tag_index]].append(words[word_ids].tolist())
+    return articles_per_tag
+
+
+def make_neuron_dataset(size, num_features, rng):
+    features = rng.normal(0, 1, (size, num_features))
+    labels = (features @ rng.normal(0, 1, num_features) + rng.normal(0, 0.5, size) > 0).astype(int)
+    return [{"features": row, "label": label} for row, label in zip(features.tolist(), labels.tolist())]
+
+
+# Benchmarks: each one prepares its data for a given size and returns the function to measure
+
+def bench_sparse_matrix_multiplication(size, rng):
+    module = load_module("mathematical_concepts/sparse_matrix_multiplication.py")
+    matrix_a = make_sparse_matrix(module, size, 1000, 0.01, rng)
+    matrix_b = make_sparse_matrix(module, 1000, 1000, 0.01, rng)
+    return lambda: module.sparse_matrix_multiplication(matrix_a, matrix_b, sparse_result=True)
+
+
+def bench_metrics_pairwise(size, rng):
+    module = load_module("mathematical_concepts/distance_metrics.py")
+    metrics = module.Metrics()
+    X_batch = rng.normal(0, 1, (size, 32))
+    Y_batch = rng.normal(0, 1, (100, 32))
+
+    def run():
+        for metric in ("euclidean", "manhattan", "cosine"):
+            metrics.pairwise(X_batch, Y_batch, metric=metric)
+    return run
+
+
+def bench_metrics_jaccard(size, rng):
+    module = load_module("mathematical_concepts/distance_metrics.py")
+    X_batch = rng.integers(0, 200, (size, 10)).tolist()
+    Y_batch = rng.integers(0, 200, (100, 10)).tolist()
+    return lambda: module.Metrics().pairwise(X_batch, Y_batch, metric="jaccard")
+
+
+def bench_get_statistics(size, rng):
+    module = load_module("mathematical_concepts/statistics_calculator.py")
+    numbers = make_numbers(size, rng)
+    return lambda: module.get_statistics(numbers)
+
+
+def bench_statistics_accumulator(size, rng):
+    module = load_module("mathematical_concepts/statistics_calculator.py")
+    numbers = make_numbers(size, rng)
+
+    def run():
+        accumulator = module.StatisticsAccumulator()
+        for start in range(0, len(numbers), 10000):
+            accumulator.update(numbers[start:start + 10000])
+        return accumulator.result()
+    return run
+
+
+def bench_get_k_means(size, rng):
+    module = load_module("model_concepts/k_means/k_means_clustering.py")
+    user_feature_map = make_user_feature_map(size, 8, rng)
+    return lambda: module.get_k_means(user_feature_map, 8, 8)
+
+
+def bench_k_means_many_clusters(size, rng):
+    module = load_module("model_concepts/k_means/k_means_clustering.py")
+    features = rng.normal(0, 1, (size, 8))
+    k = min(1000, size // 10)
+    return lambda: module.KMeans(k, max_iterations=10, init="random", metric="euclidean").fit(features)
+
+
+def bench_predict_label(size, rng):
+    module = load_module("model_concepts/knn/knn_classification.py")
+    examples = make_knn_examples(size, 4, rng)
+    queries = rng.normal(0, 1, (20, 4)).tolist()
+    return lambda: [module.predict_label(examples, query, 5) for query in queries]
+
+
+def bench_knn_index(size, rng):
+    module = load_module("model_concepts/knn/knn_classification.py")
+    examples = make_knn_examples(size, 4, rng)
+    queries = rng.normal(0, 1, (1000, 4)).tolist()
+    return lambda: module.KNNIndex(examples).predict_labels(queries, 5)
+
+
+def bench_regression_tree(size, rng):
+    module = load_module("model_concepts/regression_tree/regression_tree.py")
+    examples = make_well_logs(size, rng)
+    X = np.array([[example[feature] for feature in module.DEFAULT_FEATURES] for example in examples])
+    return lambda: module.RegressionTree(examples, max_depth=8).predict_batch(X)
+
+
+def bench_multinomial_nb(size, rng):
+    module = load_module("model_concepts/multinomial_naive_bayes/multinomial_naive_bayes.py")
+    articles_per_tag = make_articles_per_tag(size, rng)
+    articles = [article for articles in articles_per_tag.values() for article in articles]
+    return lambda: module.MultinomialNB(articles_per_tag).predict_batch(articles)
+
+
+def bench_neuron(size, rng):
+    module = load_module("model_concepts/neuron/neuron_model.py")
+    dataset = make_neuron_dataset(size, 3, rng)
+    return lambda: module.Neuron(dataset)
+
+
+# name -> (benchmark, largest size it is run at)
+BENCHMARKS = {
+    "sparse_matrix_multiplication": (bench_sparse_matrix_multiplication, 10 ** 6),
+    "metrics_pairwise": (bench_metrics_pairwise, 10 ** 7),
+    "metrics_jaccard": (bench_metrics_jaccard, 10 ** 6),
+    "get_statistics": (bench_get_statistics, 10 ** 7),
+    "statistics_accumulator": (bench_statistics_accumulator, 10 ** 7),
+    "get_k_means": (bench_get_k_means, 10 ** 7),
+    "k_means_many_clusters": (bench_k_means_many_clusters, 10 ** 5),
+    "predict_label": (bench_predict_label, 10 ** 6),
+    "knn_index": (bench_knn_index, 10 ** 7),
+    "regression_tree": (bench_regression_tree, 10 ** 7),
+    "multinomial_nb": (bench_multinomial_nb, 10 ** 6),
+    "neuron": (bench_neuron, 10 ** 6),
+}
+
+
+def measure(run, repeats):
+    # Best time over the repeats, and the peak memory allocated by one extra traced run
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak_memory
+
+
+def run_benchmarks(names, scales, repeats=3, seed=42):
+    results = []
+    for name in names:
+        benchmark, max_size = BENCHMARKS[name]
+        for size in scales:
+            if size > max_size:
+                results.append({"name": name, "size": size, "skipped": True})
+                continue
+            run = benchmark(size, np.random.default_rng(seed))
+            seconds, peak_memory = measure(run, repeats)
+            results.append({"name": name, "size": size, "seconds": seconds, "peak_memory_bytes": peak_memory})
+            print("{:<30} {:>10} {:>12.4f} s {:>12.1f} MB".format(name, size, seconds, peak_memory / 2 ** 20))
+    return results
+
+
+def get_metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPOSITORY_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+    }
+
+
+def compare_results(baseline, current, threshold=1.2):
+    # Print the time ratio of every benchmark present in both files, return the ones slower than the threshold
+    baseline_times = {(result["name"], result["size"]): result["seconds"]
+                      for result in baseline["results"] if not result.get("skipped")}
+    regressions = []
+    for result in current["results"]:
+        key = (result["name"], result["size"])
+        if result.get("skipped") or key not in baseline_times:
+            continue
+        ratio = result["seconds"] / baseline_times[key]
+        flag = "REGRESSION" if ratio > threshold else ""
+        print("{:<30} {:>10} {:>8.2f}x {}".format(key[0], key[1], ratio, flag))
+        if ratio > threshold:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", nargs="+", type=float, default=[1e3, 1e4, 1e5],
+                        help="numbers of rows to benchmark at (up to 1e7)")
+    parser.add_argument("--benchmarks", nargs="+", choices=sorted(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="time ratio above which a benchmark counts as a regression")
+    args = parser.parse_args()
+
+    results = {
+        "metadata": get_metadata(),
+        "results": run_benchmarks(args.benchmarks, [int(scale) for scale in args.scales], args.repeats),
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare_results(json.load(baseline_file), results, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+"""
+Data processing pipelines. The TensorFlow image preprocessing pipeline is imported on first access (PEP 562), so
+importing the package does not import TensorFlow.
+"""
+
+from lazy_loading import lazy_module
+
+# Public name -> module it is defined in
+_LAZY_ATTRIBUTES = {
+    "get_image_preprocessing_pipeline": "image_preprocessing_pipeline",
+    "get_image_dataset": "image_preprocessing_pipeline",
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+__getattr__, __dir__ = lazy_module(__name__, _LAZY_ATTRIBUTES)
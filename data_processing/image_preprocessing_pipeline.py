@@ -0,0 +1,64 @@
+"""
+This script defines a TensorFlow Sequential model for image preprocessing.
+The model is designed to be used as a preprocessing pipeline for image data, applying various transformations and augmentations to enhance the training dataset.
+The pipeline includes resizing, rescaling, random flips, rotations, contrast adjustments, cropping, zooming, translation, and brightness modifications.
+The `get_image_preprocessing_pipeline` function returns the built model based on the specified input size and resize dimensions.
+
+The `get_image_dataset` function wraps the pipeline in a streaming `tf.data` input pipeline. It reads sharded
+TFRecord files from local disk (each record holding an encoded "image" and an integer "label"), decodes the images
+in parallel, optionally caches the decoded images, and applies the preprocessing model to whole batches inside
+`map(..., num_parallel_calls=AUTOTUNE)` before prefetching. With `training=False` the files are read in a fixed
+order and the model runs in inference mode, so the random augmentations are skipped and the output is deterministic.
+"""
+
+
+import tensorflow as tf
+from tensorflow.keras import layers
+
+def get_image_preprocessing_pipeline(input_size, resize):
+    model = tf.keras.Sequential([
+        layers.Resizing(height=resize, width=resize),
+        layers.Rescaling(1./255),
+        layers.RandomFlip("horizontal_and_vertical"),
+        layers.RandomRotation(0.1),
+        layers.RandomContrast(0.1),
+        layers.RandomCrop(int(resize*.9), int(resize*.9), 3),
+        layers.RandomZoom(height_factor=0.1, width_factor=0.1),
+        layers.RandomTranslation(height_factor=0.1, width_factor=0.1),
+        layers.RandomBrightness(factor=0.1),
+    ])
+    model.build(input_shape=(input_size, input_size, 3))
+    return model
+
+
+def get_image_dataset(file_pattern, input_size, resize, batch_size=32, training=True,
+                      cache=False, shuffle_buffer_size=1000, seed=None):
+    pipeline = get_image_preprocessing_pipeline(input_size, resize)
+    record_features = {
+        "image": tf.io.FixedLenFeature([], tf.string),
+        "label": tf.io.FixedLenFeature([], tf.int64),
+    }
+
+    def decode(serialized_record):
+        record = tf.io.parse_single_example(serialized_record, record_features)
+        image = tf.io.decode_image(record["image"], channels=3, expand_animations=False)
+        # Images are brought to a common size so they can be batched
+        image = tf.image.resize(image, (input_size, input_size))
+        return image, record["label"]
+
+    def preprocess(images, labels):
+        # Inference mode turns the random layers into no-ops (RandomCrop becomes a center crop)
+        return pipeline(images, training=training), labels
+
+    files = tf.data.Dataset.list_files(file_pattern, shuffle=training, seed=seed)
+    dataset = files.interleave(tf.data.TFRecordDataset, num_parallel_calls=tf.data.AUTOTUNE,
+                               deterministic=not training)
+    dataset = dataset.map(decode, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not training)
+    if cache:
+        # Cache the decoded images (in memory, or in a file when cache is a path) before any random augmentation
+        dataset = dataset.cache(cache if isinstance(cache, str) else "")
+    if training:
+        dataset = dataset.shuffle(shuffle_buffer_size, seed=seed)
+    dataset = dataset.batch(batch_size, drop_remainder=training)
+    dataset = dataset.map(preprocess, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not training)
+    return dataset.prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,26 @@
+"""
+Shared PEP 562 lazy attribute loading for the repository packages.
+
+Each package `__init__` only declares its `_LAZY_ATTRIBUTES` table (public name -> submodule it is defined in) and
+installs the module-level `__getattr__` and `__dir__` returned by `lazy_module`, so importing a package does no work
+and a public name only imports its own submodule the first time it is accessed.
+"""
+
+import importlib
+import sys
+
+
+def lazy_module(name, attributes):
+    # Returns the __getattr__ and __dir__ functions for the package `name`
+    def __getattr__(attribute):
+        if attribute not in attributes:
+            raise AttributeError("module '{}' has no attribute '{}'".format(name, attribute))
+        value = getattr(importlib.import_module("." + attributes[attribute], name), attribute)
+        # Cache the attribute so the next access does not go through __getattr__
+        setattr(sys.modules[name], attribute, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[name])) | set(attributes))
+
+    return __getattr__, __dir__
@@ -0,0 +1,27 @@
+"""
+Mathematical concepts: distance metrics, sparse matrix multiplication, summary statistics and Bayes' theorem.
+
+The public names below are imported from their modules on first access (PEP 562), so importing the package does no
+work and loads nothing beyond the standard library. Each module needs at most NumPy.
+"""
+
+from lazy_loading import lazy_module
+
+# Public name -> module it is defined in
+_LAZY_ATTRIBUTES = {
+    "Metrics": "distance_metrics",
+    "distances_and_similarities": "distance_metrics",
+    "CSRMatrix": "sparse_matrix_multiplication",
+    "CSCMatrix": "sparse_matrix_multiplication",
+    "sparse_matmul": "sparse_matrix_multiplication",
+    "get_statistics": "statistics_calculator",
+    "StatisticsAccumulator": "statistics_calculator",
+    "TDigest": "statistics_calculator",
+    "MisraGries": "statistics_calculator",
+    "predictive_values": "disease_probability",
+    "probability_of_disease": "disease_probability",
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+__getattr__, __dir__ = lazy_module(__name__, _LAZY_ATTRIBUTES)
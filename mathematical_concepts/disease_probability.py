@@ -1,27 +1,51 @@
 """
 
-This Python script includes a function to calculate the probability that an individual has or does not have a disease given the result of a test, 
-taking into account the accuracy of the test and the prevalence of the disease in the population. 
-It uses the concept of Bayes' theorem, considering the test's sensitivity and specificity (assumed to be equal to the given accuracy). 
+This Python script includes a function to calculate the probability that an individual has or does not have a disease given the result of a test,
+taking into account the accuracy of the test and the prevalence of the disease in the population.
+It uses the concept of Bayes' theorem, considering the test's sensitivity and specificity (assumed to be equal to the given accuracy).
+
+The `predictive_values` function computes the same quantities for whole arrays of sensitivities, specificities and
+prevalences at once. The three inputs are broadcast against each other with NumPy, so a grid of parameter
+combinations is evaluated in a single vectorized pass, and the positive and negative likelihood ratios are returned
+alongside the predictive values.
 
 """
 
-def probability_of_disease(accuracy, prevalence):
-    sensitivity = accuracy
-    specificity = accuracy
+import numpy as np
+
+
+def predictive_values(sensitivity, specificity, prevalence):
+    sensitivity = np.asarray(sensitivity, dtype=np.float64)
+    specificity = np.asarray(specificity, dtype=np.float64)
+    prevalence = np.asarray(prevalence, dtype=np.float64)
 
-    # Compute Positive Predictive Value (PPV)
-    PPV = (sensitivity * prevalence) / ((sensitivity * prevalence) + ((1 - specificity) * (1 - prevalence)))
+    true_positives = sensitivity * prevalence
+    false_positives = (1 - specificity) * (1 - prevalence)
+    true_negatives = specificity * (1 - prevalence)
+    false_negatives = (1 - sensitivity) * prevalence
 
-    # Compute Negative Predictive Value (NPV)
-    NPV = (specificity * (1 - prevalence)) / (((1 - sensitivity) * prevalence) + (specificity * (1 - prevalence)))
+    # A perfect test gives infinite likelihood ratios
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            # Positive Predictive Value (PPV) and Negative Predictive Value (NPV)
+            "ppv": true_positives / (true_positives + false_positives),
+            "npv": true_negatives / (false_negatives + true_negatives),
+            "positive_likelihood_ratio": sensitivity / (1 - specificity),
+            "negative_likelihood_ratio": (1 - sensitivity) / specificity,
+        }
 
-    PPV = round(PPV * 100, 4)
-    NPV = round(NPV * 100, 4)
+
+def probability_of_disease(accuracy, prevalence):
+    values = predictive_values(accuracy, accuracy, prevalence)
+
+    PPV = round(float(values["ppv"]) * 100, 4)
+    NPV = round(float(values["npv"]) * 100, 4)
 
     return [PPV, NPV]
 
-# Test Cases
-print(probability_of_disease(0.95, 0.03))  
-print(probability_of_disease(0.80, 0.10))  
-print(probability_of_disease(0.60, 0.45))  
+
+if __name__ == "__main__":
+    # Test Cases
+    print(probability_of_disease(0.95, 0.03))
+    print(probability_of_disease(0.80, 0.10))
+    print(probability_of_disease(0.60, 0.45))
@@ -11,8 +11,15 @@ between two numeric vectors or sets. The following metrics are included:
 
 This module can be used in various applications including but not limited to machine learning algorithms, 
 data analysis, and similarity/distance computations between data points.
+
+For comparing many vectors at once, `Metrics.pairwise` computes the full N x M matrix between two batches
+with NumPy broadcasting. The batches are processed in blocks of rows so the temporary arrays stay bounded
+in memory regardless of the batch sizes. For jaccard, both batches are tiled, and the sets of each pair of blocks
+are encoded as 0/1 vectors over the values of those two blocks only.
 """
 
+import numpy as np
+
 
 class Metrics():
     def euclidean_distance(self, X, Y):
@@ -32,13 +39,124 @@ class Metrics():
         return dot_product / (magnitude_X * magnitude_Y)
 
     def jaccard_similarity(self, X, Y):
-        intersection = len(set(X).intersection(set(Y)))
-        union = len(set(X).union(set(Y)))
+        set_X, set_Y = set(X), set(Y)
+        intersection = len(set_X & set_Y)
+        union = len(set_X) + len(set_Y) - intersection
         return intersection / union if union != 0 else 0
 
+    def pairwise(self, X_batch, Y_batch, metric="euclidean", block_size=1024):
+        # Compute the N x M matrix of `metric` between every row of X_batch and every row of Y_batch
+        if metric not in _PAIRWISE_KERNELS:
+            raise ValueError("Unknown metric '{}', expected one of {}".format(
+                metric, sorted(_PAIRWISE_KERNELS)))
+
+        if metric == "jaccard":
+            return _jaccard_pairwise([set(row) for row in X_batch], [set(row) for row in Y_batch], block_size)
+        X_batch = _as_rows(X_batch)
+        Y_batch = _as_rows(Y_batch)
+
+        kernel = _PAIRWISE_KERNELS[metric]
+        result = np.empty((len(X_batch), len(Y_batch)))
+        if result.size == 0:
+            return result
+        # Tile over the rows of X so every temporary is at most block_size x M (x D for manhattan)
+        for start in range(0, len(X_batch), block_size):
+            end = start + block_size
+            result[start:end] = kernel(X_batch[start:end], Y_batch)
+        return result
+
+
+def _as_rows(batch):
+    # An empty batch has no rows (np.atleast_2d would turn [] into one row of zero features)
+    batch = np.asarray(batch, dtype=np.float64)
+    if batch.size == 0:
+        return batch.reshape(0, batch.shape[-1] if batch.ndim == 2 else 0)
+    return np.atleast_2d(batch)
+
+
+def _euclidean_block(X, Y):
+    # ||x - y||^2 = ||x||^2 + ||y||^2 - 2 x.y, clipped at 0 to absorb rounding errors
+    squared_norms_X = (X ** 2).sum(axis=1)[:, None]
+    squared_norms_Y = (Y ** 2).sum(axis=1)[None, :]
+    squared = squared_norms_X + squared_norms_Y - 2 * X @ Y.T
+    np.maximum(squared, 0, out=squared)
+    # The expansion loses all precision when x and y are (nearly) equal, so those distances are computed directly
+    # from the differences, which makes the distance between identical vectors exactly 0
+    rows, columns = np.nonzero(squared <= _EXPANSION_TOLERANCE * (squared_norms_X + squared_norms_Y))
+    squared[rows, columns] = ((X[rows] - Y[columns]) ** 2).sum(axis=1)
+    return np.sqrt(squared)
+
+
+def _manhattan_block(X, Y):
+    # Broadcasting builds a len(X) x len(Y) x D array, so Y is tiled as well to bound its size
+    result = np.empty((X.shape[0], Y.shape[0]))
+    y_block = max(1, _MAX_BLOCK_ELEMENTS // max(1, X.shape[0] * X.shape[1]))
+    for start in range(0, Y.shape[0], y_block):
+        end = start + y_block
+        result[:, start:end] = np.abs(
+            X[:, None, :] - Y[None, start:end, :]).sum(axis=2)
+    return result
+
+
+def _cosine_block(X, Y):
+    norms = np.sqrt((X ** 2).sum(axis=1))[:, None] * \
+        np.sqrt((Y ** 2).sum(axis=1))[None, :]
+    dot_products = X @ Y.T
+    # Vectors with a magnitude of 0 have a similarity of 0.0, as in cosine_similarity
+    return np.divide(dot_products, norms, out=np.zeros_like(dot_products), where=norms != 0)
+
+
+def _jaccard_block(X, Y):
+    intersection = X @ Y.T
+    union = X.sum(axis=1)[:, None] + Y.sum(axis=1)[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union != 0)
+
+
+def _jaccard_pairwise(X_sets, Y_sets, block_size):
+    # Tiles over both batches, so the indicator matrices of a tile only span the values of its two blocks
+    # and memory is bounded by the block size instead of the batch sizes and the vocabulary of all the sets
+    result = np.empty((len(X_sets), len(Y_sets)))
+    for x_start in range(0, len(X_sets), block_size):
+        x_sets = X_sets[x_start: x_start + block_size]
+        for y_start in range(0, len(Y_sets), block_size):
+            y_sets = Y_sets[y_start: y_start + block_size]
+            X, Y = _set_indicators(x_sets, y_sets)
+            result[x_start: x_start + block_size, y_start: y_start + block_size] = _jaccard_block(X, Y)
+    return result
+
+
+def _set_indicators(x_sets, y_sets):
+    # Every set as a 0/1 vector over the distinct values of both blocks, so intersections become
+    # a matrix product and set sizes become row sums
+    vocabulary = {}
+    for row in x_sets + y_sets:
+        for value in row:
+            vocabulary.setdefault(value, len(vocabulary))
+    indicators = np.zeros((len(x_sets) + len(y_sets), len(vocabulary)))
+    for i, row in enumerate(x_sets + y_sets):
+        indicators[i, [vocabulary[value] for value in row]] = 1
+    return indicators[:len(x_sets)], indicators[len(x_sets):]
+
+
+# Upper bound on the number of elements in a broadcast temporary (32 MB of float64)
+_MAX_BLOCK_ELEMENTS = 2 ** 22
+
+# Squared distances below this fraction of ||x||^2 + ||y||^2 are recomputed from the differences
+_EXPANSION_TOLERANCE = 1e-8
+
+
+_PAIRWISE_KERNELS = {
+    "euclidean": _euclidean_block,
+    "manhattan": _manhattan_block,
+    "cosine": _cosine_block,
+    "jaccard": _jaccard_block,
+}
+
+_METRICS = Metrics()
+
 
 def distances_and_similarities(X, Y):
-    metrics = Metrics()
+    metrics = _METRICS
     return [
         metrics.euclidean_distance(X, Y),
         metrics.manhattan_distance(X, Y),
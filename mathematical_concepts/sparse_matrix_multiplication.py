@@ -1,24 +1,156 @@
-# This file contains a function for efficiently multiplying two sparse matrices together. 
-# The function takes advantage of the sparsity of the matrices, where most elements are zero, to reduce the number of computations performed. 
-# It iterates over the non-zero elements in the matrices and accumulates the product in a result matrix. 
+# This file contains a function for efficiently multiplying two sparse matrices together.
+# The function takes advantage of the sparsity of the matrices, where most elements are zero, to reduce the number of computations performed.
+# It iterates over the non-zero elements in the matrices and accumulates the product in a result matrix.
 # The function returns the resulting matrix of the multiplication. If the matrices cannot be multiplied, an empty matrix `[[]]` is returned.
+#
+# The matrices are stored in a compressed sparse format (CSR - compressed sparse row, or CSC - compressed sparse column),
+# which keeps only the non-zero values together with their index arrays. The product is computed with Gustavson's
+# row-wise algorithm: for every non-zero a[i][k], row k of B is scattered into an accumulator for row i of the result,
+# so the work is proportional to the number of non-zero products instead of n * m * p.
+# `CSRMatrix.from_dense` / `to_dense` convert to and from the list-of-lists format used by existing callers.
+
+
+class CSRMatrix:
+    def __init__(self, data, indices, indptr, shape):
+        # data[indptr[i]:indptr[i + 1]] are the non-zero values of row i,
+        # and indices[indptr[i]:indptr[i + 1]] are their column indices
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = shape
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    @classmethod
+    def from_dense(cls, matrix):
+        data, indices, indptr = [], [], [0]
+        for row in matrix:
+            for j, value in enumerate(row):
+                if value != 0:
+                    data.append(value)
+                    indices.append(j)
+            indptr.append(len(data))
+        num_cols = len(matrix[0]) if len(matrix) > 0 else 0
+        return cls(data, indices, indptr, (len(matrix), num_cols))
+
+    def to_dense(self):
+        num_rows, num_cols = self.shape
+        result = [[0] * num_cols for _ in range(num_rows)]
+        for i in range(num_rows):
+            for idx in range(self.indptr[i], self.indptr[i + 1]):
+                result[i][self.indices[idx]] = self.data[idx]
+        return result
+
+    def row(self, i):
+        # Return the (column indices, values) of the non-zero elements of row i
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def to_csc(self):
+        num_rows, num_cols = self.shape
+        # Count the non-zero elements per column to build the column pointers
+        indptr = [0] * (num_cols + 1)
+        for j in self.indices:
+            indptr[j + 1] += 1
+        for j in range(num_cols):
+            indptr[j + 1] += indptr[j]
+
+        # Scatter every element into its column slot, rows stay in ascending order
+        next_slot = indptr[:-1]
+        data = [0] * self.nnz
+        indices = [0] * self.nnz
+        for i in range(num_rows):
+            for idx in range(self.indptr[i], self.indptr[i + 1]):
+                j = self.indices[idx]
+                data[next_slot[j]] = self.data[idx]
+                indices[next_slot[j]] = i
+                next_slot[j] += 1
+        return CSCMatrix(data, indices, indptr, self.shape)
+
+    def to_csr(self):
+        return self
+
+
+class CSCMatrix:
+    def __init__(self, data, indices, indptr, shape):
+        # data[indptr[j]:indptr[j + 1]] are the non-zero values of column j,
+        # and indices[indptr[j]:indptr[j + 1]] are their row indices
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = shape
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    @classmethod
+    def from_dense(cls, matrix):
+        return CSRMatrix.from_dense(matrix).to_csc()
+
+    def to_dense(self):
+        return self.to_csr().to_dense()
+
+    def column(self, j):
+        # Return the (row indices, values) of the non-zero elements of column j
+        start, end = self.indptr[j], self.indptr[j + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def to_csr(self):
+        # A CSC matrix is the CSR representation of its transpose, so the
+        # conversion is the same scatter with the roles of rows and columns swapped
+        num_rows, num_cols = self.shape
+        transposed = CSRMatrix(self.data, self.indices,
+                               self.indptr, (num_cols, num_rows)).to_csc()
+        return CSRMatrix(transposed.data, transposed.indices, transposed.indptr, self.shape)
+
+    def to_csc(self):
+        return self
+
+
+def sparse_matmul(matrix_a, matrix_b):
+    # Multiply two compressed sparse matrices and return the product as a CSRMatrix
+    matrix_a = matrix_a.to_csr()
+    matrix_b = matrix_b.to_csr()
+    if matrix_a.shape[1] != matrix_b.shape[0]:
+        raise ValueError("Matrices with shapes {} and {} cannot be multiplied".format(
+            matrix_a.shape, matrix_b.shape))
+
+    data, indices, indptr = [], [], [0]
+    for i in range(matrix_a.shape[0]):
+        # Accumulate row i of the result from the rows of B selected by the non-zeros of row i of A
+        row_accumulator = {}
+        for a_idx in range(matrix_a.indptr[i], matrix_a.indptr[i + 1]):
+            k = matrix_a.indices[a_idx]
+            a_value = matrix_a.data[a_idx]
+            for b_idx in range(matrix_b.indptr[k], matrix_b.indptr[k + 1]):
+                j = matrix_b.indices[b_idx]
+                row_accumulator[j] = row_accumulator.get(
+                    j, 0) + a_value * matrix_b.data[b_idx]
+
+        for j in sorted(row_accumulator):
+            if row_accumulator[j] != 0:
+                indices.append(j)
+                data.append(row_accumulator[j])
+        indptr.append(len(data))
+
+    return CSRMatrix(data, indices, indptr, (matrix_a.shape[0], matrix_b.shape[1]))
+
+
+def sparse_matrix_multiplication(matrix_a, matrix_b, sparse_result=False):
+    # Compressed inputs are multiplied directly, list-of-lists inputs are converted first
+    if isinstance(matrix_a, (CSRMatrix, CSCMatrix)) and isinstance(matrix_b, (CSRMatrix, CSCMatrix)):
+        if matrix_a.shape[1] != matrix_b.shape[0]:
+            return [[]]
+        result = sparse_matmul(matrix_a, matrix_b)
+        return result if sparse_result else result.to_dense()
 
-def sparse_matrix_multiplication(matrix_a, matrix_b):
     # Check if matrices can be multiplied
     if len(matrix_a) == 0 or len(matrix_b) == 0 or len(matrix_a[0]) != len(matrix_b):
         return [[]]
 
-    # Initialize result matrix with appropriate dimensions
-    result = [[0] * len(matrix_b[0]) for _ in range(len(matrix_a))]
-
-    # Iterate over each non-zero element in matrix_a
-    for i in range(len(matrix_a)):
-        for k in range(len(matrix_a[0])):
-            if matrix_a[i][k] != 0:
-                # Iterate over corresponding row in matrix_b to find non-zero elements
-                for j in range(len(matrix_b[0])):
-                    if matrix_b[k][j] != 0:
-                        # Accumulate product of non-zero elements in the result matrix
-                        result[i][j] += matrix_a[i][k] * matrix_b[k][j]
-
-    return result
+    result = sparse_matmul(CSRMatrix.from_dense(matrix_a),
+                           CSRMatrix.from_dense(matrix_b))
+    return result if sparse_result else result.to_dense()
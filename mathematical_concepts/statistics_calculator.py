@@ -7,6 +7,12 @@
 # It is designed to operate under the assumption of large samples from a population
 # (enough to use a Z-score of 1.96) and a normal distribution.
 
+# For data that does not fit in memory, 'StatisticsAccumulator' computes the same statistics
+# in a single pass over chunks of numbers. Partial accumulators (e.g. from worker processes)
+# can be combined with 'merge'. Mean and variance are exact (Welford / Chan et al. updates),
+# while the median comes from a t-digest quantile sketch and the mode from a Misra-Gries
+# heavy-hitters summary, so both use bounded memory and are approximate on large inputs.
+
 def get_statistics(input_list):
     n = len(input_list)
 
@@ -30,9 +36,15 @@ def get_statistics(input_list):
             freq_dict[num] = 1
     mode = max(freq_dict, key=freq_dict.get)
 
-    # Calculate variance and standard deviation
+    # Calculate variance
     sum_diff_sq = sum((xi - mean) ** 2 for xi in input_list)
     variance = sum_diff_sq / (n - 1)
+
+    return _format_statistics(n, mean, median, mode, variance)
+
+
+def _format_statistics(n, mean, median, mode, variance):
+    # Calculate standard deviation
     std_dev = variance ** 0.5
 
     # Calculate 95% confidence interval for the mean
@@ -48,3 +60,164 @@ def get_statistics(input_list):
         "sample_standard_deviation": round(std_dev, 4),
         "mean_confidence_interval": [round(ci_lower, 4), round(ci_upper, 4)]
     }
+
+
+class StatisticsAccumulator:
+    def __init__(self, compression=100, max_mode_candidates=1000):
+        self.n = 0
+        self.mean = 0.0
+        self.sum_diff_sq = 0.0
+        self.quantiles = TDigest(compression)
+        self.frequencies = MisraGries(max_mode_candidates)
+
+    def update(self, chunk):
+        chunk_n = len(chunk)
+        if chunk_n == 0:
+            return self
+
+        # Mean and sum of squared differences of the chunk, combined with the running ones
+        chunk_mean = sum(chunk) / chunk_n
+        chunk_sum_diff_sq = sum((xi - chunk_mean) ** 2 for xi in chunk)
+        self._combine_moments(chunk_n, chunk_mean, chunk_sum_diff_sq)
+
+        self.quantiles.update(chunk)
+        self.frequencies.update(chunk)
+        return self
+
+    def merge(self, other):
+        self._combine_moments(other.n, other.mean, other.sum_diff_sq)
+        self.quantiles.merge(other.quantiles)
+        self.frequencies.merge(other.frequencies)
+        return self
+
+    def result(self):
+        variance = self.sum_diff_sq / (self.n - 1)
+        return _format_statistics(self.n, self.mean, self.quantiles.quantile(0.5),
+                                  self.frequencies.most_frequent(), variance)
+
+    def _combine_moments(self, other_n, other_mean, other_sum_diff_sq):
+        # Parallel variance update from Chan et al.
+        total_n = self.n + other_n
+        if total_n == 0:
+            return
+        delta = other_mean - self.mean
+        self.mean += delta * other_n / total_n
+        self.sum_diff_sq += other_sum_diff_sq + \
+            delta ** 2 * self.n * other_n / total_n
+        self.n = total_n
+
+
+class TDigest:
+    # Merging t-digest: values are buffered and periodically merged into sorted centroids
+    # whose maximum weight shrinks towards the tails, so quantiles stay accurate with a
+    # number of centroids proportional to the compression.
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.centroids = []  # sorted list of [mean, weight]
+        self.buffer = []
+        self.total_weight = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def update(self, values):
+        for value in values:
+            self.buffer.append([value, 1])
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+        self.total_weight += len(values)
+        if len(self.buffer) > 5 * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        self.buffer.extend([mean, weight]
+                           for mean, weight in other.centroids + other.buffer)
+        self.total_weight += other.total_weight
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+    def quantile(self, q):
+        self._compress()
+        target = q * self.total_weight
+
+        # Each centroid represents its weight spread around its mean, so the quantile is
+        # interpolated between the centers of the two centroids surrounding the target
+        previous_center, previous_mean = 0, self.min
+        cumulative_weight = 0
+        for mean, weight in self.centroids:
+            center = cumulative_weight + weight / 2
+            if target <= center:
+                if center == previous_center:
+                    return mean
+                fraction = (target - previous_center) / \
+                    (center - previous_center)
+                return previous_mean + fraction * (mean - previous_mean)
+            previous_center, previous_mean = center, mean
+            cumulative_weight += weight
+
+        if cumulative_weight == previous_center:
+            return self.max
+        fraction = (target - previous_center) / \
+            (cumulative_weight - previous_center)
+        return previous_mean + fraction * (self.max - previous_mean)
+
+    def _compress(self):
+        if not self.buffer:
+            return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+
+        merged = [points[0]]
+        cumulative_weight = 0
+        for mean, weight in points[1:]:
+            current = merged[-1]
+            q = (cumulative_weight + (current[1] + weight) / 2) / \
+                self.total_weight
+            max_weight = 4 * self.total_weight * q * (1 - q) / self.compression
+            if current[1] + weight <= max_weight:
+                current[0] += (mean - current[0]) * \
+                    weight / (current[1] + weight)
+                current[1] += weight
+            else:
+                cumulative_weight += current[1]
+                merged.append([mean, weight])
+        self.centroids = merged
+
+
+class MisraGries:
+    # Heavy-hitters summary keeping at most 'capacity' counters. Counts are exact when
+    # there are fewer distinct values than counters, and otherwise underestimate each
+    # count by at most n / (capacity + 1).
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counters = {}
+
+    def update(self, values):
+        chunk_counts = {}
+        for value in values:
+            if value in chunk_counts:
+                chunk_counts[value] += 1
+            else:
+                chunk_counts[value] = 1
+        self._add_counts(chunk_counts)
+
+    def merge(self, other):
+        self._add_counts(other.counters)
+
+    def most_frequent(self):
+        return max(self.counters, key=self.counters.get)
+
+    def _add_counts(self, counts):
+        for value, count in counts.items():
+            if value in self.counters:
+                self.counters[value] += count
+            else:
+                self.counters[value] = count
+
+        if len(self.counters) > self.capacity:
+            # Keep the 'capacity' largest counters and subtract the largest dropped count from them
+            ranked = sorted(self.counters.items(),
+                            key=lambda item: item[1], reverse=True)
+            cutoff = ranked[self.capacity][1]
+            self.counters = {value: count - cutoff for value,
+                             count in ranked[:self.capacity]}
@@ -0,0 +1,36 @@
+import numpy as np
+
+from mathematical_concepts.disease_probability import predictive_values, probability_of_disease
+
+
+def baseline_probability_of_disease(accuracy, prevalence):
+    # The original scalar formulas
+    sensitivity = specificity = accuracy
+    ppv = (sensitivity * prevalence) / ((sensitivity * prevalence) + ((1 - specificity) * (1 - prevalence)))
+    npv = (specificity * (1 - prevalence)) / (((1 - sensitivity) * prevalence) + (specificity * (1 - prevalence)))
+    return [round(ppv * 100, 4), round(npv * 100, 4)]
+
+
+def test_matches_baseline():
+    for accuracy, prevalence in [(0.95, 0.03), (0.80, 0.10), (0.60, 0.45), (0.5, 0.5), (0.99, 0.001)]:
+        assert probability_of_disease(accuracy, prevalence) == baseline_probability_of_disease(accuracy, prevalence)
+
+
+def test_grid_is_evaluated_elementwise():
+    sensitivity = np.linspace(0.5, 0.99, 5)[:, None, None]
+    specificity = np.linspace(0.6, 0.95, 4)[None, :, None]
+    prevalence = np.linspace(0.01, 0.5, 3)[None, None, :]
+    values = predictive_values(sensitivity, specificity, prevalence)
+    assert values["ppv"].shape == (5, 4, 3)
+    for i, j, k in [(0, 0, 0), (4, 3, 2), (2, 1, 1)]:
+        single = predictive_values(sensitivity[i, 0, 0], specificity[0, j, 0], prevalence[0, 0, k])
+        for key, grid in values.items():
+            # The likelihood ratios do not depend on the prevalence and keep its axis of length 1
+            assert np.broadcast_to(grid, (5, 4, 3))[i, j, k] == single[key]
+
+
+def test_perfect_test_has_infinite_likelihood_ratio():
+    values = predictive_values(1.0, 1.0, 0.2)
+    assert values["ppv"] == 1 and values["npv"] == 1
+    assert np.isinf(values["positive_likelihood_ratio"])
+    assert values["negative_likelihood_ratio"] == 0
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from mathematical_concepts.distance_metrics import Metrics
+
+
+METRICS = Metrics()
+SCALAR_METRICS = {
+    "euclidean": METRICS.euclidean_distance,
+    "manhattan": METRICS.manhattan_distance,
+    "cosine": METRICS.cosine_similarity,
+    "jaccard": METRICS.jaccard_similarity,
+}
+
+
+@pytest.mark.parametrize("metric", sorted(SCALAR_METRICS))
+def test_pairwise_matches_scalar_metrics(metric):
+    rng = np.random.default_rng(0)
+    if metric == "jaccard":
+        X = rng.integers(0, 12, (9, 5))
+        Y = rng.integers(0, 12, (7, 4))
+    else:
+        X = rng.normal(0, 1, (9, 5))
+        Y = rng.normal(0, 1, (7, 5))
+        Y[0] = 0
+    # A block size smaller than the batches exercises the tiling
+    result = METRICS.pairwise(X, Y, metric, block_size=4)
+    expected = [[SCALAR_METRICS[metric](x.tolist(), y.tolist()) for y in Y] for x in X]
+    assert result.shape == (len(X), len(Y))
+    np.testing.assert_allclose(result, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_identical_vectors_are_exactly_zero_apart():
+    X = np.random.default_rng(1).normal(1e4, 1, (20, 8))
+    distances = METRICS.pairwise(X, X, "euclidean")
+    assert np.all(np.diag(distances) == 0)
+    assert np.all(distances >= 0)
+
+
+@pytest.mark.parametrize("metric", sorted(SCALAR_METRICS))
+def test_empty_batches(metric):
+    Y = [[1, 2, 3], [4, 5, 6]]
+    assert METRICS.pairwise([], Y, metric).shape == (0, 2)
+    assert METRICS.pairwise(Y, [], metric).shape == (2, 0)
+
+
+def test_unknown_metric():
+    with pytest.raises(ValueError):
+        METRICS.pairwise([[1]], [[1]], "chebyshev")
@@ -0,0 +1,54 @@
+import random
+
+from mathematical_concepts.sparse_matrix_multiplication import (CSCMatrix, CSRMatrix, sparse_matmul,
+                                                                sparse_matrix_multiplication)
+
+
+def baseline_multiplication(matrix_a, matrix_b):
+    # The original dense triple loop over the non-zero elements
+    if len(matrix_a) == 0 or len(matrix_b) == 0 or len(matrix_a[0]) != len(matrix_b):
+        return [[]]
+    result = [[0] * len(matrix_b[0]) for _ in range(len(matrix_a))]
+    for i in range(len(matrix_a)):
+        for k in range(len(matrix_a[0])):
+            if matrix_a[i][k] != 0:
+                for j in range(len(matrix_b[0])):
+                    if matrix_b[k][j] != 0:
+                        result[i][j] += matrix_a[i][k] * matrix_b[k][j]
+    return result
+
+
+def random_sparse(rows, columns, density, rng):
+    return [[rng.randint(-5, 5) if rng.random() < density else 0 for _ in range(columns)] for _ in range(rows)]
+
+
+def test_matches_baseline_on_random_matrices():
+    rng = random.Random(0)
+    for rows, inner, columns, density in [(1, 1, 1, 1.0), (7, 5, 3, 0.3), (20, 30, 10, 0.1), (15, 15, 15, 0.0)]:
+        matrix_a = random_sparse(rows, inner, density, rng)
+        matrix_b = random_sparse(inner, columns, density, rng)
+        assert sparse_matrix_multiplication(matrix_a, matrix_b) == baseline_multiplication(matrix_a, matrix_b)
+
+
+def test_compressed_inputs_give_the_same_product():
+    rng = random.Random(1)
+    matrix_a = random_sparse(12, 9, 0.25, rng)
+    matrix_b = random_sparse(9, 6, 0.25, rng)
+    expected = baseline_multiplication(matrix_a, matrix_b)
+    for left in (CSRMatrix.from_dense(matrix_a), CSCMatrix.from_dense(matrix_a)):
+        for right in (CSRMatrix.from_dense(matrix_b), CSCMatrix.from_dense(matrix_b)):
+            assert sparse_matmul(left, right).to_dense() == expected
+            assert sparse_matrix_multiplication(left, right) == expected
+
+
+def test_incompatible_shapes_return_empty_matrix():
+    assert sparse_matrix_multiplication([[1, 2]], [[1, 2]]) == [[]]
+    assert sparse_matrix_multiplication([], [[1]]) == [[]]
+    assert sparse_matrix_multiplication(CSRMatrix.from_dense([[1, 2]]), CSRMatrix.from_dense([[1, 2]])) == [[]]
+
+
+def test_conversions_round_trip():
+    matrix = [[0, 1, 0], [2, 0, 3], [0, 0, 0]]
+    assert CSRMatrix.from_dense(matrix).to_csc().to_dense() == matrix
+    assert CSCMatrix.from_dense(matrix).to_csr().to_dense() == matrix
+    assert CSRMatrix.from_dense(matrix).nnz == 3
@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from mathematical_concepts.statistics_calculator import MisraGries, StatisticsAccumulator, TDigest, get_statistics
+
+
+def test_accumulator_matches_get_statistics_on_small_input():
+    # Fewer values than centroids and counters, so the sketches are exact
+    values = [4, 1, 2, 2, 8, 5, 7, 2, 3]
+    accumulator = StatisticsAccumulator()
+    for start in range(0, len(values), 4):
+        accumulator.update(values[start:start + 4])
+    assert accumulator.result() == get_statistics(values)
+
+
+def test_merged_accumulators_match_one_pass():
+    rng = random.Random(0)
+    values = [rng.gauss(10, 3) for _ in range(5000)]
+    single = StatisticsAccumulator().update(values)
+    left = StatisticsAccumulator().update(values[:1234])
+    right = StatisticsAccumulator().update(values[1234:])
+    merged = left.merge(right).result()
+    expected = get_statistics(values)
+    for key in ("mean", "sample_variance", "sample_standard_deviation"):
+        assert merged[key] == pytest.approx(expected[key], abs=1e-3)
+        assert single.result()[key] == pytest.approx(expected[key], abs=1e-3)
+
+
+def test_tdigest_quantiles_are_close_to_exact_ones():
+    rng = random.Random(1)
+    values = [rng.expovariate(1.0) for _ in range(20000)]
+    digest = TDigest(compression=100)
+    for start in range(0, len(values), 1000):
+        digest.update(values[start:start + 1000])
+    ordered = sorted(values)
+    for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert digest.quantile(q) == pytest.approx(exact, rel=0.02, abs=0.01)
+    assert digest.quantile(0) == min(values)
+    assert digest.quantile(1) == max(values)
+
+
+def test_misra_gries_finds_the_heavy_hitter():
+    rng = random.Random(2)
+    values = [7] * 3000 + [rng.randrange(100000) for _ in range(20000)]
+    rng.shuffle(values)
+    counter = MisraGries(capacity=50)
+    for start in range(0, len(values), 997):
+        counter.update(values[start:start + 997])
+    assert counter.most_frequent() == 7
+    assert len(counter.counters) <= 50
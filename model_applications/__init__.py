@@ -0,0 +1,31 @@
+"""
+Applications built on machine learning frameworks: stock buy signals with XGBoost, text summarization with
+scikit-learn and NLTK, truck image classification with TensorFlow and user cancellation prediction with PySpark.
+
+The public names below are imported from their modules on first access (PEP 562), so importing the package does not
+import any of the frameworks. Each framework is only loaded when a name from the module that needs it is first used,
+e.g. `model_applications.stock_boost` imports XGBoost but not TensorFlow or PySpark.
+"""
+
+from lazy_loading import lazy_module
+
+# Public name -> module it is defined in
+_LAZY_ATTRIBUTES = {
+    "stock_boost": "stock_prediction_xgboost",
+    "train_stock_boost": "stock_prediction_xgboost",
+    "predict_buy_signals": "stock_prediction_xgboost",
+    "ParquetChunkIterator": "stock_prediction_xgboost",
+    "Summarizer": "text_summarizer",
+    "tldr": "text_summarizer",
+    "classify_trucks": "truck_classification_model",
+    "export_for_inference": "truck_classification_model",
+    "load_tflite_predict_fn": "truck_classification_model",
+    "MicroBatchingPredictor": "truck_classification_model",
+    "CancellationPredictor": "user_cancellation_prediction",
+    "predict_cancellations": "user_cancellation_prediction",
+    "get_local_spark_session": "user_cancellation_prediction",
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+__getattr__, __dir__ = lazy_module(__name__, _LAZY_ATTRIBUTES)
@@ -1,29 +1,81 @@
 """
-This script contains the `stock_boost` function, which is an implementation of the XGBoost machine learning 
+This script contains the `stock_boost` function, which is an implementation of the XGBoost machine learning
 algorithm for binary classification. Specifically, the function is designed to predict buy signals for stocks.
 
-The function accepts training data (`X_train` and `y_train`), and test data (`X_test`). It then trains an 
-XGBoost model using the binary logistic objective, applies a prediction threshold, and outputs predictions 
+The function accepts training data (`X_train` and `y_train`), and test data (`X_test`). It then trains an
+XGBoost model using the binary logistic objective, applies a prediction threshold, and outputs predictions
 in the form of a buy signal.
 
-Please note that data preprocessing (e.g., handling missing values, non-numeric data, etc.) is not included 
+For histories that do not fit in memory, `train_stock_boost` trains with the `hist` tree method over parquet
+chunks read one at a time by `ParquetChunkIterator`. The chunks are quantized into a `QuantileDMatrix`, or kept
+in an on-disk external-memory cache with `external_memory=True`. Passing a previously trained model continues
+boosting from it, so new trading days can be added without retraining on the full history.
+`predict_buy_signals` scores a frame in place, without copying or modifying it.
+
+Please note that data preprocessing (e.g., handling missing values, non-numeric data, etc.) is not included
 in this function and should be performed prior to using it.
 """
+import os
+
+import pandas as pd
 import xgboost as xgb
 
 
-def stock_boost(X_train, y_train, X_test):
+def stock_boost(X_train, y_train, X_test, max_depth=7, threshold=0.44):
     d_train = xgb.DMatrix(X_train, label=y_train, enable_categorical=True)
     d_test = xgb.DMatrix(X_test, enable_categorical=True)
     stock_boost_model = xgb.train({"objective": "binary:logistic",
                                   "tree_method": "exact",
                                    "max_cat_to_oneehot": 11,
                                    "eta": .32,
-                                   "max_depth": 7}, d_train)
+                                   "max_depth": max_depth}, d_train)
     raw_predictions = stock_boost_model.predict(d_test)
-    threshold_predictions = [1 if value >
-                             0.44 else 0 for value in raw_predictions]
-    X_test['buy_signal'] = threshold_predictions
-    y_test_predictions = X_test[['buy_signal']].copy()
-    X_test.drop('buy_signal', axis=1, inplace=True)
-    return y_test_predictions
+    return pd.DataFrame({"buy_signal": (raw_predictions > threshold).astype(int)}, index=X_test.index)
+
+
+class ParquetChunkIterator(xgb.DataIter):
+    def __init__(self, chunk_paths, label_column, feature_columns=None, cache_prefix=None):
+        self.chunk_paths = list(chunk_paths)
+        self.label_column = label_column
+        self.feature_columns = feature_columns
+        self.position = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        # Hand the next chunk to XGBoost, only one chunk is held in memory at a time
+        if self.position == len(self.chunk_paths):
+            return False
+        columns = None if self.feature_columns is None else self.feature_columns + [self.label_column]
+        chunk = pd.read_parquet(self.chunk_paths[self.position], columns=columns)
+        input_data(data=chunk.drop(columns=self.label_column), label=chunk[self.label_column])
+        self.position += 1
+        return True
+
+    def reset(self):
+        self.position = 0
+
+
+def train_stock_boost(chunk_paths, label_column, feature_columns=None, model=None, num_boost_round=10,
+                      max_depth=7, max_bin=256, external_memory=False, cache_dir="."):
+    params = {"objective": "binary:logistic",
+              "tree_method": "hist",
+              "max_cat_to_onehot": 11,
+              "eta": .32,
+              "max_depth": max_depth,
+              "max_bin": max_bin}
+    if external_memory:
+        iterator = ParquetChunkIterator(chunk_paths, label_column, feature_columns,
+                                        cache_prefix=os.path.join(cache_dir, "stock_boost_cache"))
+        d_train = xgb.DMatrix(iterator, enable_categorical=True)
+    else:
+        iterator = ParquetChunkIterator(chunk_paths, label_column, feature_columns)
+        # Only the quantized histogram bins are kept, never the raw feature values
+        d_train = xgb.QuantileDMatrix(iterator, max_bin=max_bin, enable_categorical=True)
+    # With a model, boosting continues from its trees instead of starting over
+    return xgb.train(params, d_train, num_boost_round=num_boost_round, xgb_model=model)
+
+
+def predict_buy_signals(model, X, threshold=0.44):
+    # inplace_predict reads the frame directly instead of building a DMatrix copy of it
+    raw_predictions = model.inplace_predict(X)
+    return pd.DataFrame({"buy_signal": (raw_predictions > threshold).astype(int)}, index=X.index)
@@ -1,29 +1,106 @@
 """
 text_summarizer.py: Summarizes text using the TF-IDF method.
 
-The function `tldr()` tokenizes the input into sentences, calculates the 
+The function `tldr()` tokenizes the input into sentences, calculates the
 TF-IDF for each, and selects those with a total TF-IDF above a threshold (currently 3).
 
+The `Summarizer` class loads the stop words and the sentence tokenizer once and reuses them for every document.
+Instead of the absolute threshold it can keep the `top_k` highest scoring sentences, or a `ratio` of the sentences,
+picked with `np.argpartition` and returned in their original order. `tldr_many()` summarizes a list of documents,
+in parallel over a process pool when `n_jobs` is greater than 1.
+
 Usage:
     text_to_summarize = "Your text here..."
     print(tldr(text_to_summarize))
+
+    summarizer = Summarizer(ratio=0.2)
+    summaries = summarizer.tldr_many(documents, n_jobs=8)
 """
 
+from concurrent.futures import ProcessPoolExecutor
+
 from sklearn.feature_extraction.text import TfidfVectorizer
 import numpy as np
-from nltk import sent_tokenize
+import nltk
 from nltk.corpus import stopwords
 
 
+def _load_sentence_tokenizer(language):
+    try:
+        # NLTK >= 3.8.2 ships the Punkt models as punkt_tab
+        from nltk.tokenize.punkt import PunktTokenizer
+        return PunktTokenizer(language).tokenize
+    except ImportError:
+        return nltk.data.load("tokenizers/punkt/{}.pickle".format(language)).tokenize
+
+
+class Summarizer:
+    def __init__(self, threshold=3, top_k=None, ratio=None, language="english"):
+        if top_k is not None and ratio is not None:
+            raise ValueError("Only one of top_k and ratio can be set")
+        self.threshold = threshold
+        self.top_k = top_k
+        self.ratio = ratio
+        self.language = language
+        self.stop_words = sorted(set(stopwords.words(language)))
+        self.sentence_tokenizer = _load_sentence_tokenizer(language)
+        self.tf_idf_vectorizer = TfidfVectorizer(stop_words=self.stop_words)
+
+    def tldr(self, text_to_summarize):
+        sentence_tokens = np.array(self.sentence_tokenizer(text_to_summarize))
+        if len(sentence_tokens) == 0:
+            return ''
+        try:
+            tf_idf = self.tf_idf_vectorizer.fit_transform(sentence_tokens)
+        except ValueError:
+            # Every sentence consists only of stop words
+            return ''
+        sentence_tf_idf_sums_array = np.asarray(tf_idf.sum(axis=1)).ravel()
+        selected_sentences_indicies = self._select_sentences(sentence_tf_idf_sums_array)
+        summary_sentences = sentence_tokens[selected_sentences_indicies]
+        summary = ' '.join(summary_sentences)
+        return summary
+
+    def tldr_many(self, documents, n_jobs=1, chunksize=64):
+        if n_jobs == 1:
+            return [self.tldr(document) for document in documents]
+        # Every worker builds its own Summarizer once, then summarizes its share of the documents
+        with ProcessPoolExecutor(n_jobs, initializer=_init_worker,
+                                 initargs=(self.threshold, self.top_k, self.ratio, self.language)) as pool:
+            return list(pool.map(_tldr_in_worker, documents, chunksize=chunksize))
+
+    def _select_sentences(self, scores):
+        if self.top_k is None and self.ratio is None:
+            return np.where(scores > self.threshold)[0]
+
+        if self.top_k is not None:
+            num_sentences = min(self.top_k, len(scores))
+        else:
+            num_sentences = max(1, int(round(self.ratio * len(scores))))
+        if num_sentences == 0:
+            return np.array([], dtype=int)
+        # argpartition finds the best sentences without sorting all of them, then they are put back in text order
+        best = np.argpartition(-scores, num_sentences - 1)[:num_sentences]
+        return np.sort(best)
+
+
+_worker_summarizer = None
+
+
+def _init_worker(threshold, top_k, ratio, language):
+    global _worker_summarizer
+    _worker_summarizer = Summarizer(threshold, top_k, ratio, language)
+
+
+def _tldr_in_worker(text_to_summarize):
+    return _worker_summarizer.tldr(text_to_summarize)
+
+
+_default_summarizer = None
+
+
 def tldr(text_to_summarize):
-    sentence_tokens = np.array(sent_tokenize(text_to_summarize))
-    stop_word_set = set(stopwords.words("english"))
-    tf_idf_vectorizer = TfidfVectorizer(stop_words=stop_word_set)
-    tf_idf = tf_idf_vectorizer.fit_transform(sentence_tokens)
-    sentence_tf_idf_sums_matrix = tf_idf.sum(axis=1)
-    sentence_tf_idf_sums_array = np.asarray(
-        sentence_tf_idf_sums_matrix).squeeze()
-    selected_sentences_indicies = np.where(sentence_tf_idf_sums_array > 3)
-    summary_sentences = sentence_tokens[selected_sentences_indicies]
-    summary = ' '.join(summary_sentences)
-    return summary
+    global _default_summarizer
+    if _default_summarizer is None:
+        _default_summarizer = Summarizer()
+    return _default_summarizer.tldr(text_to_summarize)
@@ -2,33 +2,196 @@
 This script defines a function to create a simple Convolutional Neural Network (CNN) model
 for classifying images as either trucks or not trucks (binary classification).
 
-The model architecture consists of three sets of Conv2D and MaxPooling2D layers for feature 
+The model architecture consists of three sets of Conv2D and MaxPooling2D layers for feature
 extraction from images, followed by a Flatten layer and two Dense layers for classification.
 The model uses 'relu' activation function in Conv2D and first Dense layer, while 'sigmoid'
-activation function in the final Dense layer for binary classification. 
+activation function in the final Dense layer for binary classification.
 
-The model is compiled with Adam optimizer and binary cross entropy loss, which is appropriate 
-for binary classification tasks. The learning rate for the optimizer is set to 0.01. The model's 
+The model is compiled with Adam optimizer and binary cross entropy loss, which is appropriate
+for binary classification tasks. The learning rate for the optimizer is set to 0.01. The model's
 performance is evaluated based on binary accuracy.
 
+For CPU inference, `pooling="average"` or `pooling="max"` replaces the Flatten layer with global pooling, which
+shrinks the first Dense layer from 3,461,120 weights (52 * 52 * 64 * 20) to 1,280. `export_for_inference` saves a trained model as a
+SavedModel and, optionally, as a TFLite model with post-training int8 quantization. `MicroBatchingPredictor`
+gathers single-image requests from many threads into batches, waiting at most `max_latency_ms` for a batch to
+fill, and reports the p50/p99 request latency and the images per second it served. TensorFlow is only imported
+by the functions that build, export or load a model, so importing this module (or serving a predict function with
+`MicroBatchingPredictor`) does not pay for the TensorFlow import.
+
 """
 
-import tensorflow as tf
-from tensorflow.keras import layers, models, optimizers, losses
+import collections
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+def classify_trucks(pooling="flatten"):
+    # TensorFlow is imported on first use, so MicroBatchingPredictor can be used without it
+    from tensorflow.keras import layers, models, optimizers, losses
 
-def classify_trucks():
     model = models.Sequential()
     model.add(layers.Conv2D(16, 3, activation='relu', input_shape=(224, 224, 3), kernel_initializer='he_normal'))
     model.add(layers.MaxPooling2D(2))
     model.add(layers.Conv2D(32, 3, activation='relu', kernel_initializer='he_normal'))
     model.add(layers.MaxPooling2D(2))
     model.add(layers.Conv2D(64, 3, activation='relu', kernel_initializer='he_normal'))
-    model.add(layers.Flatten())
+    if pooling == "flatten":
+        model.add(layers.Flatten())
+    elif pooling == "average":
+        model.add(layers.GlobalAveragePooling2D())
+    elif pooling == "max":
+        model.add(layers.GlobalMaxPooling2D())
+    else:
+        raise ValueError("Unknown pooling '{}', expected 'flatten', 'average' or 'max'".format(pooling))
     model.add(layers.Dense(20, activation='relu', kernel_initializer='he_normal'))
     model.add(layers.Dense(1, activation='sigmoid', kernel_initializer='glorot_normal'))
 
-    model.compile(optimizer=optimizers.Adam(learning_rate=0.01), 
-                  loss=losses.BinaryCrossentropy(), 
+    model.compile(optimizer=optimizers.Adam(learning_rate=0.01),
+                  loss=losses.BinaryCrossentropy(),
                   metrics=['binary_accuracy'])
 
     return model
+
+
+def export_for_inference(model, export_dir, quantize=False, representative_images=None):
+    # Save the model for serving, and optionally a fully int8 quantized TFLite version of it
+    import tensorflow as tf
+
+    saved_model_dir = os.path.join(export_dir, "saved_model")
+    tf.saved_model.save(model, saved_model_dir)
+    if not quantize:
+        return saved_model_dir
+
+    if representative_images is None:
+        raise ValueError("Int8 quantization needs representative_images to calibrate the activation ranges")
+
+    def representative_dataset():
+        for image in representative_images:
+            yield [np.asarray(image, dtype=np.float32)[None, ...]]
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    tflite_path = os.path.join(export_dir, "truck_classifier_int8.tflite")
+    with open(tflite_path, "wb") as tflite_file:
+        tflite_file.write(converter.convert())
+    return tflite_path
+
+
+def load_tflite_predict_fn(tflite_path, num_threads=None):
+    # Batch predict function backed by the TFLite interpreter, handling int8 input and output scaling
+    import tensorflow as tf
+
+    interpreter = tf.lite.Interpreter(model_path=tflite_path, num_threads=num_threads)
+    input_details = interpreter.get_input_details()[0]
+    output_details = interpreter.get_output_details()[0]
+    input_scale, input_zero_point = input_details["quantization"]
+    output_scale, output_zero_point = output_details["quantization"]
+    allocated_batch_size = [None]
+
+    def predict(images):
+        images = np.asarray(images, dtype=np.float32)
+        if allocated_batch_size[0] != len(images):
+            interpreter.resize_tensor_input(input_details["index"], [len(images), *images.shape[1:]])
+            interpreter.allocate_tensors()
+            allocated_batch_size[0] = len(images)
+        if input_scale:
+            images = np.clip(np.round(images / input_scale + input_zero_point), -128, 127)
+        interpreter.set_tensor(input_details["index"], images.astype(input_details["dtype"]))
+        interpreter.invoke()
+        outputs = interpreter.get_tensor(output_details["index"]).astype(np.float32)
+        if output_scale:
+            outputs = (outputs - output_zero_point) * output_scale
+        return outputs[:, 0]
+
+    return predict
+
+
+class MicroBatchingPredictor:
+    def __init__(self, predict_fn, max_batch_size=32, max_latency_ms=10):
+        # predict_fn takes a batch of images and returns one probability per image,
+        # e.g. `lambda images: model(images, training=False).numpy()[:, 0]` or load_tflite_predict_fn(path)
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self.requests = queue.Queue()
+        # Latencies of the most recent requests, so a long-running predictor does not grow without bound
+        self.latencies = collections.deque(maxlen=100000)
+        self.served_images = 0
+        self.started_at = time.perf_counter()
+        self.worker = threading.Thread(target=self._serve, daemon=True)
+        self.worker.start()
+
+    def submit(self, image):
+        future = Future()
+        self.requests.put((image, future, time.perf_counter()))
+        return future
+
+    def predict(self, image):
+        return self.submit(image).result()
+
+    def close(self):
+        self.requests.put(None)
+        self.worker.join()
+
+    def latency_report(self):
+        latencies = np.array(self.latencies) * 1000
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+            "images_per_second": self.served_images / elapsed,
+        }
+
+    def _serve(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            batch = [request]
+            # Keep collecting requests until the batch is full or the oldest one has waited long enough
+            deadline = request[2] + self.max_latency
+            closing = False
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    closing = True
+                    break
+                batch.append(request)
+
+            self._run_batch(batch)
+            if closing:
+                return
+
+    def _run_batch(self, batch):
+        # Any failure (images of different shapes, a raising or short predict_fn) fails the futures of the
+        # batch, and the worker keeps serving the next requests
+        try:
+            images = np.stack([image for image, _, _ in batch])
+            predictions = [float(prediction) for prediction in self.predict_fn(images)]
+            if len(predictions) != len(batch):
+                raise ValueError("predict_fn returned {} predictions for a batch of {} images".format(
+                    len(predictions), len(batch)))
+        except Exception as error:
+            for _, future, _ in batch:
+                future.set_exception(error)
+            return
+        finished_at = time.perf_counter()
+        for (_, future, submitted_at), prediction in zip(batch, predictions):
+            future.set_result(prediction)
+            self.latencies.append(finished_at - submitted_at)
+        self.served_images += len(batch)
@@ -1,6 +1,6 @@
 """
 This script uses PySpark's ML library to implement a logistic regression model.
-The purpose of the model is to predict if a user will cancel within the upcoming week, 
+The purpose of the model is to predict if a user will cancel within the upcoming week,
 based on the user's interaction counts for the past month, week, and day.
 
 Functionality:
@@ -9,25 +9,121 @@ Functionality:
 - Trains a logistic regression model using specific hyperparameters.
 - Uses the trained model to make predictions and returns a DataFrame with user IDs and their associated predictions.
 
-Note: This script assumes the input data has been appropriately preprocessed. Also, it trains and tests 
+`CancellationPredictor` keeps the assembled features persisted between fitting and scoring, so the input is only
+read once (use it as a context manager, or call `unpersist`, to release them), and stores the fitted stages as a
+`PipelineModel` that can be saved and loaded for scoring-only runs.
+Small batches can be scored without a Spark job through `score_pandas`, or inside Spark with the Arrow-backed
+pandas UDF from `score_udf`. `get_local_spark_session` creates a `local[*]` session for running and benchmarking
+the pipeline without a cluster.
+
+Note: This script assumes the input data has been appropriately preprocessed. Also, it trains and tests
 on the same dataset, which could lead to overfitting in a real-world scenario.
 """
 
+import numpy as np
+import pandas as pd
+from pyspark import StorageLevel
+from pyspark.ml import PipelineModel
 from pyspark.ml.feature import VectorAssembler
 from pyspark.ml.classification import LogisticRegression
+from pyspark.sql import SparkSession
+from pyspark.sql.functions import pandas_udf
 
-def predict_cancellations(user_interaction_df):
-    assembler = VectorAssembler(
-        inputCols = ["month_interaction_count", "week_interaction_count", "day_interaction_count"], 
-        outputCol = "features")
+FEATURE_COLUMNS = ["month_interaction_count", "week_interaction_count", "day_interaction_count"]
+THRESHOLD = 0.6
+
+
+def get_local_spark_session(app_name="user_cancellation_prediction", shuffle_partitions=8):
+    # Local session using every core, with Arrow enabled for pandas conversions and pandas UDFs
+    return (SparkSession.builder
+            .master("local[*]")
+            .appName(app_name)
+            .config("spark.sql.shuffle.partitions", shuffle_partitions)
+            .config("spark.sql.execution.arrow.pyspark.enabled", "true")
+            .getOrCreate())
+
+
+class CancellationPredictor:
+    def __init__(self, model=None):
+        self.model = model
+        self.features_df = None
+
+    @classmethod
+    def load(cls, path):
+        return cls(PipelineModel.load(path))
+
+    def save(self, path):
+        self.model.write().overwrite().save(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.unpersist()
 
-    features_df = assembler.transform(user_interaction_df)
-    features_df = features_df.withColumn("label", features_df["cancelled_within_week"])
+    def fit(self, user_interaction_df):
+        assembler = VectorAssembler(inputCols=FEATURE_COLUMNS, outputCol="features")
+        # The assembled features are persisted so fitting and scoring the same data only reads the input once
+        features_df = assembler.transform(user_interaction_df)
+        features_df = features_df.withColumn("label", features_df["cancelled_within_week"])
+        self.features_df = features_df.persist(StorageLevel.MEMORY_AND_DISK)
 
-    lr_model = LogisticRegression(maxIter = 10, threshold = 0.6, elasticNetParam = 1, regParam = 0.1)
-    trained_lr_model = lr_model.fit(features_df)
+        lr_model = LogisticRegression(maxIter = 10, threshold = THRESHOLD, elasticNetParam = 1, regParam = 0.1)
+        trained_lr_model = lr_model.fit(self.features_df)
+        self.model = PipelineModel(stages=[assembler, trained_lr_model])
+        return self
 
-    predictions_df = trained_lr_model.transform(features_df)
-    predictions_df = predictions_df.select(['user_id', 'rawPrediction', 'probability', 'prediction'])
+    def predict(self, user_interaction_df=None):
+        # Without a DataFrame, score the persisted features the model was fitted on
+        if user_interaction_df is None:
+            predictions_df = self.model.stages[-1].transform(self.features_df)
+        else:
+            predictions_df = self.model.transform(user_interaction_df)
+        return predictions_df.select(['user_id', 'rawPrediction', 'probability', 'prediction'])
 
-    return predictions_df
\ No newline at end of file
+    def unpersist(self):
+        if self.features_df is not None:
+            self.features_df.unpersist()
+            self.features_df = None
+
+    def score_pandas(self, user_interaction_pdf):
+        # Score a pandas DataFrame with NumPy, without starting a Spark job
+        coefficients, intercept = self._coefficients()
+        probabilities = _probabilities(user_interaction_pdf[FEATURE_COLUMNS].to_numpy(dtype=np.float64),
+                                       coefficients, intercept)
+        # Use the threshold the model was fitted (or loaded) with, not the module default
+        threshold = self.model.stages[-1].getThreshold()
+        return pd.DataFrame({
+            "user_id": user_interaction_pdf["user_id"].to_numpy(),
+            "probability": probabilities,
+            "prediction": (probabilities > threshold).astype(np.float64),
+        }, index=user_interaction_pdf.index)
+
+    def score_udf(self):
+        # Arrow-backed pandas UDF returning the cancellation probability from the feature columns
+        coefficients, intercept = self._coefficients()
+
+        @pandas_udf("double")
+        def cancellation_probability(month_interaction_count: pd.Series, week_interaction_count: pd.Series,
+                                     day_interaction_count: pd.Series) -> pd.Series:
+            features = np.column_stack([month_interaction_count, week_interaction_count, day_interaction_count])
+            return pd.Series(_probabilities(features.astype(np.float64), coefficients, intercept))
+
+        return cancellation_probability
+
+    def _coefficients(self):
+        lr_model = self.model.stages[-1]
+        return lr_model.coefficients.toArray(), lr_model.intercept
+
+
+def _probabilities(features, coefficients, intercept):
+    return 1 / (1 + np.exp(-(features @ coefficients + intercept)))
+
+
+def predict_cancellations(user_interaction_df):
+    # The predictions are persisted and computed while the features are still cached, so the input is read once.
+    # The features are released on the way out, the caller unpersists the returned predictions when done with them.
+    with CancellationPredictor() as predictor:
+        predictions_df = predictor.fit(user_interaction_df).predict().persist(StorageLevel.MEMORY_AND_DISK)
+        predictions_df.count()
+        return predictions_df
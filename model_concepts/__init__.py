@@ -0,0 +1,46 @@
+"""
+From-scratch implementations of k-means, k-nearest neighbors, regression trees, multinomial naive Bayes and a
+single-neuron logistic regression, with `serving` putting them behind an asyncio micro-batching prediction endpoint
+and `model_selection` tuning them with parallel cross-validated hyperparameter searches.
+
+The public names below are imported from their modules on first access (PEP 562), so importing the package does no
+work, and using one model only loads that model's module. Each module needs at most NumPy.
+"""
+
+from lazy_loading import lazy_module
+
+# Public name -> module it is defined in
+_LAZY_ATTRIBUTES = {
+    "KMeans": "k_means.k_means_clustering",
+    "get_k_means": "k_means.k_means_clustering",
+    "predict_label": "knn.knn_classification",
+    "find_k_nearest_neighbors": "knn.knn_classification",
+    "KNNIndex": "knn.knn_classification",
+    "LSHIndex": "knn.knn_classification",
+    "MinHashIndex": "knn.knn_classification",
+    "recall_report": "knn.knn_classification",
+    "MultinomialNB": "multinomial_naive_bayes.multinomial_naive_bayes",
+    "Neuron": "neuron.neuron_model",
+    "MemmapDataset": "neuron.neuron_model",
+    "RegressionTree": "regression_tree.regression_tree",
+    "GradientBoostedTrees": "regression_tree.regression_tree",
+    "RandomForest": "regression_tree.regression_tree",
+    "Instrumentation": "instrumentation",
+    "JSONLinesCallback": "instrumentation",
+    "ModelRegistry": "serving",
+    "PredictionServer": "serving",
+    "SavedModelPredictor": "serving",
+    "batch_predict_fn": "serving",
+    "HyperparameterSearch": "model_selection",
+    "KNNTask": "model_selection",
+    "RegressionTreeTask": "model_selection",
+    "NeuronTask": "model_selection",
+    "MultinomialNBTask": "model_selection",
+    "k_fold": "model_selection",
+    "parameter_grid": "model_selection",
+    "random_parameters": "model_selection",
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+__getattr__, __dir__ = lazy_module(__name__, _LAZY_ATTRIBUTES)
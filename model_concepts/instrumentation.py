@@ -0,0 +1,136 @@
+"""
+Instrumentation shared by the from-scratch learners.
+
+An `Instrumentation` object is passed to a model with `instrumentation=...`. The model then reports:
+- structured events, e.g. the inertia and number of reassigned points of every k-means iteration or the loss of every
+  Neuron epoch, which are kept in `events` and passed to every callback;
+- named timers and counters, e.g. the time spent in the k-means assignment step or searching for splits at every depth
+  of a regression tree.
+
+Models only check `instrumentation is not None`, so nothing is measured or computed for them without it. The collected
+data can be written to JSON with `dump_json`, or turned into a `pstats.Stats` with `stats()`. In those reports every
+timer appears as a function with its number of calls and total time, next to the functions of any block run under
+`profile()`, so the usual cProfile tools (`sort_stats`, `print_stats`, `dump_stats` for snakeviz) work on them.
+
+Usage:
+    instrumentation = Instrumentation(callbacks=[JSONLinesCallback("events.jsonl")])
+    KMeans(8, instrumentation=instrumentation).fit(features)
+    instrumentation.dump_json("training_metrics.json")
+    print(instrumentation.report())
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import time
+
+
+class Instrumentation:
+    def __init__(self, callbacks=(), record_events=True):
+        # A callback is any callable taking the event dict
+        self.callbacks = list(callbacks)
+        self.record_events = record_events
+        self.events = []
+        self.counters = {}
+        # Timer name -> [number of calls, total seconds]
+        self.timers = {}
+        self.profiles = []
+
+    def emit(self, event, **fields):
+        record = {"event": event, "timestamp": time.time()}
+        record.update(fields)
+        if self.record_events:
+            self.events.append(record)
+        for callback in self.callbacks:
+            callback(record)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, name, seconds, calls=1):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [calls, seconds]
+        else:
+            timer[0] += calls
+            timer[1] += seconds
+
+    def timer(self, name):
+        # Context manager adding the time spent in its block to the timer `name`
+        return _Timer(self, name)
+
+    def profile(self):
+        # Context manager running its block under cProfile, the result is merged into stats()
+        profiler = cProfile.Profile()
+        self.profiles.append(profiler)
+        return profiler
+
+    def to_dict(self):
+        return {
+            "counters": dict(self.counters),
+            "timers": {name: {"calls": calls, "total_seconds": seconds, "mean_seconds": seconds / calls}
+                       for name, (calls, seconds) in self.timers.items()},
+            "events": list(self.events),
+        }
+
+    def dump_json(self, path):
+        with open(path, "w") as json_file:
+            json.dump(self.to_dict(), json_file, indent=2, default=_to_json)
+
+    def stats(self):
+        stats = pstats.Stats(_TimerStats(self.timers))
+        for profiler in self.profiles:
+            stats.add(profiler)
+        return stats
+
+    def report(self, sort="tottime", limit=30):
+        output = io.StringIO()
+        stats = self.stats()
+        stats.stream = output
+        stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+
+class JSONLinesCallback:
+    # Writes every event as one line of JSON, e.g. to a log file tailed by a metrics collector
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, event):
+        with open(self.path, "a") as events_file:
+            events_file.write(json.dumps(event, default=_to_json) + "\n")
+
+
+class _Timer:
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _TimerStats:
+    # The timers in the form pstats.Stats reads from a profiler. Timers have no callers, so their own time
+    # is also their cumulative time.
+    def __init__(self, timers):
+        self.timers = timers
+        self.stats = {}
+
+    def create_stats(self):
+        self.stats = {("~", 0, name): (calls, calls, seconds, seconds, {})
+                      for name, (calls, seconds) in self.timers.items()}
+
+
+def _to_json(value):
+    # NumPy scalars and arrays in event fields
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(value).__name__))
@@ -0,0 +1,538 @@
+"""
+This script implements the k-means clustering algorithm from scratch, without using any libraries that provide k-means functionality. It is used to find 'k' centroids in a given multi-dimensional feature space.
+
+The algorithm uses the Manhattan distance as the distance metric by default and follows these steps:
+1. Initialize 'k' centroids at random positions (or with k-means++ seeding).
+2. Assign each point in the feature space to the closest centroid.
+3. Update the position of each centroid to be the mean of the points assigned to it.
+4. Repeat steps 2 and 3 until the centroids stop moving or a maximum number of iterations is reached.
+
+The script includes a class 'KMeans' which stores the features and centroids as NumPy arrays and computes
+the assignment step for all points at once. It supports k-means++ seeding, early stopping once the centroids
+move less than a tolerance, a mini-batch mode (Sculley, 2010) for very large datasets, and splitting the
+assignment step across a process pool. With n_jobs > 1 the points are copied into shared memory once per fit, and
+every assignment step only sends the workers the centroids and the rows to assign. 'get_k_means' is a thin wrapper
+around it for a user -> features map.
+
+The metric can be "manhattan", "euclidean" or "cosine", with the same definitions as the 'Metrics' class of
+mathematical_concepts/distance_metrics.py. By default the full-batch iterations use Hamerly's triangle inequality
+bounds (algorithm="hamerly", or "elkan" for Elkan's per-centroid bounds, which skip more distances for large k at
+the cost of a points x k bounds matrix), so after the first iteration only the points near a cluster boundary are
+measured again. The centroid update sums every cluster in a single bincount pass.
+
+With instrumentation=Instrumentation() (see model_concepts/instrumentation.py) every iteration emits a
+"k_means.iteration" event with the inertia, the number of reassigned points and the distances computed so far, and
+the time spent in the assignment and update steps is recorded.
+
+A fitted 'KMeans' is saved with save(path) and loaded with KMeans.load(path), which memory-maps the centroids
+(see model_concepts/persistence.py).
+
+Three test cases are also provided to validate the functionality of the algorithm.
+"""
+
+
+import contextlib
+import itertools
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+# Number of elements in the points x centroids blocks the distances are accumulated in (512 KB of float64)
+_CACHE_BLOCK_ELEMENTS = 2 ** 16
+
+
+def manhattan_distances(features, centroids):
+    # Distances between every point and every centroid, accumulated one feature at a time
+    # over blocks of points so no points x centroids x features array is ever built
+    return _accumulated_distances(features, centroids, squared=False)
+
+
+def euclidean_distances(features, centroids):
+    # Accumulated feature by feature like the manhattan distances (rather than with ||x||^2 + ||c||^2 - 2 x.c),
+    # so they round exactly like paired_distances and the bounds of KMeans resolve ties like a full pass
+    return np.sqrt(_accumulated_distances(features, centroids, squared=True))
+
+
+def _accumulated_distances(features, centroids, squared):
+    # Blocks of points small enough for the differences to stay in cache, updated in place
+    distances = np.zeros((features.shape[0], centroids.shape[0]))
+    block_size = max(1, _CACHE_BLOCK_ELEMENTS // max(1, centroids.shape[0]))
+    differences = np.empty((min(block_size, features.shape[0]), centroids.shape[0]))
+    for start in range(0, features.shape[0], block_size):
+        block = distances[start:start + block_size]
+        scratch = differences[:len(block)]
+        for i in range(features.shape[1]):
+            np.subtract(features[start:start + block_size, i, None], centroids[None, :, i], out=scratch)
+            if squared:
+                np.square(scratch, out=scratch)
+            else:
+                np.abs(scratch, out=scratch)
+            block += scratch
+    return distances
+
+
+def unit_vectors(features):
+    # Rows scaled to a norm of 1, zero rows stay at the origin. The euclidean distance between unit vectors is
+    # sqrt(2 - 2 cos), which orders centroids like the cosine distance but also satisfies the triangle inequality.
+    norms = np.sqrt((features ** 2).sum(axis=1))[:, None]
+    return np.divide(features, norms, out=np.zeros_like(features), where=norms != 0)
+
+
+# The same definitions as the Metrics class of mathematical_concepts/distance_metrics.py. Cosine distances are
+# computed as euclidean distances between unit vectors, see unit_vectors.
+_METRIC_DISTANCES = {
+    "manhattan": manhattan_distances,
+    "euclidean": euclidean_distances,
+    "cosine": euclidean_distances,
+}
+
+
+def _check_metric(metric):
+    if metric not in _METRIC_DISTANCES:
+        raise ValueError("Unknown metric '{}', expected one of {}".format(metric, sorted(_METRIC_DISTANCES)))
+
+
+def _prepare(features, metric):
+    return unit_vectors(features) if metric == "cosine" else features
+
+
+def pairwise_distances(features, centroids, metric="manhattan"):
+    _check_metric(metric)
+    return _METRIC_DISTANCES[metric](_prepare(features, metric), _prepare(centroids, metric))
+
+
+def paired_distances(features, centroids, metric="manhattan"):
+    # Distances between features[i] and centroids[i], both already prepared for the metric,
+    # summed in the same order as the pairwise distances
+    distances = np.zeros(features.shape[0])
+    for i in range(features.shape[1]):
+        differences = features[:, i] - centroids[:, i]
+        distances += np.abs(differences) if metric == "manhattan" else differences ** 2
+    return distances if metric == "manhattan" else np.sqrt(distances)
+
+
+def assign_to_centroids(features, centroids, metric="manhattan"):
+    # Index of the closest centroid for every point (ties go to the first centroid)
+    return pairwise_distances(features, centroids, metric).argmin(axis=1)
+
+
+def _closest_centroids(features, centroids, metric):
+    # assign_to_centroids for features and centroids already prepared for the metric
+    return _METRIC_DISTANCES[metric](features, centroids).argmin(axis=1)
+
+
+def nearest_two(features, centroids, metric="manhattan"):
+    # Closest centroid of every point with its distance, and the distance to the second closest centroid.
+    # features and centroids are already prepared for the metric.
+    distances = _METRIC_DISTANCES[metric](features, centroids)
+    labels = distances.argmin(axis=1)
+    rows = np.arange(len(labels))
+    closest = distances[rows, labels]
+    if centroids.shape[0] == 1:
+        return labels, closest, np.full(len(labels), np.inf)
+    distances[rows, labels] = np.inf
+    return labels, closest, distances.min(axis=1)
+
+
+def cluster_sums(features, labels, k):
+    # Per-cluster feature sums and point counts in a single bincount pass over the flattened features
+    num_features = features.shape[1]
+    bins = (labels[:, None] * num_features + np.arange(num_features)).ravel()
+    sums = np.bincount(bins, weights=features.ravel(), minlength=k * num_features).reshape(k, num_features)
+    return sums, np.bincount(labels, minlength=k)
+
+
+class KMeans:
+    def __init__(self, k, max_iterations=100, tolerance=1e-4, init="k-means++", metric="manhattan",
+                 algorithm="hamerly", batch_size=None, n_jobs=1, seed=42, instrumentation=None):
+        _check_metric(metric)
+        if algorithm not in ("lloyd", "hamerly", "elkan"):
+            raise ValueError("Unknown algorithm '{}', expected 'lloyd', 'hamerly' or 'elkan'".format(algorithm))
+        self.k = k
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.init = init
+        self.metric = metric
+        self.algorithm = algorithm
+        self.batch_size = batch_size
+        self.n_jobs = n_jobs
+        self.seed = seed
+        # Optional model_concepts.instrumentation.Instrumentation receiving an event per iteration
+        self.instrumentation = instrumentation
+        self.centroids = None
+        self.labels = None
+        self.n_iterations = 0
+        # Number of point to centroid distances computed by the assignment steps of the last fit
+        self.n_distance_evaluations = 0
+
+    def fit(self, features):
+        started_at = time.perf_counter()
+        features = np.asarray(features, dtype=np.float64)
+        # Points in the space the distances are computed in (unit vectors for the cosine metric)
+        points = _prepare(features, self.metric)
+        rng = np.random.default_rng(self.seed)
+        with self._timer("k_means.init"):
+            self.centroids = self._initial_centroids(features, points, rng)
+        self.n_distance_evaluations = 0
+
+        shared, pool = None, None
+        try:
+            if self.n_jobs > 1:
+                from ..shared_memory import SharedArrays
+
+                # The workers map the points once, the jobs of an iteration only carry rows and centroids
+                shared = SharedArrays()
+                shared.add("points", points)
+                pool = ProcessPoolExecutor(self.n_jobs, initializer=_attach_points, initargs=(shared.descriptions,))
+            if self.batch_size is not None:
+                self._fit_mini_batch(features, points, rng, pool)
+                self.labels = self._assign(points, pool)
+            elif self.algorithm == "lloyd":
+                self._fit_full_batch(features, points, pool)
+                self.labels = self._assign(points, pool)
+            else:
+                self._fit_bounded(features, points, pool)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if shared is not None:
+                shared.close()
+        if self.instrumentation is not None:
+            self.instrumentation.emit("k_means.fit", k=self.k, n_points=len(features), n_iterations=self.n_iterations,
+                                      distance_evaluations=self.n_distance_evaluations,
+                                      seconds=time.perf_counter() - started_at)
+        return self
+
+    def predict(self, features):
+        return assign_to_centroids(np.asarray(features, dtype=np.float64), self.centroids, self.metric)
+
+    def save(self, path):
+        # Saves the centroids and settings in the model format of model_concepts/persistence.py
+        from ..persistence import save_model
+
+        arrays = {"centroids": self.centroids}
+        if not isinstance(self.init, str):
+            arrays["initial_centroids"] = np.asarray(self.init, dtype=np.float64)
+        metadata = {name: getattr(self, name) for name in (
+            "k", "max_iterations", "tolerance", "metric", "algorithm", "batch_size", "n_jobs", "seed", "n_iterations")}
+        metadata["init"] = self.init if isinstance(self.init, str) else None
+        return save_model(path, "KMeans", arrays, metadata)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        from ..persistence import load_model
+
+        arrays, metadata = load_model(path, "KMeans", mmap_mode)
+        n_iterations = metadata.pop("n_iterations")
+        if metadata["init"] is None:
+            metadata["init"] = arrays["initial_centroids"]
+        k_means = cls(**metadata)
+        k_means.centroids = arrays["centroids"]
+        k_means.n_iterations = n_iterations
+        return k_means
+
+    def _initial_centroids(self, features, points, rng):
+        if not isinstance(self.init, str):
+            return np.array(self.init, dtype=np.float64)
+        if self.init == "random":
+            return features[rng.choice(features.shape[0], self.k, replace=False)].copy()
+        if self.init != "k-means++":
+            raise ValueError("Unknown init '{}'".format(self.init))
+
+        # k-means++: pick each next centroid with probability proportional to the
+        # squared distance from a point to its closest centroid chosen so far
+        distances = _METRIC_DISTANCES[self.metric]
+        indices = [rng.integers(features.shape[0])]
+        closest = distances(points, points[indices[0]][None, :])[:, 0]
+        for _ in range(1, self.k):
+            weights = closest ** 2
+            total = weights.sum()
+            if total == 0:
+                index = rng.integers(features.shape[0])
+            else:
+                index = rng.choice(features.shape[0], p=weights / total)
+            indices.append(index)
+            closest = np.minimum(closest, distances(points, points[index][None, :])[:, 0])
+        return features[indices].copy()
+
+    def _fit_full_batch(self, features, points, pool):
+        labels = None
+        for iteration in range(self.max_iterations):
+            started_at = time.perf_counter()
+            with self._timer("k_means.assign"):
+                new_labels = self._assign(points, pool)
+            self._report_iteration(iteration, points, new_labels, labels, started_at)
+            with self._timer("k_means.update"):
+                new_centroids = self._updated_centroids(features, new_labels)
+            shift = self._shifts(new_centroids).max()
+            self.centroids = new_centroids
+            self.n_iterations = iteration + 1
+
+            if shift <= self.tolerance or (labels is not None and np.array_equal(labels, new_labels)):
+                break
+            labels = new_labels
+
+    def _fit_bounded(self, features, points, pool):
+        # Lloyd's iterations with the triangle inequality bounds of Hamerly (2010) or Elkan (2003). Every point keeps
+        # an upper bound on the distance to its centroid and lower bounds on the distances to the other centroids
+        # (one for all of them with Hamerly, one per centroid with Elkan). Only the points whose bounds overlap
+        # are measured again, and the assignments are the same as with full passes.
+        started_at = time.perf_counter()
+        centroids = _prepare(self.centroids, self.metric)
+        with self._timer("k_means.assign"):
+            if self.algorithm == "hamerly":
+                labels, upper, lower = self._nearest_two(points, centroids, pool)
+            else:
+                lower = self._all_distances(points, centroids, pool)
+                labels = lower.argmin(axis=1)
+                upper = lower[np.arange(len(labels)), labels]
+        self._report_iteration(0, points, labels, None, started_at)
+
+        for iteration in range(self.max_iterations):
+            started_at = time.perf_counter()
+            with self._timer("k_means.update"):
+                new_centroids = self._updated_centroids(features, labels)
+            shifts = self._shifts(new_centroids)
+            self.centroids = new_centroids
+            self.n_iterations = iteration + 1
+            centroids = _prepare(self.centroids, self.metric)
+
+            # Moving a centroid moves the distances to it by at most its shift
+            upper += shifts[labels]
+            with self._timer("k_means.assign"):
+                if self.algorithm == "hamerly":
+                    lower -= self._largest_other_shift(shifts, labels)
+                    new_labels = self._hamerly_step(points, centroids, labels.copy(), upper, lower, pool)
+                else:
+                    lower -= shifts[None, :]
+                    new_labels = self._elkan_step(points, centroids, labels.copy(), upper, lower)
+            self._report_iteration(iteration + 1, points, new_labels, labels, started_at)
+
+            converged = shifts.max() <= self.tolerance or np.array_equal(labels, new_labels)
+            labels = new_labels
+            if converged:
+                break
+        self.labels = labels
+
+    def _hamerly_step(self, points, centroids, labels, upper, lower, pool):
+        # A point keeps its centroid while its upper bound is below both its lower bound and half the distance
+        # from its centroid to the closest other centroid
+        bound = np.maximum(self._half_gaps(centroids)[labels], lower)
+        candidates = np.flatnonzero(upper >= bound)
+        upper[candidates] = paired_distances(points[candidates], centroids[labels[candidates]], self.metric)
+        self.n_distance_evaluations += len(candidates)
+        candidates = candidates[upper[candidates] >= bound[candidates]]
+        if len(candidates):
+            labels[candidates], upper[candidates], lower[candidates] = self._nearest_two(
+                points, centroids, pool, candidates)
+        return labels
+
+    def _elkan_step(self, points, centroids, labels, upper, lower):
+        centroid_distances = _METRIC_DISTANCES[self.metric](centroids, centroids)
+        np.fill_diagonal(centroid_distances, np.inf)
+        candidates = np.flatnonzero(upper >= centroid_distances.min(axis=1)[labels] / 2)
+        block_size = max(1, _CACHE_BLOCK_ELEMENTS // max(1, self.k))
+        for start in range(0, len(candidates), block_size):
+            block = candidates[start:start + block_size]
+            block_labels = labels[block]
+            upper[block] = paired_distances(points[block], centroids[block_labels], self.metric)
+            lower[block, block_labels] = upper[block]
+            self.n_distance_evaluations += len(block)
+
+            # Only the centroids that could be closer than the current one, by either bound, are measured
+            measure = (upper[block, None] >= lower[block]) & \
+                (upper[block, None] >= centroid_distances[block_labels] / 2)
+            rows, columns = np.nonzero(measure)
+            lower[block[rows], columns] = paired_distances(points[block[rows]], centroids[columns], self.metric)
+            self.n_distance_evaluations += len(rows)
+
+            # Ties go to the first centroid as in a full pass, every tied centroid has been measured
+            distances = np.full((len(block), self.k), np.inf)
+            distances[np.arange(len(block)), block_labels] = upper[block]
+            distances[rows, columns] = lower[block[rows], columns]
+            labels[block] = distances.argmin(axis=1)
+            upper[block] = distances[np.arange(len(block)), labels[block]]
+        return labels
+
+    def _half_gaps(self, centroids):
+        # Half the distance from every centroid to its closest other centroid
+        if self.k == 1:
+            return np.full(1, np.inf)
+        centroid_distances = _METRIC_DISTANCES[self.metric](centroids, centroids)
+        np.fill_diagonal(centroid_distances, np.inf)
+        return centroid_distances.min(axis=1) / 2
+
+    @staticmethod
+    def _largest_other_shift(shifts, labels):
+        # Largest shift of a centroid other than the one each point is assigned to
+        if len(shifts) == 1:
+            return np.zeros(len(labels))
+        largest, second = np.argsort(shifts)[::-1][:2]
+        return np.where(labels == largest, shifts[second], shifts[largest])
+
+    def _fit_mini_batch(self, features, points, rng, pool):
+        counts = np.zeros(self.k)
+        for iteration in range(self.max_iterations):
+            started_at = time.perf_counter()
+            batch = rng.choice(features.shape[0], min(self.batch_size, features.shape[0]), replace=False)
+            with self._timer("k_means.assign"):
+                batch_labels = self._assign(points, pool, batch)
+            self._report_iteration(iteration, points[batch], batch_labels, None, started_at)
+
+            # Per-centroid learning rate 1 / count, applied to the whole batch at once
+            sums, batch_counts = cluster_sums(features[batch], batch_labels, self.k)
+            new_counts = counts + batch_counts
+
+            new_centroids = self.centroids.copy()
+            updated = batch_counts > 0
+            new_centroids[updated] = (self.centroids[updated] * counts[updated, None] +
+                                      sums[updated]) / new_counts[updated, None]
+            shift = self._shifts(new_centroids).max()
+            self.centroids = new_centroids
+            counts = new_counts
+            self.n_iterations = iteration + 1
+
+            if shift <= self.tolerance:
+                break
+
+    def _timer(self, name):
+        if self.instrumentation is None:
+            return contextlib.nullcontext()
+        return self.instrumentation.timer(name)
+
+    def _report_iteration(self, iteration, points, labels, previous_labels, started_at):
+        # Event with the inertia (sum of the distances from the points to the centroids they were assigned to)
+        # and the number of points that changed cluster. Only computed when instrumented.
+        if self.instrumentation is None:
+            return
+        centroids = _prepare(self.centroids, self.metric)
+        inertia = paired_distances(points, centroids[labels], self.metric).sum()
+        reassignments = len(labels) if previous_labels is None else np.count_nonzero(labels != previous_labels)
+        self.instrumentation.count("k_means.reassignments", reassignments)
+        self.instrumentation.emit("k_means.iteration", iteration=iteration, inertia=float(inertia),
+                                  reassignments=int(reassignments), distance_evaluations=self.n_distance_evaluations,
+                                  seconds=time.perf_counter() - started_at)
+
+    def _updated_centroids(self, features, labels):
+        # Mean of the points of every cluster, empty clusters keep their centroid
+        sums, counts = cluster_sums(features, labels, self.k)
+        new_centroids = self.centroids.copy()
+        non_empty = counts > 0
+        new_centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+        return new_centroids
+
+    def _shifts(self, new_centroids):
+        # Distance every centroid moved, in the space of the metric
+        return paired_distances(_prepare(new_centroids, self.metric), _prepare(self.centroids, self.metric),
+                                self.metric)
+
+    # The assignment helpers take all the points of the fit and optional `rows` to restrict them to, so the pool
+    # workers can read the rows from their shared copy of the points
+
+    def _assign(self, points, pool, rows=None):
+        centroids = _prepare(self.centroids, self.metric)
+        n_rows = len(points) if rows is None else len(rows)
+        self.n_distance_evaluations += n_rows * self.k
+        if pool is None:
+            return _closest_centroids(points if rows is None else points[rows], centroids, self.metric)
+        return np.concatenate(self._map_rows(pool, _closest_centroids, len(points), rows, centroids, self.metric))
+
+    def _nearest_two(self, points, centroids, pool, rows=None):
+        n_rows = len(points) if rows is None else len(rows)
+        self.n_distance_evaluations += n_rows * self.k
+        if pool is None or n_rows < self.n_jobs:
+            return nearest_two(points if rows is None else points[rows], centroids, self.metric)
+        results = self._map_rows(pool, nearest_two, len(points), rows, centroids, self.metric)
+        return tuple(np.concatenate(parts) for parts in zip(*results))
+
+    def _all_distances(self, points, centroids, pool):
+        self.n_distance_evaluations += len(points) * self.k
+        distances = _METRIC_DISTANCES[self.metric]
+        if pool is None:
+            return distances(points, centroids)
+        return np.concatenate(self._map_rows(pool, distances, len(points), None, centroids))
+
+    def _map_rows(self, pool, function, n_points, rows, *args):
+        # One job per worker: a slice of the points, or a chunk of the row positions, and the other arguments
+        if rows is None:
+            bounds = np.linspace(0, n_points, self.n_jobs + 1).astype(np.int64).tolist()
+            chunks = [slice(start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+        else:
+            chunks = np.array_split(rows, self.n_jobs)
+        return list(pool.map(_on_worker_rows, itertools.repeat(function), chunks,
+                             *[itertools.repeat(argument) for argument in args]))
+
+
+# Points of a pool worker, attached to the shared memory block of the fit by _attach_points
+_worker_points = None
+_worker_blocks = []
+
+
+def _attach_points(descriptions):
+    from ..shared_memory import attach_shared_arrays
+
+    global _worker_points, _worker_blocks
+    arrays, _worker_blocks = attach_shared_arrays(descriptions)
+    _worker_points = arrays["points"]
+
+
+def _on_worker_rows(function, rows, *args):
+    return function(_worker_points[rows], *args)
+
+
+def get_k_means(user_feature_map, num_features_per_user, k, instrumentation=None):
+    random.seed(42)
+    # Initialize centroids
+    initial_centroid_users = random.sample(
+        sorted(list(user_feature_map.keys())), k)
+    initial_centroids = [user_feature_map[user_id][:num_features_per_user]
+                         for user_id in initial_centroid_users]
+
+    features = [features[:num_features_per_user]
+                for features in user_feature_map.values()]
+    k_means = KMeans(k, max_iterations=10, tolerance=0,
+                     init=initial_centroids, instrumentation=instrumentation).fit(features)
+    return k_means.centroids.tolist()
+
+
+def test():
+    # Test case 1
+    user_feature_map1 = {
+        "uid_1": [1, 2],
+        "uid_2": [2, 3],
+        "uid_3": [3, 4]
+    }
+    print(get_k_means(user_feature_map1, 2, 1))  # Expected output: [[2.0, 3.0]]
+
+    # Test case 2
+    user_feature_map2 = {
+        "uid_1": [1, 1],
+        "uid_2": [2, 2],
+        "uid_3": [5, 5],
+        "uid_4": [6, 6]
+    }
+    # Expected output (order may vary): [[1.5, 1.5], [5.5, 5.5]]
+    print(get_k_means(user_feature_map2, 2, 2))
+
+    # Test case 3
+    user_feature_map3 = {
+        "uid_1": [1, 2, 3, 4, 5],
+        "uid_2": [2, 3, 4, 5, 6],
+        "uid_3": [3, 4, 5, 6, 7],
+        "uid_4": [4, 5, 6, 7, 8],
+        "uid_5": [10, 11, 12, 13, 14],
+        "uid_6": [11, 12, 13, 14, 15],
+        "uid_7": [12, 13, 14, 15, 16],
+        "uid_8": [13, 14, 15, 16, 17],
+        "uid_9": [20, 21, 22, 23, 24],
+        "uid_10": [21, 22, 23, 24, 25]
+    }
+
+    print(get_k_means(user_feature_map3, 5, 3))
+
+
+if __name__ == "__main__":
+    test()
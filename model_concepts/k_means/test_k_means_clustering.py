@@ -0,0 +1,97 @@
+import random
+
+import numpy as np
+import pytest
+
+from model_concepts.k_means.k_means_clustering import KMeans, assign_to_centroids, get_k_means
+
+
+def baseline_get_k_means(user_feature_map, num_features_per_user, k):
+    # The original pure Python implementation: 10 Lloyd iterations with the manhattan distance
+    random.seed(42)
+    initial_users = random.sample(sorted(list(user_feature_map.keys())), k)
+    locations = [user_feature_map[user_id] for user_id in initial_users]
+    for _ in range(10):
+        closest_users = [set() for _ in locations]
+        for user_id, features in user_feature_map.items():
+            closest = min(range(len(locations)),
+                          key=lambda c: sum(abs(a - b) for a, b in zip(locations[c], features)))
+            closest_users[closest].add(user_id)
+        locations = [[sum(user_feature_map[user_id][i] for user_id in users) / len(users)
+                      for i in range(num_features_per_user)] for users in closest_users]
+    return locations
+
+
+def clustered_points(n_per_cluster=300, n_clusters=6, n_features=4, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 6, (n_clusters, n_features))
+    return np.vstack([rng.normal(center, 1, (n_per_cluster, n_features)) for center in centers])
+
+
+def test_get_k_means_matches_baseline():
+    rng = np.random.default_rng(3)
+    points = np.vstack([rng.normal(center, 0.5, (15, 3)) for center in ([0, 0, 0], [10, 10, 10], [-10, 5, 0])])
+    user_feature_map = {"uid_{}".format(i): point.tolist() for i, point in enumerate(points)}
+    expected = baseline_get_k_means(user_feature_map, 3, 3)
+    np.testing.assert_allclose(get_k_means(user_feature_map, 3, 3), expected, rtol=1e-12)
+
+
+def test_get_k_means_small_cases():
+    assert get_k_means({"uid_1": [1, 2], "uid_2": [2, 3], "uid_3": [3, 4]}, 2, 1) == [[2.0, 3.0]]
+    centroids = get_k_means({"uid_1": [1, 1], "uid_2": [2, 2], "uid_3": [5, 5], "uid_4": [6, 6]}, 2, 2)
+    assert sorted(centroids) == [[1.5, 1.5], [5.5, 5.5]]
+
+
+def test_labels_are_the_closest_centroids():
+    points = clustered_points()
+    k_means = KMeans(6, metric="euclidean").fit(points)
+    np.testing.assert_array_equal(k_means.labels, assign_to_centroids(points, k_means.centroids, "euclidean"))
+    np.testing.assert_array_equal(k_means.predict(points[:10]), k_means.labels[:10])
+
+
+def test_mini_batch_finds_the_clusters():
+    points = clustered_points()
+    full = KMeans(6, metric="euclidean").fit(points)
+    mini_batch = KMeans(6, metric="euclidean", batch_size=256, max_iterations=300, tolerance=0).fit(points)
+    # Same partition up to the order of the clusters
+    pairs = set(zip(full.labels.tolist(), mini_batch.labels.tolist()))
+    assert len(pairs) <= 6 + len(points) // 100
+
+
+@pytest.mark.parametrize("options", [{"algorithm": "lloyd"}, {"algorithm": "hamerly"}, {"batch_size": 200}])
+def test_process_pool_gives_the_same_result(options):
+    points = clustered_points(n_per_cluster=200)
+    serial = KMeans(6, **options).fit(points)
+    parallel = KMeans(6, n_jobs=2, **options).fit(points)
+    np.testing.assert_array_equal(serial.labels, parallel.labels)
+    np.testing.assert_array_equal(serial.centroids, parallel.centroids)
+
+
+def test_save_and_load(tmp_path):
+    points = clustered_points(n_per_cluster=50)
+    k_means = KMeans(6).fit(points)
+    k_means.save(str(tmp_path / "k_means"))
+    loaded = KMeans.load(str(tmp_path / "k_means"))
+    np.testing.assert_array_equal(loaded.centroids, k_means.centroids)
+    np.testing.assert_array_equal(loaded.predict(points), k_means.labels)
+
+
+@pytest.mark.parametrize("metric", ["manhattan", "euclidean", "cosine"])
+@pytest.mark.parametrize("algorithm", ["hamerly", "elkan"])
+def test_bounds_give_the_same_assignments_as_full_passes(metric, algorithm):
+    # Hamerly and Elkan skip distances with triangle inequality bounds, the iterations must not change
+    points = clustered_points(n_per_cluster=150, n_clusters=8, seed=1)
+    lloyd = KMeans(8, metric=metric, algorithm="lloyd", tolerance=0, max_iterations=30).fit(points)
+    bounded = KMeans(8, metric=metric, algorithm=algorithm, tolerance=0, max_iterations=30).fit(points)
+    np.testing.assert_array_equal(bounded.labels, lloyd.labels)
+    np.testing.assert_allclose(bounded.centroids, lloyd.centroids, rtol=1e-12, atol=1e-12)
+    assert bounded.n_distance_evaluations < lloyd.n_distance_evaluations
+
+
+def test_ties_go_to_the_first_centroid():
+    points = np.array([[0.0, 0.0], [2.0, 0.0], [1.0, 0.0]])
+    for algorithm in ("lloyd", "hamerly", "elkan"):
+        # No iterations, so the labels are the assignment to the initial centroids
+        k_means = KMeans(2, init=[[0.0, 0.0], [2.0, 0.0]], algorithm=algorithm, max_iterations=0,
+                         metric="euclidean").fit(points)
+        assert k_means.labels.tolist() == [0, 1, 0]
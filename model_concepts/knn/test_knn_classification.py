@@ -0,0 +1,109 @@
+import math
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from model_concepts.knn.knn_classification import (KNNIndex, LSHIndex, MinHashIndex, find_k_nearest_neighbors,
+                                                  predict_label, recall_report)
+
+
+def baseline_k_nearest_neighbors(examples, features, k):
+    # The original full sort of the distances to every example
+    distances = [(pid, math.sqrt(sum((a - b) ** 2 for a, b in zip(features, example["features"]))))
+                 for pid, example in examples.items()]
+    distances.sort(key=lambda x: x[1])
+    return [pid for pid, _ in distances[:k]]
+
+
+def make_examples(n_examples, n_features, seed, integer=False):
+    rng = np.random.default_rng(seed)
+    points = rng.integers(0, 4, (n_examples, n_features)) if integer else rng.normal(0, 1, (n_examples, n_features))
+    return {"pid_{}".format(i): {"features": point.tolist(), "is_intrusive": int(rng.integers(0, 2))}
+            for i, point in enumerate(points)}
+
+
+@pytest.mark.parametrize("tree", ["kd", "ball"])
+@pytest.mark.parametrize("integer", [False, True])
+def test_index_matches_brute_force(tree, integer):
+    # Integer features have many equal distances, which must be broken like the stable sort of the baseline
+    examples = make_examples(500, 3 if tree == "kd" else 24, seed=0, integer=integer)
+    index = KNNIndex(examples, tree=tree, leaf_size=8)
+    queries = make_examples(40, 3 if tree == "kd" else 24, seed=1, integer=integer)
+    for k in (1, 5, 17):
+        for query in queries.values():
+            expected = baseline_k_nearest_neighbors(examples, query["features"], k)
+            assert index.query(query["features"], k) == expected
+            assert find_k_nearest_neighbors(examples, query["features"], k) == expected
+
+
+def test_predict_labels_matches_predict_label():
+    examples = make_examples(300, 4, seed=2)
+    queries = [query["features"] for query in make_examples(50, 4, seed=3).values()]
+    index = KNNIndex(examples)
+    assert index.predict_labels(queries, 7) == [predict_label(examples, query, 7) for query in queries]
+
+
+def test_k_larger_than_the_examples():
+    examples = make_examples(5, 2, seed=4)
+    assert KNNIndex(examples).query([0, 0], 10) == baseline_k_nearest_neighbors(examples, [0, 0], 10)
+
+
+@pytest.mark.parametrize("k", [0, -1])
+def test_non_positive_k_returns_nothing(k):
+    assert KNNIndex(make_examples(50, 2, seed=5)).query([0, 0], k) == []
+
+
+def clustered_examples(n_clusters=200, per_cluster=10, n_features=32, seed=6):
+    # Near duplicates: the 10 nearest neighbors of a query are the examples of its cluster
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 1, (n_clusters, n_features))
+    points = np.repeat(centers, per_cluster, axis=0) + rng.normal(0, 0.05, (n_clusters * per_cluster, n_features))
+    examples = {i: {"features": point.tolist(), "is_intrusive": i % 2} for i, point in enumerate(points)}
+    queries = (centers[:50] + rng.normal(0, 0.05, centers[:50].shape)).tolist()
+    return examples, queries
+
+
+@pytest.mark.parametrize("metric", ["euclidean", "cosine"])
+def test_lsh_recall_on_near_duplicates(metric):
+    examples, queries = clustered_examples()
+    index = LSHIndex(examples, metric=metric)
+    assert recall_report(index, queries, 10)["recall"] >= 0.95
+    if metric == "euclidean":
+        for query in queries[:5]:
+            assert index.exact_query(query, 10) == baseline_k_nearest_neighbors(examples, query, 10)
+
+
+def test_minhash_finds_similar_sets():
+    rng = np.random.default_rng(7)
+    sets = {}
+    for group in range(30):
+        words = ["w{}".format(word) for word in rng.choice(10000, 40, replace=False)]
+        for member in range(3):
+            sets["s{}_{}".format(group, member)] = set(words[member:member + 37])
+    index = MinHashIndex(sets)
+    queries = [sets["s{}_0".format(group)] for group in range(30)]
+    assert recall_report(index, queries, 3)["recall"] >= 0.95
+
+
+def test_minhash_signatures_do_not_depend_on_the_process():
+    # The built-in hash() of str is salted per process, the signatures must not be
+    code = ("from model_concepts.knn.knn_classification import MinHashIndex; "
+            "print(MinHashIndex({'a': {'x', 'y'}}, num_permutations=8, num_bands=4).signatures.tolist())")
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    outputs = {subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True,
+                              env=dict(os.environ, PYTHONHASHSEED=seed)).stdout
+               for seed in ("1", "2")}
+    assert len(outputs) == 1
+
+
+@pytest.mark.parametrize("k", [0, -1])
+def test_approximate_indexes_return_nothing_for_non_positive_k(k):
+    examples, queries = clustered_examples(n_clusters=10)
+    assert LSHIndex(examples).query(queries[0], k) == []
+    assert LSHIndex(examples).exact_query(queries[0], k) == []
+    index = MinHashIndex({"a": {1, 2, 3}, "b": {1, 2}, "c": {3}})
+    assert index.query({1, 2}, k) == []
+    assert index.exact_query({1, 2}, k) == []
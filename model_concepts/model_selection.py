@@ -0,0 +1,430 @@
+"""
+Cross-validation and hyperparameter search for the from-scratch models.
+
+A search task holds the data of one model type as NumPy arrays and knows how to fit and score one set of parameters
+on one fold:
+- `KNNTask` tunes `k` of `predict_label` (accuracy);
+- `RegressionTreeTask` tunes `max_depth`, `min_samples_leaf`, `split_method` and `max_bins` of `RegressionTree`
+  (negative MSE);
+- `NeuronTask` tunes `lr`, `mini_batch_size` and `n_epochs` of `Neuron.perform_training` (negative log loss);
+- `MultinomialNBTask` tunes `alpha` of `MultinomialNB` (accuracy).
+
+`HyperparameterSearch` evaluates candidates with k-fold cross-validation, exhaustively (`grid`), on random samples of
+the parameters (`random`) or with successive halving (`successive_halving`), which scores every candidate on a small
+budget (a fraction of the training rows, or of the epochs for the neuron) and only keeps the best `1 / factor` of them
+for the next, `factor` times larger, budget.
+
+With `n_jobs > 1` every (candidate, fold) pair is a job for a process pool. The arrays of the task are placed in
+`multiprocessing.shared_memory` once per search (see model_concepts/shared_memory.py), and the workers attach to them
+instead of receiving a pickled copy of the data with every job. Work that only depends on the folds is done once and shared by all the candidates: the
+sorted feature orders of the regression tree (every fold restricts the full orders to its rows without sorting again),
+the nearest neighbors of every held-out example up to the largest `k` (computed by one job per fold, written to
+shared memory, after which scoring a `k` is a vote over a slice) and the word counts of every naive Bayes fold (kept
+by each worker, so changing `alpha` only recomputes the log-likelihoods).
+
+Usage:
+    search = HyperparameterSearch(RegressionTreeTask(examples), n_folds=5, n_jobs=-1)
+    results = search.grid({"max_depth": [4, 6, 8, None], "min_samples_leaf": [1, 5, 20]})
+    print(search.best_params, results[0]["mean_score"])
+"""
+
+import itertools
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .shared_memory import SharedArrays, attach_shared_arrays
+
+
+def k_fold(n_examples, n_folds=5, shuffle=True, seed=42):
+    # Fold of every example, with fold sizes differing by at most one
+    folds = np.arange(n_examples) % n_folds
+    if shuffle:
+        np.random.default_rng(seed).shuffle(folds)
+    return folds
+
+
+def parameter_grid(grid):
+    # Every combination of the values in a dict of parameter name -> list of values
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def random_parameters(distributions, n_trials, seed=42):
+    # A value of a distribution is drawn uniformly from a list, or by calling it with a np.random.Generator,
+    # e.g. {"lr": lambda rng: 10 ** rng.uniform(-3, 0), "mini_batch_size": [10, 32, 128]}
+    rng = np.random.default_rng(seed)
+    candidates = []
+    for _ in range(n_trials):
+        candidates.append({name: distribution(rng) if callable(distribution)
+                           else distribution[rng.integers(len(distribution))]
+                           for name, distribution in distributions.items()})
+    return candidates
+
+
+class _SearchTask:
+    # Tasks keep their data in `arrays`, which is left out when a task is pickled for the workers:
+    # they read the arrays from shared memory instead
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["arrays"] = None
+        return state
+
+    def precomputed_arrays(self, candidates):
+        # name -> (shape, dtype) of the arrays precompute fills in for every fold
+        return {}
+
+    def precompute(self, arrays, train, test, candidates):
+        pass
+
+    def budget_rows(self, train, budget, fold):
+        # The same random subset of the training rows for every candidate of a fold
+        if budget >= 1:
+            return train
+        n_rows = max(1, int(round(budget * len(train))))
+        rng = np.random.default_rng([self.seed, fold])
+        return np.sort(rng.choice(train, n_rows, replace=False))
+
+
+class KNNTask(_SearchTask):
+    score_name = "accuracy"
+
+    def __init__(self, examples, label_key="is_intrusive", seed=42):
+        # examples is the pid -> {"features": [...], label_key: 0 or 1} dict of predict_label
+        self.seed = seed
+        self.arrays = {
+            "X": np.array([example["features"] for example in examples.values()], dtype=np.float64),
+            "y": np.array([example[label_key] for example in examples.values()], dtype=np.int64),
+        }
+        self.n_examples = len(self.arrays["y"])
+
+    def precomputed_arrays(self, candidates):
+        # Positions of the nearest training examples of every example, within the training rows of its fold
+        max_k = max(candidate["k"] for candidate in candidates)
+        return {"neighbors": ((len(self.arrays["y"]), max_k), np.int64)}
+
+    def precompute(self, arrays, train, test, candidates, block_size=256):
+        X, neighbors = arrays["X"], arrays["neighbors"]
+        max_k = min(neighbors.shape[1], len(train))
+        training_points = X[train]
+        for start in range(0, len(test), block_size):
+            rows = test[start: start + block_size]
+            # Summed one feature at a time, in the order of euclidean_distance, without a 3-d temporary
+            distances = np.zeros((len(rows), len(train)))
+            for feature in range(X.shape[1]):
+                distances += (X[rows, feature, None] - training_points[None, :, feature]) ** 2
+            np.sqrt(distances, out=distances)
+            # A stable sort breaks ties by position, like the heap of find_k_nearest_neighbors
+            order = np.argsort(distances, axis=1, kind="stable")[:, :max_k]
+            neighbors[rows, :max_k] = train[order]
+
+    def fit_score(self, arrays, train, test, params, budget, cache):
+        # Majority vote of majority_label, where a tie goes to label 0. Scoring a k is already cheap, so the
+        # budget of successive halving is not used.
+        k = min(params["k"], len(train))
+        votes = arrays["y"][arrays["neighbors"][test, :k]].sum(axis=1)
+        predictions = (2 * votes > k).astype(np.int64)
+        return float(np.mean(predictions == arrays["y"][test]))
+
+
+class RegressionTreeTask(_SearchTask):
+    score_name = "negative_mse"
+    tunable_params = ("max_depth", "min_samples_leaf", "split_method", "max_bins")
+
+    def __init__(self, examples, features=None, label_key="bpd", seed=42):
+        from .regression_tree.regression_tree import DEFAULT_FEATURES, TrainingData
+
+        data = TrainingData.from_examples(examples, DEFAULT_FEATURES if features is None else features, label_key)
+        self.features = data.features
+        self.seed = seed
+        # The feature orders are sorted once here, every fold and budget restricts them to its rows
+        self.arrays = {"X": data.X, "y": data.y, "presorted": data.presorted()}
+        self.n_examples = len(data.y)
+
+    def fit_score(self, arrays, train, test, params, budget, cache):
+        from .regression_tree.regression_tree import RegressionTree, TrainingData
+
+        unknown = sorted(set(params) - set(self.tunable_params))
+        if unknown:
+            raise ValueError("RegressionTreeTask cannot tune {}, expected parameters among {}".format(
+                ", ".join(unknown), ", ".join(self.tunable_params)))
+        params = dict(params)
+        split_method, max_bins = params.pop("split_method", "exact"), params.pop("max_bins", 255)
+        rows = self.budget_rows(train, budget, cache["fold"])
+        if split_method == "exact":
+            data = TrainingData(arrays["X"], arrays["y"], self.features, presorted=arrays["presorted"])
+            tree = RegressionTree(data, rows=rows, **params)
+        else:
+            # Histogram bins are the quantiles of the training rows, as if the tree was built from their examples.
+            # They are computed once per fold, budget and max_bins.
+            key = (split_method, budget, max_bins)
+            if key not in cache:
+                cache[key] = TrainingData(arrays["X"][rows], arrays["y"][rows], self.features, split_method, max_bins)
+            tree = RegressionTree(cache[key], **params)
+        tree.compile()
+        errors = tree.predict_batch(arrays["X"][test]) - arrays["y"][test]
+        return -float(np.mean(errors ** 2))
+
+
+class NeuronTask(_SearchTask):
+    score_name = "negative_log_loss"
+
+    def __init__(self, dataset, seed=42):
+        # dataset is the list of {"features": [...], "label": 0 or 1} dicts of Neuron; features get the bias column
+        # of Neuron.features once, instead of once per trial
+        features = np.array([data["features"] for data in dataset], dtype=np.float64)
+        self.seed = seed
+        self.arrays = {
+            "features": np.hstack([features, np.ones((len(features), 1))]),
+            "labels": np.array([data["label"] for data in dataset], dtype=np.float64),
+        }
+        self.n_examples = len(dataset)
+
+    def fit_score(self, arrays, train, test, params, budget, cache):
+        # The budget is the fraction of n_epochs trained. Every trial starts from the same initial weights.
+        from .neuron.neuron_model import Neuron
+
+        params = dict(params)
+        params["n_epochs"] = max(1, int(round(params.get("n_epochs", 200) * budget)))
+        # The rows of a fold are gathered once per worker, training only reads them
+        if "neuron_rows" not in cache:
+            features, labels = arrays["features"], arrays["labels"]
+            cache["neuron_rows"] = (features[train], labels[train], [(features[test, :-1], labels[test])])
+        train_features, train_labels, test_batches = cache["neuron_rows"]
+        neuron = Neuron(n_features=train_features.shape[1] - 1, seed=self.seed)
+        neuron.features = train_features
+        neuron.labels = train_labels
+        neuron.perform_training(**params)
+        return -neuron.calculate_loss(test_batches)
+
+
+class MultinomialNBTask(_SearchTask):
+    score_name = "accuracy"
+
+    def __init__(self, articles_per_tag, seed=42):
+        # Articles are encoded as word ids once, so they fit in flat integer arrays
+        self.seed = seed
+        self.tags = list(articles_per_tag)
+        vocabulary = {}
+        word_ids, lengths, labels = [], [], []
+        for tag_index, articles in enumerate(articles_per_tag.values()):
+            for article in articles:
+                word_ids.extend(vocabulary.setdefault(word, len(vocabulary)) for word in article)
+                lengths.append(len(article))
+                labels.append(tag_index)
+        self.arrays = {
+            "word_ids": np.array(word_ids, dtype=np.int64),
+            "offsets": np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]),
+            "labels": np.array(labels, dtype=np.int64),
+        }
+        self.n_examples = len(labels)
+
+    def _articles(self, arrays, rows):
+        word_ids, offsets = arrays["word_ids"], arrays["offsets"]
+        return [word_ids[offsets[row]: offsets[row + 1]].tolist() for row in rows.tolist()]
+
+    def fit_score(self, arrays, train, test, params, budget, cache):
+        from .multinomial_naive_bayes.multinomial_naive_bayes import MultinomialNB
+
+        # The counts of a fold do not depend on alpha: the model of the fold and budget is fitted once per worker,
+        # and every alpha only recomputes the log-likelihoods from its counts
+        key = ("model", budget)
+        if key not in cache:
+            rows = self.budget_rows(train, budget, cache["fold"])
+            articles = self._articles(arrays, rows)
+            labels = arrays["labels"][rows].tolist()
+            articles_per_tag = {tag: [] for tag in self.tags}
+            for article, label in zip(articles, labels):
+                articles_per_tag[self.tags[label]].append(article)
+            model = MultinomialNB({tag: articles for tag, articles in articles_per_tag.items() if articles})
+            cache[key] = (model, self._articles(arrays, test))
+        model, test_articles = cache[key]
+        model.alpha = params.get("alpha", 1)
+        model.train()
+        tag_indices = np.array([self.tags.index(tag) for tag in model.tags])
+        predictions = tag_indices[model.predict_batch(test_articles).argmax(axis=1)]
+        return float(np.mean(predictions == arrays["labels"][test]))
+
+
+# Task, arrays and per-fold caches of a worker process, set by _attach_search
+_worker_task = None
+_worker_arrays = None
+_worker_blocks = []
+_worker_caches = {}
+
+
+def _attach_search(task, descriptions):
+    global _worker_task, _worker_arrays, _worker_blocks, _worker_caches
+    _worker_arrays, _worker_blocks = attach_shared_arrays(descriptions)
+    _worker_task = task
+    _worker_caches = {}
+
+
+def _fold_cache(caches, arrays, fold):
+    # Training and held-out rows of a fold, and whatever the task keeps for it, computed once per process
+    if fold not in caches:
+        folds = arrays["folds"]
+        caches[fold] = {"fold": fold, "train": np.flatnonzero(folds != fold), "test": np.flatnonzero(folds == fold)}
+    return caches[fold]
+
+
+def _precompute_fold(fold, candidates, task=None, arrays=None, caches=None):
+    task, arrays, caches = (task, arrays, caches) if task is not None else (_worker_task, _worker_arrays,
+                                                                             _worker_caches)
+    cache = _fold_cache(caches, arrays, fold)
+    task.precompute(arrays, cache["train"], cache["test"], candidates)
+
+
+def _score_trial(candidate_index, params, fold, budget, task=None, arrays=None, caches=None):
+    task, arrays, caches = (task, arrays, caches) if task is not None else (_worker_task, _worker_arrays,
+                                                                             _worker_caches)
+    started_at = time.perf_counter()
+    cache = _fold_cache(caches, arrays, fold)
+    score = task.fit_score(arrays, cache["train"], cache["test"], params, budget, cache)
+    return candidate_index, fold, score, time.perf_counter() - started_at
+
+
+class HyperparameterSearch:
+    def __init__(self, task, n_folds=5, n_jobs=1, shuffle=True, seed=42, instrumentation=None):
+        self.task = task
+        self.n_folds = n_folds
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.folds = k_fold(task.n_examples, n_folds, shuffle, seed)
+        self.seed = seed
+        # Optional model_concepts.instrumentation.Instrumentation receiving a "search.trial" event per fold
+        # and a "search.candidate" event per cross-validated candidate
+        self.instrumentation = instrumentation
+        self.results = []
+        self.best_params = None
+
+    def grid(self, grid):
+        return self.evaluate(parameter_grid(grid))
+
+    def random(self, distributions, n_trials=20):
+        return self.evaluate(random_parameters(distributions, n_trials, self.seed))
+
+    def evaluate(self, candidates, budget=1.0):
+        # Cross-validates every candidate, returns the results sorted from the best mean score
+        with _SearchSession(self, candidates) as session:
+            results = session.evaluate(candidates, budget)
+        return self._finish(results)
+
+    def successive_halving(self, candidates, factor=3, min_budget=None):
+        # candidates is a list of parameter dicts, or a grid dict. Every rung keeps the best 1 / factor of the
+        # candidates and multiplies the budget by factor, until a rung runs on the full budget.
+        if isinstance(candidates, dict):
+            candidates = parameter_grid(candidates)
+        if not candidates:
+            raise ValueError("successive_halving needs at least one candidate")
+        if factor < 2:
+            raise ValueError("factor must be at least 2, got {}".format(factor))
+        n_rungs = int(math.floor(math.log(len(candidates), factor) + 1e-9)) + 1
+        if min_budget is None:
+            min_budget = float(factor) ** -(n_rungs - 1)
+        if not 0 < min_budget <= 1:
+            raise ValueError("min_budget must be in (0, 1], got {}".format(min_budget))
+
+        results = []
+        with _SearchSession(self, candidates) as session:
+            budget, rung = min_budget, 0
+            while True:
+                rung_results = session.evaluate(candidates, min(1.0, budget))
+                for result in rung_results:
+                    result["rung"] = rung
+                results.extend(rung_results)
+                if budget >= 1 - 1e-9:
+                    break
+                survivors = sorted(rung_results, key=lambda result: -result["mean_score"])
+                candidates = [result["params"] for result in survivors[:max(1, len(candidates) // factor)]]
+                budget, rung = budget * factor, rung + 1
+        # Only the candidates of the last rung were scored on the largest budget
+        self._finish([result for result in results if result["rung"] == rung])
+        self.results = sorted(results, key=lambda result: (-result["rung"], -result["mean_score"]))
+        return self.results
+
+    def _finish(self, results):
+        self.results = sorted(results, key=lambda result: -result["mean_score"])
+        self.best_params = self.results[0]["params"] if self.results else None
+        return self.results
+
+
+class _SearchSession:
+    # The shared arrays, fold precomputation and process pool of one search, reused by all its rungs
+    def __init__(self, search, candidates):
+        self.search = search
+        self.candidates = candidates
+        self.shared = None
+        self.pool = None
+        self.arrays = None
+        self.caches = {}
+
+    def __enter__(self):
+        task = self.search.task
+        precomputed = task.precomputed_arrays(self.candidates)
+        if self.search.n_jobs == 1:
+            self.arrays = dict(task.arrays, folds=self.search.folds)
+            for name, (shape, dtype) in precomputed.items():
+                self.arrays[name] = np.zeros(shape, dtype=dtype)
+            for fold in range(self.search.n_folds):
+                _precompute_fold(fold, self.candidates, task, self.arrays, self.caches)
+            return self
+
+        self.shared = SharedArrays()
+        try:
+            for name, array in task.arrays.items():
+                self.shared.add(name, array)
+            self.shared.add("folds", self.search.folds)
+            for name, (shape, dtype) in precomputed.items():
+                self.shared.add(name, shape=shape, dtype=dtype)
+            self.pool = ProcessPoolExecutor(self.search.n_jobs, initializer=_attach_search,
+                                            initargs=(task, self.shared.descriptions))
+            # One job per fold fills the precomputed arrays before any candidate is scored
+            if precomputed:
+                list(self.pool.map(_precompute_fold, range(self.search.n_folds),
+                                   itertools.repeat(self.candidates)))
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+        if self.shared is not None:
+            self.shared.close()
+        return False
+
+    def evaluate(self, candidates, budget):
+        search = self.search
+        started_at = time.perf_counter()
+        jobs = [(index, params, fold, budget) for index, params in enumerate(candidates)
+                for fold in range(search.n_folds)]
+        if self.pool is None:
+            outcomes = (_score_trial(*job, search.task, self.arrays, self.caches) for job in jobs)
+        else:
+            outcomes = (future.result() for future in [self.pool.submit(_score_trial, *job) for job in jobs])
+
+        fold_scores = [[None] * search.n_folds for _ in candidates]
+        fold_seconds = [[None] * search.n_folds for _ in candidates]
+        for index, fold, score, seconds in outcomes:
+            fold_scores[index][fold] = score
+            fold_seconds[index][fold] = seconds
+            if search.instrumentation is not None:
+                search.instrumentation.add_time("search.trial", seconds)
+                search.instrumentation.emit("search.trial", params=candidates[index], fold=fold, budget=budget,
+                                            score=score, seconds=seconds)
+
+        results = []
+        for params, scores, seconds in zip(candidates, fold_scores, fold_seconds):
+            results.append({"params": params, "budget": budget, "mean_score": float(np.mean(scores)),
+                            "std_score": float(np.std(scores)), "fold_scores": scores,
+                            "fit_seconds": float(np.sum(seconds))})
+        if search.instrumentation is not None:
+            for result in results:
+                search.instrumentation.emit("search.candidate", **result)
+            search.instrumentation.emit("search.rung", candidates=len(candidates), budget=budget, jobs=len(jobs),
+                                        seconds=time.perf_counter() - started_at)
+        return results
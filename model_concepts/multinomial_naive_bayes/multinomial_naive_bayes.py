@@ -1,49 +1,201 @@
 """
-This Python file contains an implementation of a Multinomial Naive Bayes Classifier. 
-The MultinomialNB class encapsulates the necessary training and prediction operations for the classifier. 
-This class takes in a dictionary of articles (represented as a list of words) grouped by tags and utilizes this data for training. 
-The prediction process then assigns the most likely tag to a given article based on the trained model. For numerical stability, logarithms are used to handle probabilities. 
+This Python file contains an implementation of a Multinomial Naive Bayes Classifier.
+The MultinomialNB class encapsulates the necessary training and prediction operations for the classifier.
+This class takes in a dictionary of articles (represented as a list of words) grouped by tags and utilizes this data for training.
+The prediction process then assigns the most likely tag to a given article based on the trained model. For numerical stability, logarithms are used to handle probabilities.
 Smoothing is also applied to handle unseen words in the prediction stage.
+
+Training maps every word to a column of a vocabulary index and keeps the word counts as a dense tags x vocabulary
+matrix, from which the log-likelihoods are computed once. `predict_batch` turns a batch of articles into a sparse
+articles x vocabulary count matrix and scores all of them against every tag with a single sparse-dense product.
+`partial_fit` adds the counts of new articles (and new words or tags) to an already trained model.
+
+`save(path)` stores the counts, log-likelihoods and vocabulary as arrays (see model_concepts/persistence.py), and
+`MultinomialNB.load(path)` memory-maps them. A loaded model looks words up with a binary search over the sorted,
+memory-mapped vocabulary, so worker processes share one copy of it instead of each rebuilding a dict.
+With `instrumentation=Instrumentation()` (see model_concepts/instrumentation.py) every fit emits a
+"multinomial_nb.partial_fit" event with the vocabulary size and the training throughput in words per second.
 """
-from collections import defaultdict
-import math
+import time
+
+import numpy as np
+
+# Likelihood given to words that never appeared in training, for every tag
+UNSEEN_WORD_LIKELIHOOD = 0.5
+
+
 class MultinomialNB:
-    def __init__(self, articles_per_tag):
-        self.alpha = 1
+    def __init__(self, articles_per_tag, alpha=1, instrumentation=None):
+        self.alpha = alpha
+        # Optional model_concepts.instrumentation.Instrumentation receiving an event per (partial) fit
+        self.instrumentation = instrumentation
+        self.tags = []
+        self.vocabulary = {}
+        self.articles_count_per_tag = np.zeros(0)
+        self.word_counts_per_tag = np.zeros((0, 0))
         self.priors_per_tag = {}
-        self.likelihood_per_word_per_tag = {}
-        self.articles_per_tag = articles_per_tag  
-        self.tags = self.articles_per_tag.keys()
+        self.log_priors = None
+        self.log_likelihoods = None
+        self.partial_fit(articles_per_tag)
+
+    def partial_fit(self, articles_per_tag):
+        if isinstance(self.vocabulary, _MappedVocabulary):
+            # A loaded model gets a regular (writable) vocabulary before it can learn new words
+            self.vocabulary = self.vocabulary.to_dict()
+        started_at = time.perf_counter()
+        vocabulary_size = len(self.vocabulary)
+        for tag in articles_per_tag:
+            if tag not in self.tags:
+                self.tags.append(tag)
+        for articles in articles_per_tag.values():
+            for article in articles:
+                for word in article:
+                    if word not in self.vocabulary:
+                        self.vocabulary[word] = len(self.vocabulary)
+        self._grow_counts()
+
+        for tag, articles in articles_per_tag.items():
+            tag_index = self.tags.index(tag)
+            self.articles_count_per_tag[tag_index] += len(articles)
+            word_indices = [self.vocabulary[word] for article in articles for word in article]
+            self.word_counts_per_tag[tag_index] += np.bincount(word_indices, minlength=len(self.vocabulary))
+
         self.train()
+        if self.instrumentation is not None:
+            self._report_fit(articles_per_tag, vocabulary_size, started_at)
+        return self
+
+    def _report_fit(self, articles_per_tag, previous_vocabulary_size, started_at):
+        seconds = time.perf_counter() - started_at
+        n_articles = sum(len(articles) for articles in articles_per_tag.values())
+        n_words = sum(len(article) for articles in articles_per_tag.values() for article in articles)
+        self.instrumentation.add_time("multinomial_nb.partial_fit", seconds)
+        self.instrumentation.count("multinomial_nb.words", n_words)
+        self.instrumentation.emit("multinomial_nb.partial_fit", articles=n_articles, words=n_words,
+                                  vocabulary_size=len(self.vocabulary),
+                                  new_words=len(self.vocabulary) - previous_vocabulary_size, tags=len(self.tags),
+                                  seconds=seconds, words_per_second=n_words / seconds if seconds else None)
 
     def train(self):
-        tags_counts_map = {tag: len(self.articles_per_tag[tag]) for tag in self.tags}
-        self.priors_per_tag = {tag: tags_counts_map[tag] / sum(tags_counts_map.values()) for tag in tags_counts_map.keys()}
-        self.likelihood_per_word_per_tag = self.__get_word_likelihoods_per_tag()
-        
+        # Recompute the priors and log-likelihoods from the accumulated counts
+        priors = self.articles_count_per_tag / self.articles_count_per_tag.sum()
+        self.priors_per_tag = dict(zip(self.tags, priors.tolist()))
+        self.log_priors = np.log(priors)
+        total_word_count_per_tag = self.word_counts_per_tag.sum(axis=1, keepdims=True)
+        self.log_likelihoods = np.log((self.word_counts_per_tag + 1 * self.alpha) / (
+            total_word_count_per_tag + 2 * self.alpha
+        ))
+
     def predict(self, article):
-        posteriors_per_tag = {tag: math.log(prior) for tag, prior in self.priors_per_tag.items()} 
-        for word in article:
-            for tag in self.tags:
-                posteriors_per_tag[tag] = posteriors_per_tag[tag] + math.log(
-                    self.likelihood_per_word_per_tag[word][tag]
-                )
-        return posteriors_per_tag
-        
-    def __get_word_likelihoods_per_tag(self):
-        word_frequencies_per_tag = defaultdict(lambda: {tag: 0 for tag in self.tags})
-        total_word_count_per_tag = defaultdict(int)
-        for tag in self.tags:
-            for article in self.articles_per_tag[tag]:
-                for word in article:
-                    word_frequencies_per_tag[word][tag] += 1
-                    total_word_count_per_tag[tag] += 1
-        word_likelihoods_per_tag = defaultdict(lambda: {tag: 0.5 for tag in self.tags}) 
-        for word, tags_map in word_frequencies_per_tag.items():
-            for tag in tags_map.keys():
-                word_likelihoods_per_tag[word][tag] = (word_frequencies_per_tag[word][tag] + 1 * self.alpha) / (
-                    total_word_count_per_tag[tag] + 2 * self.alpha
-                )
-        return word_likelihoods_per_tag 
-            
-        
+        posteriors = self.predict_batch([article])[0]
+        return {tag: posterior for tag, posterior in zip(self.tags, posteriors.tolist())}
+
+    def predict_batch(self, articles):
+        # Log posterior of every article (rows) for every tag (columns, in the order of self.tags)
+        rows, columns, counts, unseen_counts = self._count_matrix(articles)
+        posteriors = np.tile(self.log_priors, (len(articles), 1))
+        posteriors += unseen_counts[:, None] * np.log(UNSEEN_WORD_LIKELIHOOD)
+        # Sparse (articles x vocabulary) times dense (vocabulary x tags), one tag column at a time
+        for tag_index in range(len(self.tags)):
+            posteriors[:, tag_index] += np.bincount(
+                rows, weights=counts * self.log_likelihoods[tag_index, columns], minlength=len(articles))
+        return posteriors
+
+    def _count_matrix(self, articles):
+        # Coordinates and values of the non-zero word counts, plus the number of unseen words per article
+        words = [word for article in articles for word in article]
+        if isinstance(self.vocabulary, _MappedVocabulary):
+            word_indices = self.vocabulary.lookup(words)
+        else:
+            word_indices = np.array([self.vocabulary.get(word, -1) for word in words], dtype=np.int64)
+        article_indices = np.repeat(np.arange(len(articles)), [len(article) for article in articles])
+
+        unseen = word_indices < 0
+        unseen_counts = np.bincount(article_indices[unseen], minlength=len(articles))
+        keys, counts = np.unique(article_indices[~unseen] * len(self.vocabulary) + word_indices[~unseen],
+                                 return_counts=True)
+        rows, columns = np.divmod(keys, max(1, len(self.vocabulary)))
+        return rows, columns, counts, unseen_counts
+
+    def save(self, path):
+        # The vocabulary is saved as its UTF-8 encoded words in sorted order with their columns, so a loaded model
+        # looks words up with a binary search over the memory-mapped arrays instead of rebuilding the dict
+        from ..persistence import save_model
+
+        if isinstance(self.vocabulary, _MappedVocabulary):
+            sorted_words, word_columns = self.vocabulary.sorted_words, self.vocabulary.columns
+        else:
+            words = np.array([word.encode("utf-8") for word in self.vocabulary], dtype=bytes)
+            order = np.argsort(words, kind="stable")
+            sorted_words = words[order]
+            word_columns = np.fromiter(self.vocabulary.values(), dtype=np.int64, count=len(words))[order]
+        arrays = {
+            "sorted_words": sorted_words,
+            "word_columns": word_columns,
+            "articles_count_per_tag": self.articles_count_per_tag,
+            "word_counts_per_tag": self.word_counts_per_tag,
+            "log_priors": self.log_priors,
+            "log_likelihoods": self.log_likelihoods,
+        }
+        # The tags go in the metadata, where they keep their JSON type (int tags would come back as str from an array)
+        return save_model(path, "MultinomialNB", arrays, {"alpha": self.alpha, "tags": list(self.tags)})
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        from ..persistence import load_model
+
+        arrays, metadata = load_model(path, "MultinomialNB", mmap_mode)
+        model = cls.__new__(cls)
+        model.alpha = metadata["alpha"]
+        model.instrumentation = None
+        model.tags = metadata["tags"]
+        model.vocabulary = _MappedVocabulary(arrays["sorted_words"], arrays["word_columns"])
+        model.articles_count_per_tag = arrays["articles_count_per_tag"]
+        model.word_counts_per_tag = arrays["word_counts_per_tag"]
+        model.log_priors = arrays["log_priors"]
+        model.log_likelihoods = arrays["log_likelihoods"]
+        priors = model.articles_count_per_tag / model.articles_count_per_tag.sum()
+        model.priors_per_tag = dict(zip(model.tags, priors.tolist()))
+        return model
+
+    def _grow_counts(self):
+        # Pad the count arrays with zeros for tags and words seen for the first time
+        new_tags = len(self.tags) - self.word_counts_per_tag.shape[0]
+        new_words = len(self.vocabulary) - self.word_counts_per_tag.shape[1]
+        self.articles_count_per_tag = np.pad(self.articles_count_per_tag, (0, new_tags))
+        self.word_counts_per_tag = np.pad(self.word_counts_per_tag, ((0, new_tags), (0, new_words)))
+
+
+class _MappedVocabulary:
+    # Read-only word -> column mapping over the sorted word arrays of a saved model, which can be memory-mapped
+    def __init__(self, sorted_words, columns):
+        self.sorted_words = sorted_words
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def __getitem__(self, word):
+        column = self.get(word)
+        if column is None:
+            raise KeyError(word)
+        return column
+
+    def get(self, word, default=None):
+        column = self.lookup([word])[0]
+        return default if column < 0 else int(column)
+
+    def lookup(self, words):
+        # Columns of a list of words, -1 for words that are not in the vocabulary
+        if not len(words) or not len(self.columns):
+            return np.full(len(words), -1, dtype=np.int64)
+        encoded = np.array([word.encode("utf-8") for word in words], dtype=bytes)
+        positions = np.minimum(np.searchsorted(self.sorted_words, encoded), len(self.columns) - 1)
+        found = self.sorted_words[positions] == encoded
+        return np.where(found, self.columns[positions], -1)
+
+    def to_dict(self):
+        return {word.decode("utf-8"): int(column) for word, column in zip(self.sorted_words, self.columns)}
@@ -0,0 +1,80 @@
+import math
+import random
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from model_concepts.multinomial_naive_bayes.multinomial_naive_bayes import MultinomialNB
+
+
+def baseline_predict(articles_per_tag, article, alpha=1):
+    # The original dict of dicts model: add-alpha smoothed word likelihoods, 0.5 for unseen words
+    tags = list(articles_per_tag)
+    article_counts = {tag: len(articles_per_tag[tag]) for tag in tags}
+    word_frequencies = defaultdict(lambda: {tag: 0 for tag in tags})
+    total_word_counts = defaultdict(int)
+    for tag in tags:
+        for training_article in articles_per_tag[tag]:
+            for word in training_article:
+                word_frequencies[word][tag] += 1
+                total_word_counts[tag] += 1
+    likelihoods = defaultdict(lambda: {tag: 0.5 for tag in tags})
+    for word, counts in word_frequencies.items():
+        for tag in tags:
+            likelihoods[word][tag] = (counts[tag] + 1 * alpha) / (total_word_counts[tag] + 2 * alpha)
+    posteriors = {tag: math.log(article_counts[tag] / sum(article_counts.values())) for tag in tags}
+    for word in article:
+        for tag in tags:
+            posteriors[tag] = posteriors[tag] + math.log(likelihoods[word][tag])
+    return posteriors
+
+
+def make_articles(tags, n_articles, seed):
+    rng = random.Random(seed)
+    words = ["word{}".format(i) for i in range(200)] + ["ünïcode", "日本"]
+    return {tag: [rng.choices(words[i * 20:i * 20 + 120], k=rng.randrange(0, 30)) for _ in range(n_articles)]
+            for i, tag in enumerate(tags)}
+
+
+def assert_posteriors_match(model, articles_per_tag, queries):
+    posteriors = model.predict_batch(queries)
+    for query, row in zip(queries, posteriors):
+        expected = baseline_predict(articles_per_tag, query)
+        assert list(expected) == list(model.tags)
+        np.testing.assert_allclose(row, list(expected.values()), rtol=1e-12)
+
+
+def test_predict_batch_matches_baseline():
+    articles_per_tag = make_articles(["sports", "politics", "tech"], 40, seed=0)
+    queries = [articles[0] for articles in make_articles(["a", "b", "c"], 5, seed=1).values()]
+    # Empty articles and words never seen in training
+    queries += [[], ["unseen", "unseen", "word3"]]
+    model = MultinomialNB(articles_per_tag)
+    assert_posteriors_match(model, articles_per_tag, queries)
+    assert model.predict(queries[0]) == dict(zip(model.tags, model.predict_batch(queries[:1])[0].tolist()))
+
+
+def test_partial_fit_matches_a_single_fit():
+    first = make_articles(["sports", "politics"], 30, seed=2)
+    second = make_articles(["politics", "tech"], 30, seed=3)
+    combined = {"sports": first["sports"], "politics": first["politics"] + second["politics"],
+                "tech": second["tech"]}
+    model = MultinomialNB(first).partial_fit(second)
+    queries = make_articles(["x"], 10, seed=4)["x"]
+    assert_posteriors_match(model, combined, queries)
+
+
+@pytest.mark.parametrize("tags", [["sports", "politics"], [0, 1, 2]])
+def test_save_and_load(tmp_path, tags):
+    articles_per_tag = make_articles(tags, 20, seed=5)
+    queries = make_articles(["x"], 10, seed=6)["x"] + [["unseen", "日本"]]
+    model = MultinomialNB(articles_per_tag)
+    model.save(str(tmp_path / "model"))
+    loaded = MultinomialNB.load(str(tmp_path / "model"))
+    assert loaded.tags == tags
+    np.testing.assert_array_equal(loaded.predict_batch(queries), model.predict_batch(queries))
+    # A loaded model keeps learning like the original one
+    more = make_articles(tags, 5, seed=7)
+    np.testing.assert_allclose(loaded.partial_fit(more).predict_batch(queries),
+                               model.partial_fit(more).predict_batch(queries), rtol=1e-12)
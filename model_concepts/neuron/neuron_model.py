@@ -4,49 +4,268 @@ This Python module implements a simple logistic regression model using a single
 The 'Neuron' class initializes with random weights and takes in a dataset for training. The neuron is trained to make predictions based on the input features. 
 The model's weights are adjusted according to the computed gradient of the loss function.
 
+The dataset is converted once into a contiguous feature matrix (with a bias column) and a label vector, so the
+forward pass and the gradient of every mini-batch are single matrix operations. The number of weights follows the
+number of features in the dataset. Training can optionally shuffle the examples every epoch and stop early once
+the log loss stops improving.
+
+For datasets larger than memory, `Neuron()` can be created untrained and trained with `fit` over any iterable of
+(features, labels) batches, or one batch at a time with `partial_fit`. `MemmapDataset` reads the batches from `.npy` or
+raw `np.memmap` files, so only the batch in use is paged in. `fit` can checkpoint the weights and its position in the
+data to a file and resumes from the checkpoint when it is restarted. Every `fit` call trains `n_epochs` more epochs,
+except when it resumes a checkpoint, which finishes the `n_epochs` of the run that wrote it. A trained neuron is saved for serving with
+`save(path)` and loaded with `Neuron.load(path)` (see model_concepts/persistence.py). With
+`instrumentation=Instrumentation()` (see model_concepts/instrumentation.py) every epoch emits a "neuron.epoch" event
+with its log loss and throughput: the loss over the whole dataset for `perform_training`, and the mean loss of the
+batches before their updates for `fit`.
+
 The module also includes a 'test' function to verify the model's predictions on different datasets. 
 This module serves as a basic demonstration of logistic regression and gradient descent in machine learning.
 """
 
 
+import itertools
+import os
+import time
+
 import numpy as np
 
 
+class MemmapDataset:
+    def __init__(self, features_path, labels_path, batch_size=1024, n_features=None, dtype=np.float64,
+                 label_dtype=np.float64, shuffle=False, seed=42):
+        # .npy files are opened with np.load(mmap_mode="r"), raw binary files with np.memmap, which needs
+        # n_features to know the shape of the feature matrix. Nothing is read until a batch is used.
+        if str(features_path).endswith(".npy"):
+            self.features = np.load(features_path, mmap_mode="r")
+        elif n_features is None:
+            raise ValueError("Raw memmap feature files need n_features")
+        else:
+            self.features = np.memmap(features_path, dtype=dtype, mode="r").reshape(-1, n_features)
+        if str(labels_path).endswith(".npy"):
+            self.labels = np.load(labels_path, mmap_mode="r")
+        else:
+            self.labels = np.memmap(labels_path, dtype=label_dtype, mode="r")
+        if len(self.features) != len(self.labels):
+            raise ValueError("Got {} feature rows but {} labels".format(len(self.features), len(self.labels)))
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        # Epoch whose batch order the next iteration yields, see set_epoch
+        self.epoch = 0
+
+    def __len__(self):
+        return len(self.labels)
+
+    def set_epoch(self, epoch):
+        # The shuffled order of an epoch only depends on (seed, epoch), so a training run resumed in a later epoch
+        # reads the batches in the same order as the interrupted one
+        self.epoch = epoch
+
+    def __iter__(self):
+        # Batches are contiguous slices of the files, shuffling only changes the order they are read in
+        starts = np.arange(0, len(self.labels), self.batch_size)
+        if self.shuffle:
+            starts = np.random.RandomState([self.seed, self.epoch]).permutation(starts)
+        self.epoch += 1
+        for start in starts:
+            yield self.features[start: start + self.batch_size], self.labels[start: start + self.batch_size]
+
+
 class Neuron:
-    def __init__(self, dataset):
-        np.random.seed(42)
-        self.weights = np.random.normal(0, 1, 3 + 1)
-        self.dataset = dataset
-        self.perform_training()
-
-    def perform_training(self, lr=0.01, mini_batch_size=10, n_epochs=200):
-        for _ in range(n_epochs):
-            for batch_start in range(0, len(self.dataset), mini_batch_size):
-                batch = self.dataset[batch_start: batch_start +
-                                     mini_batch_size]
-                pred_and_label = [
-                    {"pred": self.calculate_prediction(
-                        data["features"]), "label": data["label"]}
-                    for data in batch
-                ]
-                gradient = self._calculate_gradient(batch, pred_and_label)
-                self.weights -= lr * np.array(gradient)
+    def __init__(self, dataset=None, n_features=None, seed=42, instrumentation=None):
+        # With a dataset the neuron is trained on it right away, otherwise it starts untrained
+        # and is trained with fit or partial_fit on batches of (features, labels)
+        self.random_state = np.random.RandomState(seed)
+        self.weights = None
+        self.epochs_completed = 0
+        self.batches_completed = 0
+        # Epoch the current (or last) fit call started at, saved in its checkpoints
+        self.run_start_epoch = 0
+        # Optional model_concepts.instrumentation.Instrumentation receiving the loss of every epoch
+        self.instrumentation = instrumentation
+        if dataset is not None:
+            # An empty dataset keeps the three features of the original model and trains nothing
+            n_features = len(dataset[0]["features"]) if dataset else (3 if n_features is None else n_features)
+        if n_features is not None:
+            self.weights = self.random_state.normal(0, 1, n_features + 1)
+        if dataset is not None:
+            # Features with a constant 1 column appended for the bias weight
+            self.features = np.ones((len(dataset), n_features + 1))
+            if dataset:
+                self.features[:, :-1] = [data["features"] for data in dataset]
+            self.labels = np.array([data["label"] for data in dataset], dtype=np.float64)
+            self.perform_training()
+
+    def perform_training(self, lr=0.01, mini_batch_size=10, n_epochs=200, shuffle=False, tolerance=None):
+        previous_loss = None
+        for epoch in range(n_epochs):
+            started_at = time.perf_counter()
+            if shuffle:
+                order = self.random_state.permutation(len(self.labels))
+                features, labels = self.features[order], self.labels[order]
+            else:
+                features, labels = self.features, self.labels
+
+            for batch_start in range(0, len(labels), mini_batch_size):
+                batch_features = features[batch_start: batch_start + mini_batch_size]
+                batch_labels = labels[batch_start: batch_start + mini_batch_size]
+                gradient = self._calculate_gradient(batch_features, batch_labels)
+                self.weights -= lr * gradient
+
+            loss = None
+            if self.instrumentation is not None:
+                loss = self.calculate_loss()
+                self._report_epoch(epoch, loss, len(labels), started_at)
+            if tolerance is not None:
+                # Stop once an epoch improves the log loss by less than the tolerance
+                loss = self.calculate_loss() if loss is None else loss
+                if previous_loss is not None and previous_loss - loss < tolerance:
+                    break
+                previous_loss = loss
+
+    def partial_fit(self, features, labels, lr=0.01):
+        # One gradient step on a batch of features without the bias column
+        self._step(features, labels, lr)
+        return self
+
+    def _step(self, features, labels, lr):
+        # Returns the summed log loss of the batch before the step when instrumented, for fit to average per epoch
+        features = np.asarray(features, dtype=np.float64)
+        labels = np.asarray(labels, dtype=np.float64)
+        if self.weights is None:
+            self.weights = self.random_state.normal(0, 1, features.shape[1] + 1)
+        elif not self.weights.flags.writeable:
+            # Weights memory-mapped by load are copied before they are updated
+            self.weights = np.array(self.weights)
+        predictions = self._sigmoid(features @ self.weights[:-1] + self.weights[-1])
+        loss = self._log_loss(predictions, labels) if self.instrumentation is not None else None
+        errors = predictions - labels
+        self.weights[:-1] -= lr * (features.T @ errors) / len(labels)
+        self.weights[-1] -= lr * errors.mean()
+        self.batches_completed += 1
+        return loss
+
+    def fit(self, batches, lr=0.01, n_epochs=1, checkpoint_path=None, checkpoint_every=1000, resume=True):
+        # batches yields (features, labels) pairs, e.g. a MemmapDataset. With more than one epoch it has to be
+        # iterable again for every epoch (a list or a MemmapDataset, not a generator).
+        # Every call trains n_epochs more epochs. With a checkpoint path the weights and progress are saved every
+        # checkpoint_every batches and at the end of every epoch. With resume, an existing checkpoint is resumed
+        # from where it stopped: the n_epochs count from the epoch the interrupted call started at, so restarting
+        # the same call finishes it (and trains nothing if it had finished).
+        if checkpoint_path is not None and resume and os.path.exists(checkpoint_path):
+            self.load_checkpoint(checkpoint_path)
+        else:
+            self.run_start_epoch = self.epochs_completed
+            self.batches_completed = 0
+        while self.epochs_completed < self.run_start_epoch + n_epochs:
+            started_at = time.perf_counter()
+            epoch_loss, epoch_examples = 0.0, 0
+            # A shuffling dataset (MemmapDataset) replays the batch order of this epoch, so the batches
+            # skipped after a resume are the ones that were already trained on
+            if hasattr(batches, "set_epoch"):
+                batches.set_epoch(self.epochs_completed)
+            # Skipping the batches done before the checkpoint only slices memmaps, it does not read them
+            for features, labels in itertools.islice(batches, self.batches_completed, None):
+                loss = self._step(features, labels, lr)
+                if loss is not None:
+                    # Loss of the batch before its step, the batches skipped after a resume are not counted
+                    epoch_loss += loss
+                    epoch_examples += len(labels)
+                if checkpoint_path is not None and self.batches_completed % checkpoint_every == 0:
+                    self.save_checkpoint(checkpoint_path)
+            if self.instrumentation is not None:
+                self._report_epoch(self.epochs_completed, epoch_loss / max(1, epoch_examples), epoch_examples,
+                                   started_at)
+            self.epochs_completed += 1
+            self.batches_completed = 0
+            if checkpoint_path is not None:
+                self.save_checkpoint(checkpoint_path)
+        return self
+
+    def _report_epoch(self, epoch, loss, n_examples, started_at):
+        seconds = time.perf_counter() - started_at
+        self.instrumentation.add_time("neuron.epoch", seconds)
+        self.instrumentation.count("neuron.examples", n_examples)
+        self.instrumentation.emit("neuron.epoch", epoch=epoch, loss=float(loss), examples=n_examples, seconds=seconds,
+                                  examples_per_second=n_examples / seconds if seconds else None)
+
+    def save(self, path):
+        # Saves the trained weights in the model format of model_concepts/persistence.py
+        from ..persistence import save_model
+
+        metadata = {"epochs_completed": self.epochs_completed, "batches_completed": self.batches_completed}
+        return save_model(path, "Neuron", {"weights": self.weights}, metadata)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        from ..persistence import load_model
+
+        arrays, metadata = load_model(path, "Neuron", mmap_mode)
+        neuron = cls()
+        neuron.weights = arrays["weights"]
+        neuron.epochs_completed = metadata["epochs_completed"]
+        neuron.batches_completed = metadata["batches_completed"]
+        return neuron
+
+    def save_checkpoint(self, path):
+        # Written to a temporary file first, so an interrupted save never leaves a broken checkpoint behind
+        temporary_path = path + ".tmp"
+        # The RandomState is stored as plain arrays, so loading a checkpoint never unpickles anything
+        _, keys, position, has_gauss, cached_gaussian = self.random_state.get_state()
+        with open(temporary_path, "wb") as checkpoint_file:
+            np.savez(checkpoint_file, weights=self.weights, epochs_completed=self.epochs_completed,
+                     batches_completed=self.batches_completed, run_start_epoch=self.run_start_epoch,
+                     random_state_keys=keys,
+                     random_state_position=position, random_state_has_gauss=has_gauss,
+                     random_state_cached_gaussian=cached_gaussian)
+        os.replace(temporary_path, path)
+
+    def load_checkpoint(self, path):
+        with np.load(path, allow_pickle=False) as checkpoint:
+            self.weights = checkpoint["weights"].copy()
+            self.epochs_completed = int(checkpoint["epochs_completed"])
+            self.batches_completed = int(checkpoint["batches_completed"])
+            self.run_start_epoch = int(checkpoint["run_start_epoch"])
+            self.random_state.set_state(("MT19937", checkpoint["random_state_keys"],
+                                         int(checkpoint["random_state_position"]),
+                                         int(checkpoint["random_state_has_gauss"]),
+                                         float(checkpoint["random_state_cached_gaussian"])))
+        return self
 
     def calculate_prediction(self, features):
-        inputs = np.append(features, 1)
-        linear_combination = np.dot(self.weights, inputs)
-        return 1 / (1 + np.exp(-linear_combination))
-
-    def _calculate_gradient(self, batch, pred_and_label):
-        errors = [
-            pl["pred"] - pl["label"] for pl in pred_and_label
-        ]
-        gradient = np.zeros(len(self.weights))
-        for i, data in enumerate(batch):
-            inputs = np.append(data["features"], 1)
-            for j, input in enumerate(inputs):
-                gradient[j] += errors[i] * input
-        return gradient / len(batch)
+        linear_combination = np.dot(self.weights[:-1], features) + self.weights[-1]
+        return self._sigmoid(linear_combination)
+
+    def predict_batch(self, features):
+        # Probabilities for a matrix of features without the bias column
+        return self._sigmoid(np.asarray(features, dtype=np.float64) @ self.weights[:-1] + self.weights[-1])
+
+    def calculate_loss(self, batches=None):
+        # Mean log loss over the whole dataset, or over the (features, labels) batches streamed from disk
+        if batches is None:
+            predictions = self._sigmoid(self.features @ self.weights)
+            return self._log_loss(predictions, self.labels) / len(self.labels)
+        total_loss, n_examples = 0.0, 0
+        for features, labels in batches:
+            labels = np.asarray(labels, dtype=np.float64)
+            total_loss += self._log_loss(self.predict_batch(features), labels)
+            n_examples += len(labels)
+        return total_loss / n_examples
+
+    @staticmethod
+    def _log_loss(predictions, labels):
+        # Summed log loss of a batch
+        predictions = np.clip(predictions, 1e-15, 1 - 1e-15)
+        return -np.sum(labels * np.log(predictions) + (1 - labels) * np.log(1 - predictions))
+
+    def _calculate_gradient(self, batch_features, batch_labels):
+        errors = self._sigmoid(batch_features @ self.weights) - batch_labels
+        return batch_features.T @ errors / len(batch_labels)
+
+    @staticmethod
+    def _sigmoid(linear_combinations):
+        return 1 / (1 + np.exp(-linear_combinations))
 
 
 def test():
@@ -82,4 +301,5 @@ def test():
     print(round(neuron3.calculate_prediction([0.5, 0.6, 0.7]), 4))
 
 
-test()
+if __name__ == "__main__":
+    test()
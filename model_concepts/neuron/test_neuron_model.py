@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from model_concepts.instrumentation import Instrumentation
+from model_concepts.neuron.neuron_model import MemmapDataset, Neuron
+
+
+def baseline_weights(dataset, lr=0.01, mini_batch_size=10, n_epochs=200):
+    # The original training loop, one example and one weight at a time
+    np.random.seed(42)
+    weights = np.random.normal(0, 1, 3 + 1)
+    for _ in range(n_epochs):
+        for batch_start in range(0, len(dataset), mini_batch_size):
+            batch = dataset[batch_start: batch_start + mini_batch_size]
+            errors = [1 / (1 + np.exp(-np.dot(weights, np.append(data["features"], 1)))) - data["label"]
+                      for data in batch]
+            gradient = np.zeros(len(weights))
+            for i, data in enumerate(batch):
+                for j, value in enumerate(np.append(data["features"], 1)):
+                    gradient[j] += errors[i] * value
+            weights -= lr * gradient / len(batch)
+    return weights
+
+
+def make_dataset(n_examples, seed):
+    rng = np.random.default_rng(seed)
+    features = rng.normal(0, 1, (n_examples, 3))
+    labels = (features @ [1.0, -2.0, 0.5] + rng.normal(0, 0.5, n_examples) > 0).astype(float)
+    return features, labels
+
+
+def write_dataset(tmp_path, features, labels, **options):
+    np.save(str(tmp_path / "features.npy"), features)
+    np.save(str(tmp_path / "labels.npy"), labels)
+    return MemmapDataset(str(tmp_path / "features.npy"), str(tmp_path / "labels.npy"), **options)
+
+
+class InterruptedDataset(MemmapDataset):
+    # Stops the training run with an error after a number of batches, like a killed process
+    def __init__(self, *args, interrupt_after, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches_left = interrupt_after
+
+    def __iter__(self):
+        for batch in super().__iter__():
+            if self.batches_left == 0:
+                raise KeyboardInterrupt
+            self.batches_left -= 1
+            yield batch
+
+
+def test_training_matches_baseline():
+    features, labels = make_dataset(47, seed=0)
+    dataset = [{"features": row.tolist(), "label": label} for row, label in zip(features, labels)]
+    np.testing.assert_allclose(Neuron(dataset).weights, baseline_weights(dataset), rtol=1e-10)
+
+
+def test_empty_dataset_trains_nothing():
+    neuron = Neuron([])
+    assert len(neuron.weights) == 4
+    np.testing.assert_array_equal(neuron.weights, np.random.RandomState(42).normal(0, 1, 4))
+
+
+def test_every_fit_call_trains_more_epochs(tmp_path):
+    features, labels = make_dataset(100, seed=1)
+    batches = write_dataset(tmp_path, features, labels, batch_size=16)
+    twice = Neuron(n_features=3).fit(batches, n_epochs=2).fit(batches, n_epochs=2)
+    once = Neuron(n_features=3).fit(batches, n_epochs=4)
+    assert twice.epochs_completed == 4
+    np.testing.assert_array_equal(twice.weights, once.weights)
+
+
+def test_loaded_neuron_keeps_training(tmp_path):
+    features, labels = make_dataset(100, seed=2)
+    batches = write_dataset(tmp_path, features, labels, batch_size=16)
+    neuron = Neuron(n_features=3).fit(batches, n_epochs=2)
+    neuron.save(str(tmp_path / "neuron"))
+    loaded = Neuron.load(str(tmp_path / "neuron")).fit(batches, n_epochs=1)
+    np.testing.assert_array_equal(loaded.weights, neuron.fit(batches, n_epochs=1).weights)
+    assert loaded.epochs_completed == 3
+
+
+@pytest.mark.parametrize("interrupt_after", [5, 7, 14])
+def test_resumed_run_matches_an_uninterrupted_one(tmp_path, interrupt_after):
+    features, labels = make_dataset(100, seed=3)
+    options = dict(batch_size=16, shuffle=True)
+    checkpoint_path = str(tmp_path / "checkpoint.npz")
+    expected = Neuron(n_features=3).fit(write_dataset(tmp_path, features, labels, **options), n_epochs=3)
+
+    interrupted = InterruptedDataset(str(tmp_path / "features.npy"), str(tmp_path / "labels.npy"),
+                                     interrupt_after=interrupt_after, **options)
+    with pytest.raises(KeyboardInterrupt):
+        Neuron(n_features=3).fit(interrupted, n_epochs=3, checkpoint_path=checkpoint_path, checkpoint_every=3)
+    batches = MemmapDataset(str(tmp_path / "features.npy"), str(tmp_path / "labels.npy"), **options)
+    resumed = Neuron(n_features=3).fit(batches, n_epochs=3, checkpoint_path=checkpoint_path, checkpoint_every=3)
+    np.testing.assert_array_equal(resumed.weights, expected.weights)
+    assert resumed.epochs_completed == 3
+
+    # Restarting a finished run trains nothing more, without resume it trains n_epochs more
+    again = Neuron(n_features=3).fit(batches, n_epochs=3, checkpoint_path=checkpoint_path)
+    np.testing.assert_array_equal(again.weights, expected.weights)
+    assert again.fit(batches, n_epochs=1, checkpoint_path=checkpoint_path, resume=False).epochs_completed == 4
+
+
+def test_epoch_loss_only_counts_the_batches_of_fit(tmp_path):
+    features, labels = make_dataset(64, seed=4)
+    batches = write_dataset(tmp_path, features, labels, batch_size=16)
+    instrumentation = Instrumentation()
+    neuron = Neuron(n_features=3, instrumentation=instrumentation)
+    # Batches trained on with partial_fit before fit do not count towards the loss of its first epoch
+    neuron.partial_fit(features[:16], labels[:16]).partial_fit(features[16:32], labels[16:32])
+    weights = neuron.weights.copy()
+    neuron.fit(batches, n_epochs=1)
+
+    expected_loss, check = 0.0, Neuron(n_features=3)
+    check.weights = weights
+    for batch_features, batch_labels in batches:
+        expected_loss += check._log_loss(check.predict_batch(batch_features), batch_labels)
+        check.partial_fit(batch_features, batch_labels)
+    event, = [event for event in instrumentation.events if event["event"] == "neuron.epoch"]
+    assert event["examples"] == 64
+    assert event["loss"] == pytest.approx(expected_loss / 64, rel=1e-12)
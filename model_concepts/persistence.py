@@ -0,0 +1,75 @@
+"""
+Saving and loading the parameters of the from-scratch models.
+
+A saved model is a directory holding one `.npy` file per parameter array and a `metadata.json` file with the format
+version, the model type and the scalar settings of the model. The arrays are written without pickling, so they can be
+opened with `np.load(mmap_mode="r")`: loading only maps the files, and every process that loads the same model shares
+one copy of its arrays through the page cache. A save writes the whole directory next to `path` and then swaps it
+in, so an interrupted save is never mistaken for a complete model, and overwriting a saved model never pairs the
+new arrays with the old metadata (processes that mapped the old files keep reading them until they close them).
+"""
+
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+
+FORMAT_VERSION = 1
+METADATA_FILE = "metadata.json"
+
+
+def save_model(path, model_type, arrays, metadata=None):
+    path = os.path.normpath(path)
+    if os.path.isdir(path) and os.listdir(path) and not os.path.exists(os.path.join(path, METADATA_FILE)):
+        raise ValueError("Cannot save a model to '{}': the directory is not empty and is not a saved model".format(
+            path))
+    parent, base_name = os.path.split(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+
+    # Everything is written to a sibling directory on the same file system, so the swap below is a rename
+    temporary_path = os.path.join(parent, ".{}.{}.tmp".format(base_name, uuid.uuid4().hex))
+    os.makedirs(temporary_path)
+    old_path = None
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary_path, name + ".npy"), np.ascontiguousarray(array), allow_pickle=False)
+        header = {
+            "format_version": FORMAT_VERSION,
+            "model_type": model_type,
+            "arrays": sorted(arrays),
+            "metadata": metadata or {},
+        }
+        with open(os.path.join(temporary_path, METADATA_FILE), "w") as metadata_file:
+            json.dump(header, metadata_file, indent=2)
+
+        # A directory can only be renamed over an empty one, so an existing model is first moved aside
+        if os.path.exists(path):
+            old_path = temporary_path + ".old"
+            os.replace(path, old_path)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if old_path is not None and not os.path.exists(path):
+            os.replace(old_path, path)
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        raise
+    if old_path is not None:
+        shutil.rmtree(old_path, ignore_errors=True)
+    return path
+
+
+def load_model(path, model_type, mmap_mode="r"):
+    # Returns the arrays (memory-mapped read-only unless mmap_mode is None) and the metadata of a saved model
+    with open(os.path.join(path, METADATA_FILE)) as metadata_file:
+        header = json.load(metadata_file)
+    if header["format_version"] > FORMAT_VERSION:
+        raise ValueError("Model format version {} is newer than the supported version {}".format(
+            header["format_version"], FORMAT_VERSION))
+    if header["model_type"] != model_type:
+        raise ValueError("Expected a saved {}, got a saved {}".format(model_type, header["model_type"]))
+
+    arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode, allow_pickle=False)
+              for name in header["arrays"]}
+    return arrays, header["metadata"]
@@ -1,79 +1,334 @@
 """
 This file implements a decision tree regressor for continuous outputs. `
-TreeNode` represents a node, calculating the mean squared error (MSE), identifying the best split, and recursively generating child nodes. 
+TreeNode` represents a node, calculating the mean squared error (MSE), identifying the best split, and recursively generating child nodes.
 `RegressionTree` initializes a root `TreeNode`, trains the model, and predicts new instances based on the trained tree.
+
+The examples are converted once into a NumPy feature matrix and label vector shared by all nodes. In the default
+"exact" mode every feature is sorted once at the root and the sorted orders are partitioned down the tree, so a node
+scans each feature in O(n) with running sums and sums of squares of the labels. The "histogram" mode instead buckets
+every feature into at most `max_bins` quantile bins up front and only evaluates splits at bin boundaries, like
+LightGBM. `max_depth` and `min_samples_leaf` limit the growth of the tree.
+
+`RegressionTree.compile` flattens a trained tree into parallel arrays (split feature index, threshold, left child,
+right child, leaf value) and releases the nodes and their training data. `predict_batch` then routes a whole NumPy
+matrix through the flattened tree one level at a time.
+
+`GradientBoostedTrees` fits shallow trees one after another on the residuals of the ensemble so far, shrinking each
+tree by `learning_rate`, and `RandomForest` averages deep trees fitted on bootstrap samples. Both can train each tree on
+a random subset of the rows (`subsample` / `bootstrap`) and let every node choose its split among a random subset of
+the features (`colsample`). All the trees of an ensemble share one `TrainingData`, so the features are sorted or binned
+once, and a tree on a subset of the rows reuses the full sorted orders. With `n_jobs > 1` the forest trains its trees in
+a process pool, and the workers read the feature matrix, labels and sorted orders from shared memory instead of
+receiving a pickled copy of the examples. Ensembles predict through the compiled trees, a whole matrix at a time.
+
+With `instrumentation=Instrumentation()` (see model_concepts/instrumentation.py) every tree reports the nodes it built
+and the time spent searching for splits at each depth, and the ensembles report every boosting iteration (with the
+training MSE) or the trees of the forest.
+
+Compiled trees and ensembles can be saved with `save(path)` (see model_concepts/persistence.py). `load(path)` memory-maps
+the concatenated node arrays of all the trees, so processes serving the same forest share one copy of it.
 """
 
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+DEFAULT_FEATURES = ["porosity", "gamma", "sonic", "density"]
+
+
+def _tree_arrays(trees):
+    # The flat arrays of compiled trees concatenated, with the position of the first node of every tree
+    def concatenated(name, dtype):
+        return np.concatenate([np.zeros(0, dtype=dtype)] + [getattr(tree, name) for tree in trees])
+
+    return {
+        "split_features": concatenated("split_features", np.int32),
+        "thresholds": concatenated("thresholds", np.float64),
+        "left_children": concatenated("left_children", np.int32),
+        "right_children": concatenated("right_children", np.int32),
+        "values": concatenated("values", np.float64),
+        "tree_offsets": np.cumsum([0] + [len(tree.values) for tree in trees]),
+        "depths": np.array([tree.depth for tree in trees], dtype=np.int64),
+    }
+
+
+def _trees_from_arrays(arrays, features):
+    # The trees are slices of the (memory-mapped) concatenated arrays, so nothing is copied
+    offsets = arrays["tree_offsets"]
+    return [RegressionTree.from_arrays(features, *(arrays[name][start:end] for name in (
+        "split_features", "thresholds", "left_children", "right_children", "values")), int(depth))
+        for start, end, depth in zip(offsets[:-1], offsets[1:], arrays["depths"])]
+
+
+def _examples_matrix(examples, features):
+    return np.array([[example[feature] for feature in features]
+                     for example in examples], dtype=np.float64).reshape(len(examples), len(features))
+
+
+class TrainingData:
+    def __init__(self, X, y, features, split_method="exact", max_bins=255, bin_edges=None, bins=None,
+                 presorted=None):
+        if split_method not in ("exact", "histogram"):
+            raise ValueError("Unknown split_method '{}', expected 'exact' or 'histogram'".format(split_method))
+        self.features = list(features)
+        self.split_method = split_method
+        self.X = X
+        self.y = y
+        # Fraction of the features each node may split on, drawn with rng when the trees of an ensemble subsample them
+        self.colsample = 1.0
+        self.rng = None
+        # Scratch mask used to partition the rows of a node between its children
+        self.goes_left = np.zeros(len(y), dtype=bool)
+        # Optional model_concepts.instrumentation.Instrumentation, with the per-depth statistics of the tree being
+        # built (depth -> [nodes, split searches, split search seconds])
+        self.instrumentation = None
+        self.depth_statistics = None
+
+        # presorted can pass in the full presort of X when it is already known, e.g. from shared memory
+        if presorted is not None:
+            self._presorted = presorted
+        self.bin_edges = bin_edges
+        self.bins = bins
+        if split_method == "histogram" and bins is None:
+            # Bin edges are quantiles of each feature, bin b holds the values in (edges[b - 1], edges[b]]
+            quantiles = np.linspace(0, 1, max_bins + 1)[1:]
+            self.bin_edges = [np.unique(np.quantile(X[:, i], quantiles)) if len(y) else np.array([])
+                              for i in range(len(self.features))]
+            self.bins = np.stack([np.searchsorted(edges, X[:, i]) for i, edges in enumerate(self.bin_edges)],
+                                 axis=1) if self.features else np.zeros((len(y), 0), dtype=np.int64)
+
+    @classmethod
+    def from_examples(cls, examples, features, label_key, split_method="exact", max_bins=255):
+        X = _examples_matrix(examples, features)
+        y = np.array([example[label_key] for example in examples], dtype=np.float64)
+        return cls(X, y, features, split_method, max_bins)
+
+    def view(self, y=None, colsample=1.0, rng=None):
+        # Training data sharing the feature matrix, bins and sorted orders, with other labels or feature sampling
+        data = TrainingData(self.X, self.y if y is None else y, self.features, self.split_method,
+                            bin_edges=self.bin_edges, bins=self.bins, presorted=getattr(self, "_presorted", None))
+        data.colsample = colsample
+        data.rng = rng
+        data.instrument(self.instrumentation)
+        return data
+
+    def instrument(self, instrumentation):
+        self.instrumentation = instrumentation
+        self.depth_statistics = None if instrumentation is None else {}
+
+    def candidate_features(self):
+        n_features = len(self.features)
+        if self.colsample >= 1:
+            return range(n_features)
+        n_sampled = max(1, int(round(self.colsample * n_features)))
+        return np.sort(self.rng.choice(n_features, n_sampled, replace=False))
+
+    def presorted(self, rows=None):
+        # Row positions sorted by every feature. Restricting a full presort to `rows` (which may repeat,
+        # e.g. a bootstrap sample) repeats every position by its count, so no re-sorting is needed.
+        if not hasattr(self, "_presorted"):
+            self._presorted = np.stack([np.argsort(self.X[:, i], kind="stable")
+                                        for i in range(len(self.features))])
+        if rows is None:
+            return self._presorted
+        counts = np.bincount(rows, minlength=len(self.y))
+        return np.stack([np.repeat(order, counts[order]) for order in self._presorted])
+
 
 class TreeNode:
-    def __init__(self, examples):
-        self.examples = examples
+    def __init__(self, data, indices, sorted_indices=None, depth=0, max_depth=None, min_samples_leaf=1):
+        self.data = data
+        self.indices = indices
+        self.sorted_indices = sorted_indices
+        self.depth = depth
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
         self.left = None
         self.right = None
         self.split_feature = None
         self.split_value = None
         self.label = None
 
-    def compute_mse(self, examples):
-        if len(examples) == 0:
+    def compute_mse(self):
+        if len(self.indices) == 0:
             return 0
-        labels = [example["bpd"] for example in examples]
-        mean = sum(labels) / len(labels)
-        mse = sum([(label - mean) ** 2 for label in labels]) / len(labels)
-        return mse
+        labels = self.data.y[self.indices]
+        return ((labels - labels.mean()) ** 2).mean()
 
     def find_best_split(self):
-        min_mse = float('inf')
+        min_sse = float('inf')
         best_feature = None
         best_value = None
-        features = ["porosity", "gamma", "sonic", "density"]
-
-        for feature in features:
-            unique_values = sorted(
-                set([example[feature] for example in self.examples]))
-            for i in range(1, len(unique_values)):
-                split_value = (unique_values[i-1] + unique_values[i]) / 2
-                left_examples = [
-                    example for example in self.examples if example[feature] <= split_value]
-                right_examples = [
-                    example for example in self.examples if example[feature] > split_value]
-                mse = len(left_examples) / len(self.examples) * self.compute_mse(left_examples) + \
-                    len(right_examples) / len(self.examples) * \
-                    self.compute_mse(right_examples)
-                if mse < min_mse:
-                    min_mse = mse
-                    best_feature = feature
-                    best_value = split_value
+        # Centering the labels keeps the running sums of squares numerically stable
+        mean = self.data.y[self.indices].mean()
+        # Running sums accumulate rounding errors, so splits whose errors differ by less than
+        # this tolerance count as ties and the first feature and threshold are kept
+        tolerance = 1e-9 * ((self.data.y[self.indices] - mean) ** 2).sum()
+
+        for i in self.data.candidate_features():
+            if self.data.split_method == "exact":
+                candidate = self._best_exact_split(i, mean, tolerance)
+            else:
+                candidate = self._best_histogram_split(i, mean, tolerance)
+            if candidate is not None and candidate[0] < min_sse - tolerance:
+                min_sse, best_feature, best_value = candidate[0], i, candidate[1]
 
         return best_feature, best_value
 
+    def _best_exact_split(self, feature_index, mean, tolerance):
+        order = self.sorted_indices[feature_index]
+        values = self.data.X[order, feature_index]
+        labels = self.data.y[order] - mean
+
+        # Sum of squared errors of both sides for every split position, from running sums
+        left_sums = np.cumsum(labels)
+        left_squares = np.cumsum(labels ** 2)
+        total_sum, total_squares = left_sums[-1], left_squares[-1]
+        left_sums, left_squares = left_sums[:-1], left_squares[:-1]
+        left_counts = np.arange(1, len(labels))
+        right_counts = len(labels) - left_counts
+        # Clipping rounding errors below 0 lets exact ties resolve to the first candidate
+        sse = np.maximum(left_squares - left_sums ** 2 / left_counts, 0) + \
+            np.maximum((total_squares - left_squares) - (total_sum - left_sums) ** 2 / right_counts, 0)
+
+        # Only split between distinct values and keep at least min_samples_leaf rows on each side
+        valid = (values[1:] != values[:-1]) & (left_counts >= self.min_samples_leaf) & \
+            (right_counts >= self.min_samples_leaf)
+        if not valid.any():
+            return None
+        position = _first_minimum(sse, valid, tolerance)
+        return sse[position], (values[position] + values[position + 1]) / 2
+
+    def _best_histogram_split(self, feature_index, mean, tolerance):
+        edges = self.data.bin_edges[feature_index]
+        bins = self.data.bins[self.indices, feature_index]
+        labels = self.data.y[self.indices] - mean
+        counts = np.bincount(bins, minlength=len(edges))
+        sums = np.bincount(bins, weights=labels, minlength=len(edges))
+        squares = np.bincount(bins, weights=labels ** 2, minlength=len(edges))
+
+        # Split after bin b sends the rows of bins 0..b to the left
+        left_counts = np.cumsum(counts)[:-1]
+        left_sums = np.cumsum(sums)[:-1]
+        left_squares = np.cumsum(squares)[:-1]
+        right_counts = len(labels) - left_counts
+        valid = (left_counts >= max(1, self.min_samples_leaf)) & (right_counts >= max(1, self.min_samples_leaf)) & \
+            (counts[:-1] > 0)
+        if not valid.any():
+            return None
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sse = np.maximum(left_squares - left_sums ** 2 / left_counts, 0) + \
+                np.maximum((squares.sum() - left_squares) - (sums.sum() - left_sums) ** 2 / right_counts, 0)
+        position = _first_minimum(sse, valid, tolerance)
+        return sse[position], edges[position]
+
     def split(self):
-        if len(self.examples) <= 1 or self.compute_mse(self.examples) == 0:
-            self.label = self.examples[0]["bpd"] if self.examples else None
+        statistics = self.data.depth_statistics
+        if statistics is not None:
+            statistics.setdefault(self.depth, [0, 0, 0.0])[0] += 1
+        labels = self.data.y[self.indices]
+        if len(self.indices) <= 1 or labels.min() == labels.max():
+            # Only the root of an empty dataset has no rows, it predicts NaN
+            self._make_leaf(labels[0].item() if len(labels) else float("nan"))
+            return
+        if (self.max_depth is not None and self.depth >= self.max_depth) or \
+                len(self.indices) < 2 * self.min_samples_leaf:
+            self._make_leaf(labels.mean().item())
             return
 
-        self.split_feature, self.split_value = self.find_best_split()
+        if statistics is None:
+            feature_index, split_value = self.find_best_split()
+        else:
+            started_at = time.perf_counter()
+            feature_index, split_value = self.find_best_split()
+            statistics[self.depth][1] += 1
+            statistics[self.depth][2] += time.perf_counter() - started_at
+        if feature_index is None:
+            self._make_leaf(labels.mean().item())
+            return
+        self.split_value = split_value.item()
+        self.split_feature = self.data.features[feature_index]
 
-        left_examples = [
-            example for example in self.examples if example[self.split_feature] <= self.split_value]
-        self.left = TreeNode(left_examples)
+        goes_left = self.data.goes_left
+        goes_left[self.indices] = self.data.X[self.indices, feature_index] <= self.split_value
+        self.left = self._child(goes_left, True)
+        self.right = self._child(goes_left, False)
+        self.sorted_indices = None
+        # The scratch mask is reused by the children, so they are only split once it is no longer needed
         self.left.split()
-
-        right_examples = [
-            example for example in self.examples if example[self.split_feature] > self.split_value]
-        self.right = TreeNode(right_examples)
         self.right.split()
 
+    def _make_leaf(self, label):
+        # A leaf no longer needs the sorted orders of its rows, which would otherwise stay alive until compile()
+        self.label = label
+        self.sorted_indices = None
+
+    def _child(self, goes_left, left_side):
+        indices = self.indices[goes_left[self.indices] == left_side]
+        sorted_indices = None
+        if self.sorted_indices is not None:
+            # Filtering the parent's sorted orders keeps the child's rows sorted without re-sorting
+            sorted_indices = np.stack([order[goes_left[order] == left_side] for order in self.sorted_indices])
+        return TreeNode(self.data, indices, sorted_indices, self.depth + 1, self.max_depth, self.min_samples_leaf)
+
+
+def _first_minimum(sse, valid, tolerance):
+    # First valid split position whose error is within the tolerance of the smallest one
+    valid_positions = np.flatnonzero(valid)
+    valid_sse = sse[valid_positions]
+    return valid_positions[np.argmax(valid_sse <= valid_sse.min() + tolerance)]
+
 
 class RegressionTree:
-    def __init__(self, examples):
-        self.root = TreeNode(examples)
+    def __init__(self, examples, features=DEFAULT_FEATURES, label_key="bpd", max_depth=None,
+                 min_samples_leaf=1, split_method="exact", max_bins=255, rows=None, instrumentation=None):
+        # examples is a list of example dicts, or a TrainingData shared between the trees of an ensemble
+        # (in which case `rows` selects the training rows of this tree)
+        if isinstance(examples, TrainingData):
+            data = examples
+        else:
+            data = TrainingData.from_examples(examples, features, label_key, split_method, max_bins)
+            data.instrument(instrumentation)
+        self.features = data.features
+        # Flat representation of the tree, filled in by compile()
+        self.split_features = None
+        self.thresholds = None
+        self.left_children = None
+        self.right_children = None
+        self.values = None
+        self.depth = None
+        sorted_indices = data.presorted(rows) if data.split_method == "exact" else None
+        self.root = TreeNode(data, np.arange(len(data.y)) if rows is None else np.asarray(rows), sorted_indices,
+                             max_depth=max_depth, min_samples_leaf=min_samples_leaf)
         self.train()
 
     def train(self):
+        started_at = time.perf_counter()
         self.root.split()
+        if self.root.data.instrumentation is not None:
+            self._report_training(self.root.data, len(self.root.indices), started_at)
+
+    def _report_training(self, data, n_examples, started_at):
+        # Event with the nodes built and the time spent searching for splits at every depth
+        depths = sorted(data.depth_statistics)
+        statistics = [data.depth_statistics[depth] for depth in depths]
+        for depth, (_, split_searches, seconds) in zip(depths, statistics):
+            if split_searches:
+                data.instrumentation.add_time("regression_tree.split_search.depth_{}".format(depth), seconds,
+                                              split_searches)
+        nodes = sum(entry[0] for entry in statistics)
+        data.instrumentation.count("regression_tree.nodes", nodes)
+        data.instrumentation.emit("regression_tree.fit", n_examples=n_examples, nodes=nodes, depth=depths[-1],
+                                  nodes_per_depth=[entry[0] for entry in statistics],
+                                  split_search_seconds_per_depth=[entry[2] for entry in statistics],
+                                  seconds=time.perf_counter() - started_at)
 
     def predict(self, example):
+        if self.root is None:
+            return self._predict_compiled(example)
         node = self.root
         while node.label is None:
             if example[node.split_feature] <= node.split_value:
@@ -81,3 +336,278 @@ class RegressionTree:
             else:
                 node = node.right
         return node.label
+
+    def compile(self):
+        # Number the nodes breadth first and store them in flat arrays, leaves have split feature -1
+        if self.root is None:
+            # Already compiled (or loaded from flat arrays)
+            return self
+        nodes = [self.root]
+        depths = [0]
+        for node, depth in zip(nodes, depths):
+            if node.label is None:
+                nodes.extend([node.left, node.right])
+                depths.extend([depth + 1, depth + 1])
+        positions = {id(node): position for position, node in enumerate(nodes)}
+
+        self.split_features = np.full(len(nodes), -1, dtype=np.int32)
+        self.thresholds = np.zeros(len(nodes))
+        self.left_children = np.full(len(nodes), -1, dtype=np.int32)
+        self.right_children = np.full(len(nodes), -1, dtype=np.int32)
+        self.values = np.full(len(nodes), np.nan)
+        for position, node in enumerate(nodes):
+            if node.label is None:
+                self.split_features[position] = self.features.index(node.split_feature)
+                self.thresholds[position] = node.split_value
+                self.left_children[position] = positions[id(node.left)]
+                self.right_children[position] = positions[id(node.right)]
+            else:
+                self.values[position] = node.label
+        self.depth = max(depths)
+
+        # Dropping the root releases every node along with the training matrix they share
+        self.root = None
+        return self
+
+    def predict_batch(self, X):
+        # X holds one example per row with the columns in the order of self.features
+        if self.root is not None:
+            self.compile()
+        X = np.asarray(X, dtype=np.float64)
+        rows = np.arange(X.shape[0])
+        nodes = np.zeros(X.shape[0], dtype=np.int32)
+        for _ in range(self.depth):
+            split_features = self.split_features[nodes]
+            internal = split_features >= 0
+            if not internal.any():
+                break
+            goes_left = X[rows, np.maximum(split_features, 0)] <= self.thresholds[nodes]
+            children = np.where(goes_left, self.left_children[nodes], self.right_children[nodes])
+            nodes = np.where(internal, children, nodes)
+        return self.values[nodes]
+
+    def save(self, path):
+        # Saved as the flat arrays of the compiled tree, see model_concepts/persistence.py
+        from ..persistence import save_model
+
+        if self.root is not None:
+            self.compile()
+        return save_model(path, "RegressionTree", _tree_arrays([self]), {"features": self.features})
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        from ..persistence import load_model
+
+        arrays, metadata = load_model(path, "RegressionTree", mmap_mode)
+        return _trees_from_arrays(arrays, metadata["features"])[0]
+
+    @classmethod
+    def from_arrays(cls, features, split_features, thresholds, left_children, right_children, values, depth):
+        # Compiled tree from its flat arrays, without training data
+        tree = cls.__new__(cls)
+        tree.features = list(features)
+        tree.split_features = split_features
+        tree.thresholds = thresholds
+        tree.left_children = left_children
+        tree.right_children = right_children
+        tree.values = values
+        tree.depth = depth
+        tree.root = None
+        return tree
+
+    def _predict_compiled(self, example):
+        node = 0
+        while self.split_features[node] >= 0:
+            if example[self.features[self.split_features[node]]] <= self.thresholds[node]:
+                node = self.left_children[node]
+            else:
+                node = self.right_children[node]
+        return self.values[node].item()
+
+
+class GradientBoostedTrees:
+    def __init__(self, examples, features=DEFAULT_FEATURES, label_key="bpd", n_trees=100, learning_rate=0.1,
+                 max_depth=3, min_samples_leaf=1, subsample=1.0, colsample=1.0, split_method="exact", max_bins=255,
+                 seed=42, instrumentation=None):
+        self.data = TrainingData.from_examples(examples, features, label_key, split_method, max_bins)
+        self.data.instrument(instrumentation)
+        self.instrumentation = instrumentation
+        self.features = self.data.features
+        self.n_trees = n_trees
+        self.learning_rate = learning_rate
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
+        self.subsample = subsample
+        self.colsample = colsample
+        self.seed = seed
+        self.base_prediction = 0.0
+        self.trees = []
+        self.train()
+
+    def train(self):
+        rng = np.random.default_rng(self.seed)
+        n_examples = len(self.data.y)
+        # Squared loss, so every tree is fitted on the residuals and its leaves hold mean residuals
+        self.base_prediction = float(self.data.y.mean()) if n_examples else 0.0
+        predictions = np.full(n_examples, self.base_prediction)
+        if self.data.split_method == "exact":
+            self.data.presorted()
+        for tree_index in range(self.n_trees):
+            if not n_examples:
+                break
+            started_at = time.perf_counter()
+            rows = None
+            if self.subsample < 1:
+                n_sampled = max(1, int(round(self.subsample * n_examples)))
+                rows = np.sort(rng.choice(n_examples, n_sampled, replace=False))
+            data = self.data.view(y=self.data.y - predictions, colsample=self.colsample, rng=rng)
+            tree = RegressionTree(data, max_depth=self.max_depth, min_samples_leaf=self.min_samples_leaf,
+                                  rows=rows).compile()
+            predictions += self.learning_rate * tree.predict_batch(self.data.X)
+            self.trees.append(tree)
+            if self.instrumentation is not None:
+                self.instrumentation.emit("gradient_boosting.iteration", tree=tree_index,
+                                          training_mse=float(np.mean((self.data.y - predictions) ** 2)),
+                                          seconds=time.perf_counter() - started_at)
+        # The training data is only needed while fitting
+        self.data = None
+
+    def predict(self, example):
+        return self.predict_batch(_examples_matrix([example], self.features))[0].item()
+
+    def save(self, path):
+        from ..persistence import save_model
+
+        metadata = {name: getattr(self, name) for name in (
+            "features", "n_trees", "learning_rate", "max_depth", "min_samples_leaf", "subsample", "colsample", "seed",
+            "base_prediction")}
+        return save_model(path, "GradientBoostedTrees", _tree_arrays(self.trees), metadata)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        from ..persistence import load_model
+
+        arrays, metadata = load_model(path, "GradientBoostedTrees", mmap_mode)
+        model = cls.__new__(cls)
+        model.__dict__.update(metadata)
+        model.data = None
+        model.instrumentation = None
+        model.trees = _trees_from_arrays(arrays, metadata["features"])
+        return model
+
+    def predict_batch(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        predictions = np.full(X.shape[0], self.base_prediction)
+        for tree in self.trees:
+            predictions += self.learning_rate * tree.predict_batch(X)
+        return predictions
+
+
+# Training data of a forest worker process, attached to the shared memory blocks by _attach_shared_data
+_worker_data = None
+_worker_blocks = []
+
+
+def _attach_shared_data(descriptions, features, split_method, bin_edges):
+    from ..shared_memory import attach_shared_arrays
+
+    global _worker_data, _worker_blocks
+    arrays, _worker_blocks = attach_shared_arrays(descriptions)
+    _worker_data = TrainingData(arrays["X"], arrays["y"], features, split_method,
+                                bin_edges=bin_edges, bins=arrays.get("bins"), presorted=arrays.get("presorted"))
+
+
+def _fit_forest_tree(seed, bootstrap, colsample, max_depth, min_samples_leaf, data=None):
+    data = _worker_data if data is None else data
+    # Every tree draws its rows and features from its own seed, so the forest does not depend on n_jobs
+    rng = np.random.default_rng(seed)
+    n_examples = len(data.y)
+    rows = np.sort(rng.integers(0, n_examples, n_examples)) if bootstrap else None
+    return RegressionTree(data.view(colsample=colsample, rng=rng), max_depth=max_depth,
+                          min_samples_leaf=min_samples_leaf, rows=rows).compile()
+
+
+class RandomForest:
+    def __init__(self, examples, features=DEFAULT_FEATURES, label_key="bpd", n_trees=100, max_depth=None,
+                 min_samples_leaf=1, bootstrap=True, colsample=1.0, split_method="exact", max_bins=255, n_jobs=1,
+                 seed=42, instrumentation=None):
+        self.data = TrainingData.from_examples(examples, features, label_key, split_method, max_bins)
+        # With n_jobs > 1 the trees are built in other processes, and only the forest reports its trees
+        self.data.instrument(instrumentation if n_jobs == 1 else None)
+        self.instrumentation = instrumentation
+        self.features = self.data.features
+        self.n_trees = n_trees
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
+        self.bootstrap = bootstrap
+        self.colsample = colsample
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.seed = seed
+        self.trees = []
+        self.train()
+
+    def train(self):
+        if not len(self.data.y):
+            raise ValueError("RandomForest needs at least one example")
+        started_at = time.perf_counter()
+        seeds = np.random.SeedSequence(self.seed).generate_state(self.n_trees)
+        if self.data.split_method == "exact":
+            self.data.presorted()
+        options = (self.bootstrap, self.colsample, self.max_depth, self.min_samples_leaf)
+        if self.n_jobs == 1:
+            self.trees = [_fit_forest_tree(int(seed), *options, data=self.data) for seed in seeds]
+        else:
+            self.trees = self._train_parallel(seeds, options)
+        self.data = None
+        if self.instrumentation is not None:
+            self.instrumentation.emit("random_forest.fit", n_trees=len(self.trees), n_jobs=self.n_jobs,
+                                      nodes_per_tree=[len(tree.values) for tree in self.trees],
+                                      depths=[tree.depth for tree in self.trees],
+                                      seconds=time.perf_counter() - started_at)
+
+    def _train_parallel(self, seeds, options):
+        from ..shared_memory import SharedArrays
+
+        data = self.data
+        shared = SharedArrays()
+        try:
+            shared.add("X", data.X)
+            shared.add("y", data.y)
+            if data.split_method == "exact":
+                shared.add("presorted", data.presorted())
+            else:
+                shared.add("bins", data.bins)
+            # Only the names of the shared blocks are sent to the workers, the compiled trees are sent back
+            with ProcessPoolExecutor(self.n_jobs, initializer=_attach_shared_data,
+                                     initargs=(shared.descriptions, data.features, data.split_method,
+                                               data.bin_edges)) as pool:
+                futures = [pool.submit(_fit_forest_tree, int(seed), *options) for seed in seeds]
+                return [future.result() for future in futures]
+        finally:
+            shared.close()
+
+    def predict(self, example):
+        return self.predict_batch(_examples_matrix([example], self.features))[0].item()
+
+    def save(self, path):
+        from ..persistence import save_model
+
+        metadata = {name: getattr(self, name) for name in (
+            "features", "n_trees", "max_depth", "min_samples_leaf", "bootstrap", "colsample", "n_jobs", "seed")}
+        return save_model(path, "RandomForest", _tree_arrays(self.trees), metadata)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        from ..persistence import load_model
+
+        arrays, metadata = load_model(path, "RandomForest", mmap_mode)
+        model = cls.__new__(cls)
+        model.__dict__.update(metadata)
+        model.data = None
+        model.instrumentation = None
+        model.trees = _trees_from_arrays(arrays, metadata["features"])
+        return model
+
+    def predict_batch(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        return sum(tree.predict_batch(X) for tree in self.trees) / len(self.trees)
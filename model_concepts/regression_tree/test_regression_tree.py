@@ -0,0 +1,163 @@
+import numpy as np
+import pytest
+
+from model_concepts.regression_tree.regression_tree import (DEFAULT_FEATURES, GradientBoostedTrees, RandomForest,
+                                                            RegressionTree, TrainingData)
+
+
+class BaselineTreeNode:
+    # The original tree, which tries every midpoint of every feature with list comprehensions
+    def __init__(self, examples):
+        self.examples = examples
+        self.left = None
+        self.right = None
+        self.split_feature = None
+        self.split_value = None
+        self.label = None
+
+    def compute_mse(self, examples):
+        if len(examples) == 0:
+            return 0
+        labels = [example["bpd"] for example in examples]
+        mean = sum(labels) / len(labels)
+        return sum([(label - mean) ** 2 for label in labels]) / len(labels)
+
+    def find_best_split(self):
+        min_mse = float('inf')
+        best_feature = None
+        best_value = None
+        for feature in DEFAULT_FEATURES:
+            unique_values = sorted(set([example[feature] for example in self.examples]))
+            for i in range(1, len(unique_values)):
+                split_value = (unique_values[i - 1] + unique_values[i]) / 2
+                left_examples = [example for example in self.examples if example[feature] <= split_value]
+                right_examples = [example for example in self.examples if example[feature] > split_value]
+                mse = len(left_examples) / len(self.examples) * self.compute_mse(left_examples) + \
+                    len(right_examples) / len(self.examples) * self.compute_mse(right_examples)
+                if mse < min_mse:
+                    min_mse = mse
+                    best_feature = feature
+                    best_value = split_value
+        return best_feature, best_value
+
+    def split(self):
+        if len(self.examples) <= 1 or self.compute_mse(self.examples) == 0:
+            self.label = self.examples[0]["bpd"] if self.examples else None
+            return
+        self.split_feature, self.split_value = self.find_best_split()
+        self.left = BaselineTreeNode([example for example in self.examples
+                                      if example[self.split_feature] <= self.split_value])
+        self.left.split()
+        self.right = BaselineTreeNode([example for example in self.examples
+                                       if example[self.split_feature] > self.split_value])
+        self.right.split()
+
+    def predict(self, example):
+        node = self
+        while node.label is None:
+            node = node.left if example[node.split_feature] <= node.split_value else node.right
+        return node.label
+
+
+def brute_force_histogram_predict(X, y, bin_edges, x):
+    # Follows the split with the smallest error among all the bin edges, recomputing each side from scratch
+    rows = np.arange(len(y))
+    while len(rows) > 1 and y[rows].min() != y[rows].max():
+        best = None
+        for feature, edges in enumerate(bin_edges):
+            for edge in edges:
+                left = rows[X[rows, feature] <= edge]
+                right = rows[X[rows, feature] > edge]
+                if len(left) and len(right):
+                    sse = ((y[left] - y[left].mean()) ** 2).sum() + ((y[right] - y[right].mean()) ** 2).sum()
+                    if best is None or sse < best[0]:
+                        best = (sse, feature, edge)
+        if best is None:
+            return y[rows].mean()
+        _, feature, edge = best
+        rows = rows[(X[rows, feature] <= edge) == (x[feature] <= edge)]
+    return y[rows[0]]
+
+
+def make_examples(n_examples, seed, decimals=None):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 1, (n_examples, len(DEFAULT_FEATURES)))
+    if decimals is not None:
+        # Rounded features repeat values, so the tree has to skip splits between equal values
+        X = X.round(decimals)
+    y = np.sin(2 * X[:, 0]) + X[:, 1] * X[:, 2] + rng.normal(0, 0.1, n_examples)
+    return [dict(zip(DEFAULT_FEATURES, row.tolist()), bpd=float(label)) for row, label in zip(X, y)]
+
+
+def as_matrix(examples):
+    return np.array([[example[feature] for feature in DEFAULT_FEATURES] for example in examples])
+
+
+@pytest.mark.parametrize("decimals", [None, 1])
+def test_exact_splits_match_baseline(decimals):
+    examples = make_examples(150, seed=0, decimals=decimals)
+    baseline = BaselineTreeNode(examples)
+    baseline.split()
+    tree = RegressionTree(examples)
+    for example in examples + make_examples(200, seed=1):
+        assert tree.predict(example) == baseline.predict(example)
+
+
+def test_histogram_splits_match_brute_force():
+    examples = make_examples(120, seed=2)
+    tree = RegressionTree(examples, split_method="histogram", max_bins=8)
+    data = TrainingData.from_examples(examples, DEFAULT_FEATURES, "bpd", "histogram", 8)
+    for example in make_examples(50, seed=3):
+        x = [example[feature] for feature in DEFAULT_FEATURES]
+        assert tree.predict(example) == pytest.approx(brute_force_histogram_predict(data.X, data.y, data.bin_edges, x))
+
+
+def test_histogram_with_a_bin_per_value_fits_the_training_data():
+    examples = make_examples(200, seed=4)
+    tree = RegressionTree(examples, split_method="histogram", max_bins=1000)
+    assert [tree.predict(example) for example in examples] == [example["bpd"] for example in examples]
+
+
+@pytest.mark.parametrize("split_method", ["exact", "histogram"])
+def test_compiled_tree_predicts_like_the_nodes(split_method):
+    examples = make_examples(300, seed=5)
+    queries = make_examples(200, seed=6)
+    tree = RegressionTree(examples, max_depth=6, min_samples_leaf=3, split_method=split_method)
+    expected = [tree.predict(example) for example in queries]
+    np.testing.assert_array_equal(tree.predict_batch(as_matrix(queries)), expected)
+    # Compiling again is a no-op and the compiled tree still predicts one example at a time
+    assert tree.compile() is tree
+    assert [tree.predict(example) for example in queries] == expected
+
+
+def test_empty_tree_predicts_nan():
+    tree = RegressionTree([])
+    assert np.isnan(tree.predict_batch(np.zeros((3, len(DEFAULT_FEATURES))))).all()
+
+
+@pytest.mark.parametrize("split_method", ["exact", "histogram"])
+def test_forest_process_pool_gives_the_same_trees(split_method):
+    examples = make_examples(200, seed=7)
+    queries = as_matrix(make_examples(100, seed=8))
+    options = dict(n_trees=6, max_depth=5, colsample=0.5, split_method=split_method, max_bins=32)
+    serial = RandomForest(examples, n_jobs=1, **options)
+    parallel = RandomForest(examples, n_jobs=2, **options)
+    np.testing.assert_array_equal(parallel.predict_batch(queries), serial.predict_batch(queries))
+
+
+def test_boosting_reduces_the_training_error():
+    examples = make_examples(300, seed=9)
+    X = as_matrix(examples)
+    y = np.array([example["bpd"] for example in examples])
+    errors = [((GradientBoostedTrees(examples, n_trees=n_trees, subsample=0.8).predict_batch(X) - y) ** 2).mean()
+              for n_trees in (1, 10, 50)]
+    assert errors[0] > errors[1] > errors[2]
+
+
+def test_save_and_load(tmp_path):
+    examples = make_examples(200, seed=10)
+    queries = as_matrix(make_examples(50, seed=11))
+    forest = RandomForest(examples, n_trees=4, max_depth=4)
+    forest.save(str(tmp_path / "forest"))
+    np.testing.assert_array_equal(RandomForest.load(str(tmp_path / "forest")).predict_batch(queries),
+                                  forest.predict_batch(queries))
@@ -0,0 +1,583 @@
+"""
+Serving the from-scratch models behind one asyncio endpoint.
+
+The `predict` method of every model scores one example per Python call, so a service calling it once per request pays
+the interpreter overhead on every request. A `PredictionServer` instead queues the requests of each registered model
+and scores them with one call to the model's batch method (`predict_batch`, `predict_labels`, ...):
+- a batch is started as soon as it holds `max_batch_size` requests, or once its oldest request has waited
+  `max_latency_ms`. While all the workers of a model are busy, new requests keep queueing and are sent as one batch
+  when a worker frees up, so batches grow with the load;
+- batches run on a thread pool, or on a process pool for models loaded from a saved directory with
+  `SavedModelPredictor`, so the event loop keeps accepting requests while a batch is scored;
+- predictions are kept in an LRU cache keyed on the input. Repeated inputs are answered without being batched, and a
+  request for an input that is already being scored waits for that result instead of scoring it again.
+
+Every input is checked against the model (e.g. the number of features) before it is queued, so a malformed input is
+answered with a 400 on its own instead of failing the batch it would have joined. If a batch still fails, its inputs
+are scored again one at a time and only the ones that fail get the error.
+
+The server speaks a small subset of HTTP/1.1, with JSON bodies and keep-alive connections:
+    POST /models/<name>/predict   {"input": [0.3, -1.2, 0.8, 0.1]}   ->  {"prediction": 1.27}
+    POST /models/<name>/predict   {"inputs": [[...], [...]]}          ->  {"predictions": [...]}
+    GET  /models                                                      ->  batching and cache statistics per model
+
+Usage:
+    registry = ModelRegistry()
+    registry.register_model("bpd", RegressionTree(examples))
+    registry.register_saved("forest", "models/forest", executor="process")
+    asyncio.run(PredictionServer(registry).serve_forever(port=8080))
+
+or, for saved models, from the command line:
+    python -m model_concepts.serving --model forest=models/forest --model tags=models/nb --port 8080
+"""
+
+import argparse
+import asyncio
+import collections
+import functools
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+
+# Model types that can be saved and loaded, see model_concepts.persistence
+SAVED_MODEL_TYPES = ("KMeans", "RegressionTree", "GradientBoostedTrees", "RandomForest", "MultinomialNB", "Neuron")
+
+_HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                 413: "Payload Too Large", 500: "Internal Server Error"}
+
+_MISSING = object()
+
+
+class InvalidInputError(ValueError):
+    pass
+
+
+def batch_predict_fn(model, k=5):
+    # Function scoring a list of examples with one call to the batch method of the model, returning one JSON-friendly
+    # prediction per example. Tree models take rows in the order of model.features, or dicts keyed by feature name.
+    from . import (GradientBoostedTrees, KMeans, KNNIndex, LSHIndex, MultinomialNB, Neuron, RandomForest,
+                   RegressionTree)
+
+    if isinstance(model, MultinomialNB):
+        def predict(articles):
+            return [model.tags[index] for index in model.predict_batch(articles).argmax(axis=1).tolist()]
+    elif isinstance(model, (KNNIndex, LSHIndex)):
+        def predict(queries):
+            return model.predict_labels(queries, k)
+    elif isinstance(model, (RegressionTree, GradientBoostedTrees, RandomForest)):
+        # Compile a tree once here rather than concurrently in the first batches
+        if isinstance(model, RegressionTree) and model.root is not None:
+            model.compile()
+
+        def predict(examples):
+            return model.predict_batch(_feature_rows(examples, model.features)).tolist()
+    elif isinstance(model, Neuron):
+        def predict(features):
+            return model.predict_batch(features).tolist()
+    elif isinstance(model, KMeans):
+        def predict(features):
+            return model.predict(features).tolist()
+    else:
+        raise ValueError("Unknown model type '{}', expected a MultinomialNB, KNNIndex, LSHIndex, RegressionTree, "
+                         "GradientBoostedTrees, RandomForest, Neuron or KMeans".format(type(model).__name__))
+    return predict
+
+
+def input_validator(model):
+    # Function raising InvalidInputError for an input the model cannot score, run before the input joins a batch
+    from . import (GradientBoostedTrees, KMeans, KNNIndex, LSHIndex, MultinomialNB, Neuron, RandomForest,
+                   RegressionTree)
+
+    if isinstance(model, MultinomialNB):
+        return _check_article
+    if isinstance(model, (KNNIndex, LSHIndex)):
+        return functools.partial(_check_vector, n_features=model.points.shape[1])
+    if isinstance(model, (RegressionTree, GradientBoostedTrees, RandomForest)):
+        return functools.partial(_check_row, features=model.features)
+    if isinstance(model, Neuron):
+        return functools.partial(_check_vector, n_features=len(model.weights) - 1)
+    if isinstance(model, KMeans):
+        return functools.partial(_check_vector, n_features=model.centroids.shape[1])
+    raise ValueError("Unknown model type '{}', expected a MultinomialNB, KNNIndex, LSHIndex, RegressionTree, "
+                     "GradientBoostedTrees, RandomForest, Neuron or KMeans".format(type(model).__name__))
+
+
+def _check_vector(example, n_features):
+    if isinstance(example, (str, bytes, dict)):
+        raise InvalidInputError("Expected a list of {} numbers, got a {}".format(n_features, type(example).__name__))
+    try:
+        vector = np.asarray(example, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise InvalidInputError("Expected a list of {} numbers".format(n_features)) from None
+    if vector.shape != (n_features,):
+        raise InvalidInputError("Expected a list of {} numbers, got shape {}".format(n_features, vector.shape))
+
+
+def _check_row(example, features):
+    if isinstance(example, dict):
+        missing = [feature for feature in features if feature not in example]
+        if missing:
+            raise InvalidInputError("Missing features {}".format(", ".join(missing)))
+        example = [example[feature] for feature in features]
+    _check_vector(example, len(features))
+
+
+def _check_article(example):
+    if not isinstance(example, (list, tuple)) or not all(isinstance(word, str) for word in example):
+        raise InvalidInputError("Expected a list of words")
+
+
+def _feature_rows(examples, features):
+    return [[example[feature] for feature in features] if isinstance(example, dict) else example
+            for example in examples]
+
+
+def saved_model_type(path):
+    from .persistence import METADATA_FILE
+
+    with open(os.path.join(path, METADATA_FILE)) as metadata_file:
+        model_type = json.load(metadata_file)["model_type"]
+    if model_type not in SAVED_MODEL_TYPES:
+        raise ValueError("Unknown saved model type '{}', expected one of {}".format(
+            model_type, ", ".join(SAVED_MODEL_TYPES)))
+    return model_type
+
+
+# Path -> batch predict function and input validator of the models loaded by SavedModelPredictor in this process
+_LOADED_PREDICT_FNS = {}
+
+
+class SavedModelPredictor:
+    # Picklable batch predict function of a saved model, for process pools. Only the path is sent to the workers;
+    # each process loads the model on its first batch and keeps it. The arrays are memory-mapped, so all the
+    # workers share one copy of them through the page cache.
+    def __init__(self, path, k=5):
+        self.path = os.path.abspath(path)
+        self.model_type = saved_model_type(path)
+        self.k = k
+
+    def __call__(self, examples):
+        return self._loaded()[0](examples)
+
+    def validate(self, example):
+        # Runs in the server process, which maps the model once for its validator
+        self._loaded()[1](example)
+
+    def _loaded(self):
+        loaded = _LOADED_PREDICT_FNS.get(self.path)
+        if loaded is None:
+            model_class = getattr(importlib.import_module(__package__), self.model_type)
+            model = model_class.load(self.path)
+            loaded = (batch_predict_fn(model, self.k), input_validator(model))
+            _LOADED_PREDICT_FNS[self.path] = loaded
+        return loaded
+
+
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        value = self.entries.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+def cache_key(example):
+    # Hashable form of an input (nested lists, tuples, dicts, strings, numbers or NumPy arrays),
+    # or None for inputs that cannot be cached
+    try:
+        key = _hashable(example)
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _hashable(value):
+    if isinstance(value, np.ndarray):
+        return ("ndarray", value.dtype.str, value.shape, value.tobytes())
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(item) for item in value)
+    if isinstance(value, dict):
+        return ("dict",) + tuple(sorted((key, _hashable(item)) for key, item in value.items()))
+    return value
+
+
+class ServedModel:
+    # A registered model: its batch predict function, batching settings, cache and statistics. The queue of
+    # pending requests lives on the event loop of the server, so it is only touched from that loop.
+    def __init__(self, name, predict_fn, max_batch_size=64, max_latency_ms=5, executor="thread",
+                 max_concurrent_batches=None, cache_size=10000, validate=None):
+        if executor not in ("thread", "process"):
+            raise ValueError("Unknown executor '{}', expected 'thread' or 'process'".format(executor))
+        self.name = name
+        self.predict_fn = predict_fn
+        # Optional function raising InvalidInputError for an input that must not join a batch
+        self.validate = validate
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self.executor = executor
+        # Batches scored at the same time, by default one per worker of the pool
+        self.max_concurrent_batches = max_concurrent_batches
+        self.cache = LRUCache(cache_size) if cache_size else None
+
+        self.pending = []
+        self.in_flight = {}
+        self.running_batches = 0
+        self.timer = None
+
+        self.requests = 0
+        self.coalesced_requests = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.failed_batches = 0
+        self.latencies = collections.deque(maxlen=100000)
+
+    async def predict(self, example, pool, max_concurrent_batches):
+        loop = asyncio.get_running_loop()
+        started_at = time.perf_counter()
+        self.requests += 1
+        if self.validate is not None:
+            self.validate(example)
+        key = cache_key(example) if self.cache is not None else None
+        if key is not None:
+            prediction = self.cache.get(key, _MISSING)
+            if prediction is not _MISSING:
+                self.latencies.append(time.perf_counter() - started_at)
+                return prediction
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.coalesced_requests += 1
+        else:
+            future = None
+
+        if future is None:
+            future = loop.create_future()
+            if key is not None:
+                self.in_flight[key] = future
+            self.pending.append((example, key, future))
+            self._schedule(loop, pool, self.max_concurrent_batches or max_concurrent_batches)
+
+        # Shielded, so a client that disconnects does not cancel a result other requests are waiting for
+        prediction = await asyncio.shield(future)
+        self.latencies.append(time.perf_counter() - started_at)
+        return prediction
+
+    def _schedule(self, loop, pool, max_concurrent_batches):
+        if len(self.pending) >= self.max_batch_size:
+            self._dispatch(loop, pool, max_concurrent_batches)
+        elif self.timer is None and self.running_batches < max_concurrent_batches:
+            # With every worker busy there is no timer: the queue is sent as soon as a batch finishes
+            self.timer = loop.call_later(self.max_latency, self._dispatch, loop, pool, max_concurrent_batches)
+
+    def _dispatch(self, loop, pool, max_concurrent_batches):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        while self.pending and self.running_batches < max_concurrent_batches:
+            batch = self.pending[:self.max_batch_size]
+            del self.pending[:self.max_batch_size]
+            self.running_batches += 1
+            self.batches += 1
+            self.batched_requests += len(batch)
+            scoring = loop.run_in_executor(pool, self.predict_fn, [example for example, _, _ in batch])
+            scoring.add_done_callback(functools.partial(self._finish, batch, loop, pool, max_concurrent_batches))
+
+    def _finish(self, batch, loop, pool, max_concurrent_batches, scoring):
+        try:
+            predictions = _prediction_list(scoring.result(), len(batch), self.name)
+        except Exception as error:
+            if len(batch) > 1:
+                # Score the inputs one at a time, so only the ones that fail get the error. The batch keeps its
+                # worker until then.
+                self.failed_batches += 1
+                retry = loop.run_in_executor(pool, _predict_each, self.predict_fn,
+                                             [example for example, _, _ in batch], self.name)
+                retry.add_done_callback(functools.partial(self._finish_each, batch, loop, pool,
+                                                          max_concurrent_batches))
+                return
+            outcomes = [(None, error)]
+        else:
+            outcomes = [(prediction, None) for prediction in predictions]
+        self._resolve(batch, outcomes, loop, pool, max_concurrent_batches)
+
+    def _finish_each(self, batch, loop, pool, max_concurrent_batches, retry):
+        try:
+            outcomes = retry.result()
+        except Exception as error:
+            outcomes = [(None, error)] * len(batch)
+        self._resolve(batch, outcomes, loop, pool, max_concurrent_batches)
+
+    def _resolve(self, batch, outcomes, loop, pool, max_concurrent_batches):
+        self.running_batches -= 1
+        for (_, key, future), (prediction, error) in zip(batch, outcomes):
+            self.in_flight.pop(key, None)
+            if error is None and key is not None:
+                self.cache.put(key, prediction)
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(prediction)
+            else:
+                future.set_exception(error)
+
+        # Requests that queued while every worker was busy have already waited, so they go out right away
+        if self.pending:
+            self._dispatch(loop, pool, max_concurrent_batches)
+
+    def stats(self):
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "executor": self.executor,
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": self.batched_requests / self.batches if self.batches else None,
+            "failed_batches": self.failed_batches,
+            "cache_hits": self.cache.hits if self.cache is not None else 0,
+            "coalesced_requests": self.coalesced_requests,
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+        }
+
+
+def _prediction_list(predictions, n_examples, name):
+    predictions = predictions.tolist() if hasattr(predictions, "tolist") else list(predictions)
+    if len(predictions) != n_examples:
+        raise ValueError("The predict function of '{}' returned {} predictions for a batch of {}".format(
+            name, len(predictions), n_examples))
+    return predictions
+
+
+def _predict_each(predict_fn, examples, name):
+    # (prediction, error) of every example scored on its own, run on the pool after its batch failed
+    outcomes = []
+    for example in examples:
+        try:
+            outcomes.append((_prediction_list(predict_fn([example]), 1, name)[0], None))
+        except Exception as error:
+            outcomes.append((None, error))
+    return outcomes
+
+
+class ModelRegistry:
+    def __init__(self):
+        self.models = {}
+
+    def register(self, name, predict_fn, **options):
+        # predict_fn takes a list of inputs and returns one prediction per input. With executor="process" it has
+        # to be picklable, e.g. a SavedModelPredictor. The options are those of ServedModel.
+        self.models[name] = ServedModel(name, predict_fn, **options)
+        return self.models[name]
+
+    def register_model(self, name, model, k=5, **options):
+        options.setdefault("validate", input_validator(model))
+        return self.register(name, batch_predict_fn(model, k), **options)
+
+    def register_saved(self, name, path, k=5, **options):
+        predictor = SavedModelPredictor(path, k)
+        options.setdefault("validate", predictor.validate)
+        return self.register(name, predictor, **options)
+
+    def __getitem__(self, name):
+        if name not in self.models:
+            raise KeyError("Unknown model '{}', expected one of {}".format(name, ", ".join(sorted(self.models))))
+        return self.models[name]
+
+    def __contains__(self, name):
+        return name in self.models
+
+    def __iter__(self):
+        return iter(self.models)
+
+
+class PredictionServer:
+    def __init__(self, registry, n_threads=4, n_processes=None, max_body_bytes=1 << 20):
+        self.registry = registry
+        # Larger request bodies are answered with a 413 without being read
+        self.max_body_bytes = max_body_bytes
+        self.n_threads = n_threads
+        self.n_processes = n_processes or os.cpu_count()
+        self.thread_pool = None
+        self.process_pool = None
+        self.server = None
+
+    async def predict(self, name, example):
+        model = self.registry[name]
+        if model.executor == "process":
+            return await model.predict(example, self._process_pool(), self.n_processes)
+        if self.thread_pool is None:
+            self.thread_pool = ThreadPoolExecutor(self.n_threads, thread_name_prefix="prediction")
+        return await model.predict(example, self.thread_pool, self.n_threads)
+
+    async def predict_many(self, name, examples):
+        # Every input is checked before any of them is queued, so a bad input fails the request alone
+        validate = self.registry[name].validate
+        if validate is not None:
+            for position, example in enumerate(examples):
+                try:
+                    validate(example)
+                except InvalidInputError as error:
+                    raise InvalidInputError("Input {}: {}".format(position, error)) from None
+        return await asyncio.gather(*(self.predict(name, example) for example in examples))
+
+    def stats(self):
+        return {name: self.registry[name].stats() for name in self.registry}
+
+    def _process_pool(self):
+        if self.process_pool is None:
+            self.process_pool = ProcessPoolExecutor(self.n_processes)
+        return self.process_pool
+
+    async def start(self, host="127.0.0.1", port=8080):
+        if any(self.registry[name].executor == "process" for name in self.registry):
+            # Workers forked while serving would inherit the listening socket and the open connections, which then
+            # never see EOF when the server closes them, so they are all started before the server listens
+            await asyncio.wrap_future(self._process_pool().submit(int))
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self, host="127.0.0.1", port=8080):
+        await self.start(host, port)
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        for pool in (self.thread_pool, self.process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self.thread_pool = self.process_pool = None
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode("latin-1").split()
+                try:
+                    content_length = int(headers.get("content-length", 0))
+                except ValueError:
+                    content_length = -1
+                # The body of a rejected length is never read, so the connection is closed after the reply
+                keep_alive = 0 <= content_length <= self.max_body_bytes
+                if content_length < 0:
+                    status, payload = 400, {"error": "Invalid Content-Length"}
+                elif content_length > self.max_body_bytes:
+                    status, payload = 413, {"error": "Request body larger than {} bytes".format(self.max_body_bytes)}
+                else:
+                    body = await reader.readexactly(content_length)
+                    if len(parts) != 3:
+                        status, payload = 400, {"error": "Malformed request line"}
+                    else:
+                        status, payload = await self._route(parts[0], parts[1], body)
+                keep_alive = (keep_alive and len(parts) == 3 and parts[2] == "HTTP/1.1"
+                              and headers.get("connection", "").lower() != "close")
+                writer.write(_http_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, target, body):
+        path = target.split("?", 1)[0].strip("/").split("/")
+        if path == ["models"]:
+            if method != "GET":
+                return 405, {"error": "Expected GET /models"}
+            return 200, {"models": self.stats()}
+        if len(path) != 3 or path[0] != "models" or path[2] != "predict":
+            return 404, {"error": "Unknown path '{}'".format(target)}
+        if method != "POST":
+            return 405, {"error": "Expected POST /models/<name>/predict"}
+        if path[1] not in self.registry:
+            return 404, {"error": "Unknown model '{}'".format(path[1])}
+
+        try:
+            request = json.loads(body)
+        except ValueError as error:
+            return 400, {"error": "Invalid JSON body: {}".format(error)}
+        if not isinstance(request, dict) or ("input" in request) == ("inputs" in request):
+            return 400, {"error": "Expected a JSON object with either 'input' or 'inputs'"}
+        if "inputs" in request and not isinstance(request["inputs"], list):
+            return 400, {"error": "Expected 'inputs' to be a list"}
+        try:
+            if "input" in request:
+                return 200, {"prediction": await self.predict(path[1], request["input"])}
+            return 200, {"predictions": await self.predict_many(path[1], request["inputs"])}
+        except InvalidInputError as error:
+            return 400, {"error": str(error)}
+        except Exception as error:
+            return 500, {"error": "{}: {}".format(type(error).__name__, error)}
+
+
+def _http_response(status, payload, keep_alive):
+    body = json.dumps(payload).encode()
+    head = "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n".format(
+        status, _HTTP_REASONS[status], len(body), "keep-alive" if keep_alive else "close")
+    return head.encode("latin-1") + body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", action="append", required=True, metavar="NAME=PATH",
+                        help="saved model to serve, can be repeated")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-latency-ms", type=float, default=5)
+    parser.add_argument("--cache-size", type=int, default=10000)
+    parser.add_argument("--k", type=int, default=5, help="neighbors used by nearest-neighbor models")
+    parser.add_argument("--max-body-bytes", type=int, default=1 << 20, help="largest accepted request body")
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    for model in args.model:
+        name, _, path = model.partition("=")
+        registry.register_saved(name, path, k=args.k, executor=args.executor, max_batch_size=args.max_batch_size,
+                                max_latency_ms=args.max_latency_ms, cache_size=args.cache_size)
+    print("Serving {} on http://{}:{}".format(", ".join(registry), args.host, args.port))
+    server = PredictionServer(registry, max_body_bytes=args.max_body_bytes)
+    asyncio.run(server.serve_forever(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+NumPy arrays in `multiprocessing.shared_memory` blocks, for the process pools of the from-scratch models.
+
+The parent copies its arrays into a `SharedArrays` once and passes its `descriptions` (block names, shapes and
+dtypes) to the pool initializer. Every worker maps the same blocks with `attach_shared_arrays`, so the data is never
+pickled into the jobs. Used by the random forest, parallel k-means and the hyperparameter search.
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedArrays:
+    # NumPy arrays in shared memory blocks. Only `descriptions` (block names, shapes and dtypes) are sent to the
+    # workers, which map the same blocks with attach_shared_arrays.
+    def __init__(self):
+        self.blocks = []
+        self.arrays = {}
+        self.descriptions = {}
+
+    def add(self, name, array=None, shape=None, dtype=None):
+        # Copies `array` into a new block, or allocates a zeroed one of the given shape and dtype
+        shape, dtype = (array.shape, array.dtype) if array is not None else (tuple(shape), np.dtype(dtype))
+        block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        self.blocks.append(block)
+        self.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        self.arrays[name][...] = 0 if array is None else array
+        self.descriptions[name] = (block.name, shape, dtype.str)
+        return self.arrays[name]
+
+    def close(self):
+        self.arrays = {}
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def attach_shared_arrays(descriptions):
+    # The blocks are returned with the arrays, which are only valid while their block is open
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in descriptions.values()]
+    arrays = {name: np.ndarray(shape, dtype=dtype, buffer=block.buf)
+              for (name, (_, shape, dtype)), block in zip(descriptions.items(), blocks)}
+    return arrays, blocks
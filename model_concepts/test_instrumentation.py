@@ -0,0 +1,48 @@
+import json
+
+import numpy as np
+
+from model_concepts.instrumentation import Instrumentation, JSONLinesCallback
+from model_concepts.k_means.k_means_clustering import KMeans
+from model_concepts.regression_tree.regression_tree import DEFAULT_FEATURES, RegressionTree
+
+
+def test_events_counters_and_timers(tmp_path):
+    received = []
+    instrumentation = Instrumentation(callbacks=[received.append, JSONLinesCallback(str(tmp_path / "events.jsonl"))])
+    instrumentation.emit("step", loss=np.float64(0.5), sizes=np.arange(3))
+    instrumentation.count("examples", 10)
+    instrumentation.count("examples", 5)
+    instrumentation.add_time("fit", 0.25, calls=2)
+    with instrumentation.timer("fit"):
+        pass
+
+    assert received == instrumentation.events
+    assert json.loads((tmp_path / "events.jsonl").read_text())["sizes"] == [0, 1, 2]
+    summary = instrumentation.to_dict()
+    assert summary["counters"] == {"examples": 15}
+    assert summary["timers"]["fit"]["calls"] == 3
+    assert summary["timers"]["fit"]["total_seconds"] >= 0.25
+    instrumentation.dump_json(str(tmp_path / "metrics.json"))
+    assert json.loads((tmp_path / "metrics.json").read_text())["counters"] == {"examples": 15}
+    # Timers show up in the pstats report like profiled functions
+    assert "fit" in instrumentation.report()
+
+
+def test_instrumentation_does_not_change_the_models():
+    rng = np.random.default_rng(0)
+    points = rng.normal(0, 1, (300, 3))
+    instrumentation = Instrumentation()
+    plain = KMeans(4, metric="euclidean").fit(points)
+    instrumented = KMeans(4, metric="euclidean", instrumentation=instrumentation).fit(points)
+    np.testing.assert_array_equal(instrumented.centroids, plain.centroids)
+    iterations = [event for event in instrumentation.events if event["event"] == "k_means.iteration"]
+    assert iterations
+
+    examples = [dict(zip(DEFAULT_FEATURES, row.tolist()), bpd=float(row.sum())) for row in rng.normal(0, 1, (200, 4))]
+    instrumentation = Instrumentation()
+    plain = RegressionTree(examples, max_depth=5).compile()
+    instrumented = RegressionTree(examples, max_depth=5, instrumentation=instrumentation).compile()
+    np.testing.assert_array_equal(instrumented.values, plain.values)
+    fit, = [event for event in instrumentation.events if event["event"] == "regression_tree.fit"]
+    assert fit["nodes"] == len(plain.values) == instrumentation.counters["regression_tree.nodes"]
@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pytest
+
+from model_concepts.knn.knn_classification import predict_label
+from model_concepts.model_selection import (HyperparameterSearch, KNNTask, MultinomialNBTask, NeuronTask,
+                                            RegressionTreeTask, k_fold)
+from model_concepts.regression_tree.regression_tree import DEFAULT_FEATURES, RegressionTree
+
+
+def knn_examples(n_examples=90, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.normal(0, 1, (n_examples, 3))
+    labels = (points[:, 0] + rng.normal(0, 0.7, n_examples) > 0).astype(int)
+    return {"pid_{}".format(i): {"features": point.tolist(), "is_intrusive": int(label)}
+            for i, (point, label) in enumerate(zip(points, labels))}
+
+
+def tree_examples(n_examples=120, seed=1):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 1, (n_examples, len(DEFAULT_FEATURES)))
+    y = np.sin(2 * X[:, 0]) + X[:, 1] + rng.normal(0, 0.2, n_examples)
+    return [dict(zip(DEFAULT_FEATURES, row.tolist()), bpd=float(label)) for row, label in zip(X, y)]
+
+
+def shared_memory_blocks():
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+def test_knn_scores_match_predict_label():
+    examples = knn_examples()
+    search = HyperparameterSearch(KNNTask(examples), n_folds=3)
+    results = search.grid({"k": [1, 4, 7]})
+    pids = list(examples)
+    for result in results:
+        for fold, score in enumerate(result["fold_scores"]):
+            train = {pid: examples[pid] for pid, pid_fold in zip(pids, search.folds) if pid_fold != fold}
+            test = [pid for pid, pid_fold in zip(pids, search.folds) if pid_fold == fold]
+            expected = np.mean([predict_label(train, examples[pid]["features"], result["params"]["k"]) ==
+                                examples[pid]["is_intrusive"] for pid in test])
+            assert score == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("params", [{"max_depth": 3}, {"max_depth": 5, "min_samples_leaf": 4},
+                                    {"split_method": "histogram", "max_bins": 8},
+                                    {"split_method": "histogram", "max_bins": 64, "max_depth": 4}])
+def test_regression_tree_scores_match_trees_of_the_training_examples(params):
+    examples = tree_examples()
+    search = HyperparameterSearch(RegressionTreeTask(examples), n_folds=3)
+    result, = search.evaluate([params])
+    for fold, score in enumerate(result["fold_scores"]):
+        train = [example for example, example_fold in zip(examples, search.folds) if example_fold != fold]
+        test = [example for example, example_fold in zip(examples, search.folds) if example_fold == fold]
+        tree = RegressionTree(train, **params)
+        expected = np.mean([(tree.predict(example) - example["bpd"]) ** 2 for example in test])
+        assert score == pytest.approx(-expected, rel=1e-12)
+
+
+def test_histogram_params_change_the_scores():
+    search = HyperparameterSearch(RegressionTreeTask(tree_examples()), n_folds=3)
+    results = search.evaluate([{"split_method": "histogram", "max_bins": 2},
+                               {"split_method": "histogram", "max_bins": 128}])
+    assert results[0]["params"]["max_bins"] == 128
+    assert results[0]["mean_score"] > results[1]["mean_score"]
+
+
+def test_unknown_regression_tree_params_are_refused():
+    search = HyperparameterSearch(RegressionTreeTask(tree_examples()), n_folds=3)
+    with pytest.raises(ValueError):
+        search.evaluate([{"max_depth": 3, "n_trees": 10}])
+
+
+def test_successive_halving_budgets():
+    search = HyperparameterSearch(RegressionTreeTask(tree_examples()), n_folds=3)
+    candidates = [{"max_depth": depth, "min_samples_leaf": leaf} for depth in (1, 2, 3, 5, None)
+                  for leaf in (1, 5)]
+    results = search.successive_halving(candidates, factor=3)
+    budgets = {}
+    for result in results:
+        budgets.setdefault(result["rung"], set()).add(result["budget"])
+    # 10 candidates: budgets 1/9, 1/3 and 1 with 10, 3 and 1 candidates
+    assert sorted(budgets) == [0, 1, 2]
+    assert [budgets[rung].pop() for rung in (0, 1, 2)] == pytest.approx([1 / 9, 1 / 3, 1])
+    assert [sum(result["rung"] == rung for result in results) for rung in (0, 1, 2)] == [10, 3, 1]
+    assert search.best_params == results[0]["params"]
+
+
+@pytest.mark.parametrize("options", [{"min_budget": 0}, {"min_budget": -0.5}, {"min_budget": 1.5},
+                                     {"factor": 1}])
+def test_successive_halving_refuses_bad_settings(options):
+    search = HyperparameterSearch(RegressionTreeTask(tree_examples()), n_folds=3)
+    with pytest.raises(ValueError):
+        search.successive_halving({"max_depth": [1, 2, 3]}, **options)
+
+
+def test_successive_halving_needs_candidates():
+    search = HyperparameterSearch(RegressionTreeTask(tree_examples()), n_folds=3)
+    with pytest.raises(ValueError):
+        search.successive_halving([])
+
+
+def test_process_pool_gives_the_same_results():
+    blocks_before = shared_memory_blocks()
+    tasks = [
+        (KNNTask(knn_examples()), {"k": [1, 3, 5]}),
+        (RegressionTreeTask(tree_examples()), {"max_depth": [2, 4], "split_method": ["exact", "histogram"]}),
+        (NeuronTask([{"features": example["features"], "label": example["is_intrusive"]}
+                     for example in knn_examples().values()]), {"lr": [0.01, 0.1], "n_epochs": [5]}),
+        (MultinomialNBTask({"a": [["x", "y"], ["x"], ["x", "z"]] * 3, "b": [["y", "z"], ["z"], ["w"]] * 3}),
+         {"alpha": [0.5, 1, 2]}),
+    ]
+    for task, grid in tasks:
+        serial = HyperparameterSearch(task, n_folds=3).grid(grid)
+        parallel = HyperparameterSearch(task, n_folds=3, n_jobs=2).grid(grid)
+        assert [result["params"] for result in parallel] == [result["params"] for result in serial]
+        assert [result["fold_scores"] for result in parallel] == [result["fold_scores"] for result in serial]
+    assert shared_memory_blocks() == blocks_before
+
+
+def test_folds_are_balanced():
+    folds = k_fold(103, 5)
+    assert sorted(np.bincount(folds).tolist()) == [20, 20, 21, 21, 21]
@@ -0,0 +1,61 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from model_concepts.persistence import FORMAT_VERSION, METADATA_FILE, load_model, save_model
+
+
+def test_round_trip_is_memory_mapped(tmp_path):
+    path = str(tmp_path / "model")
+    save_model(path, "Model", {"weights": np.arange(6.0).reshape(2, 3)}, {"alpha": 1, "tags": [0, 1]})
+    arrays, metadata = load_model(path, "Model")
+    assert isinstance(arrays["weights"], np.memmap)
+    np.testing.assert_array_equal(arrays["weights"], np.arange(6.0).reshape(2, 3))
+    assert metadata == {"alpha": 1, "tags": [0, 1]}
+    arrays, _ = load_model(path, "Model", mmap_mode=None)
+    assert not isinstance(arrays["weights"], np.memmap)
+
+
+def test_overwrite_replaces_every_file(tmp_path):
+    path = str(tmp_path / "model")
+    save_model(path, "Model", {"weights": np.zeros(3), "bias": np.zeros(1)})
+    save_model(path, "Model", {"weights": np.ones(2)})
+    arrays, _ = load_model(path, "Model")
+    assert sorted(os.listdir(path)) == [METADATA_FILE, "weights.npy"]
+    np.testing.assert_array_equal(arrays["weights"], np.ones(2))
+    # No temporary or moved aside directory is left next to the model
+    assert os.listdir(str(tmp_path)) == ["model"]
+
+
+def test_failed_save_keeps_the_old_model(tmp_path):
+    path = str(tmp_path / "model")
+    save_model(path, "Model", {"weights": np.zeros(3)})
+    with pytest.raises(ValueError):
+        # Object arrays cannot be saved without pickling
+        save_model(path, "Model", {"weights": np.array([{}], dtype=object)})
+    np.testing.assert_array_equal(load_model(path, "Model")[0]["weights"], np.zeros(3))
+    assert os.listdir(str(tmp_path)) == ["model"]
+
+
+def test_refuses_to_overwrite_a_directory_that_is_not_a_model(tmp_path):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "notes.txt").write_text("keep me")
+    with pytest.raises(ValueError):
+        save_model(str(tmp_path / "data"), "Model", {"weights": np.zeros(1)})
+    assert (tmp_path / "data" / "notes.txt").read_text() == "keep me"
+
+
+def test_load_checks_the_model_type_and_version(tmp_path):
+    path = str(tmp_path / "model")
+    save_model(path, "Model", {"weights": np.zeros(1)})
+    with pytest.raises(ValueError):
+        load_model(path, "OtherModel")
+    with open(os.path.join(path, METADATA_FILE)) as metadata_file:
+        header = json.load(metadata_file)
+    header["format_version"] = FORMAT_VERSION + 1
+    with open(os.path.join(path, METADATA_FILE), "w") as metadata_file:
+        json.dump(header, metadata_file)
+    with pytest.raises(ValueError):
+        load_model(path, "Model")
@@ -0,0 +1,157 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from model_concepts.regression_tree.regression_tree import DEFAULT_FEATURES, RegressionTree
+from model_concepts.serving import InvalidInputError, ModelRegistry, PredictionServer
+
+
+def make_tree():
+    rng = np.random.default_rng(0)
+    X = rng.normal(0, 1, (100, len(DEFAULT_FEATURES)))
+    examples = [dict(zip(DEFAULT_FEATURES, row.tolist()), bpd=float(row[0] - row[1])) for row in X]
+    return RegressionTree(examples, max_depth=4)
+
+
+def queries(n_queries, seed=1):
+    return np.random.default_rng(seed).normal(0, 1, (n_queries, len(DEFAULT_FEATURES))).tolist()
+
+
+async def http_request(port, method, target, body=b"", headers=None):
+    # One request on its own connection, returns the status and the decoded JSON payload
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    lines = ["{} {} HTTP/1.1".format(method, target), "Connection: close"]
+    headers = dict({"Content-Length": str(len(body))}, **(headers or {}))
+    lines += ["{}: {}".format(name, value) for name, value in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+def serve(registry, requests, **options):
+    # Runs the server on a free port and sends the requests one after another
+    async def run():
+        server = PredictionServer(registry, **options)
+        await server.start(port=0)
+        try:
+            return [await http_request(server.port, *request) for request in requests]
+        finally:
+            server.close()
+
+    return asyncio.run(run())
+
+
+def test_http_predictions_match_the_model():
+    tree = make_tree()
+    registry = ModelRegistry()
+    registry.register_model("bpd", tree)
+    rows = queries(5)
+    named = dict(zip(DEFAULT_FEATURES, rows[0]))
+    responses = serve(registry, [
+        ("POST", "/models/bpd/predict", json.dumps({"input": rows[0]}).encode()),
+        ("POST", "/models/bpd/predict", json.dumps({"input": named}).encode()),
+        ("POST", "/models/bpd/predict", json.dumps({"inputs": rows}).encode()),
+        ("GET", "/models"),
+    ])
+    expected = tree.predict_batch(rows).tolist()
+    assert responses[0] == (200, {"prediction": expected[0]})
+    assert responses[1] == (200, {"prediction": expected[0]})
+    assert responses[2] == (200, {"predictions": expected})
+    status, payload = responses[3]
+    assert status == 200 and payload["models"]["bpd"]["requests"] == 7
+
+
+def test_http_errors():
+    registry = ModelRegistry()
+    registry.register_model("bpd", make_tree())
+    responses = serve(registry, [
+        ("POST", "/models/bpd/predict", json.dumps({"input": [1, 2]}).encode()),
+        ("POST", "/models/bpd/predict", json.dumps({"inputs": [queries(1)[0], {"porosity": 1}]}).encode()),
+        ("POST", "/models/bpd/predict", b"{not json"),
+        ("POST", "/models/bpd/predict", json.dumps({"input": [1], "inputs": []}).encode()),
+        ("POST", "/models/other/predict", json.dumps({"input": [1]}).encode()),
+        ("GET", "/models/bpd/predict"),
+        ("POST", "/models/bpd/predict", b"", {"Content-Length": "abc"}),
+        ("POST", "/models/bpd/predict", b"", {"Content-Length": "-5"}),
+        ("POST", "/models/bpd/predict", b"", {"Content-Length": "5000"}),
+    ], max_body_bytes=1000)
+    assert [status for status, _ in responses] == [400, 400, 400, 400, 404, 405, 400, 400, 413]
+    assert all("error" in payload for _, payload in responses)
+
+
+def test_concurrent_requests_are_batched_and_cached():
+    tree = make_tree()
+    registry = ModelRegistry()
+    served = registry.register_model("bpd", tree, max_batch_size=16, max_latency_ms=50)
+    rows = queries(40)
+
+    async def run():
+        server = PredictionServer(registry)
+        try:
+            first = await asyncio.gather(*(server.predict("bpd", row) for row in rows))
+            # Repeated inputs are answered from the cache
+            second = await asyncio.gather(*(server.predict("bpd", row) for row in rows[:10]))
+            return first, second
+        finally:
+            server.close()
+
+    first, second = asyncio.run(run())
+    expected = tree.predict_batch(rows).tolist()
+    assert first == expected and second == expected[:10]
+    assert served.batches == 3
+    assert served.stats()["cache_hits"] == 10
+
+
+def test_a_failing_input_does_not_fail_its_batch():
+    def predict_fn(examples):
+        if "bad" in examples:
+            raise RuntimeError("cannot score")
+        return [len(example) for example in examples]
+
+    registry = ModelRegistry()
+    served = registry.register("lengths", predict_fn, max_batch_size=8, max_latency_ms=50)
+
+    async def run():
+        server = PredictionServer(registry)
+        try:
+            return await asyncio.gather(*(server.predict("lengths", example) for example in ["a", "bad", "abc"]),
+                                        return_exceptions=True)
+        finally:
+            server.close()
+
+    good, bad, other = asyncio.run(run())
+    assert (good, other) == (1, 3)
+    assert isinstance(bad, RuntimeError)
+    assert served.failed_batches == 1
+
+
+def test_invalid_inputs_are_refused_before_batching():
+    registry = ModelRegistry()
+    served = registry.register_model("bpd", make_tree())
+
+    async def run():
+        server = PredictionServer(registry)
+        try:
+            await server.predict_many("bpd", [queries(1)[0], ["a", "b", "c", "d"]])
+        finally:
+            server.close()
+
+    with pytest.raises(InvalidInputError):
+        asyncio.run(run())
+    assert served.batches == 0
+
+
+def test_saved_model_on_a_process_pool(tmp_path):
+    tree = make_tree()
+    tree.save(str(tmp_path / "tree"))
+    registry = ModelRegistry()
+    registry.register_saved("bpd", str(tmp_path / "tree"), executor="process")
+    rows = queries(6)
+    responses = serve(registry, [("POST", "/models/bpd/predict", json.dumps({"inputs": rows}).encode())],
+                      n_processes=1)
+    assert responses == [(200, {"predictions": tree.predict_batch(rows).tolist()})]
@@ -0,0 +1,44 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+# Packages whose public names only need the dependencies installed for the tests
+PACKAGES = ["mathematical_concepts", "model_concepts"]
+
+
+def loaded_modules(code):
+    # Modules of the repository and NumPy loaded in a fresh interpreter after running code
+    script = code + "; import sys, json; print(json.dumps(sorted(sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True).stdout
+    return {name for name in json.loads(output) if name.split(".")[0] in PACKAGES + ["numpy"]}
+
+
+@pytest.mark.parametrize("package", PACKAGES)
+def test_importing_a_package_loads_none_of_its_modules(package):
+    assert loaded_modules("import " + package) == {package}
+
+
+def test_a_public_name_only_loads_its_own_module():
+    modules = loaded_modules("from model_concepts import KNNIndex")
+    assert "model_concepts.knn.knn_classification" in modules
+    assert not any(name.startswith(("model_concepts.regression_tree", "model_concepts.serving"))
+                   for name in modules)
+
+
+@pytest.mark.parametrize("package", PACKAGES)
+def test_every_public_name_resolves(package):
+    module = importlib.import_module(package)
+    for name in module.__all__:
+        value = getattr(module, name)
+        assert getattr(importlib.import_module(package + "." + module._LAZY_ATTRIBUTES[name]), name) is value
+        # Resolved names are cached on the package
+        assert vars(module)[name] is value
+    assert set(module.__all__) <= set(dir(module))
+    with pytest.raises(AttributeError):
+        getattr(module, "missing_name")